@@ -11,11 +11,19 @@ Provides agents that can interact with the local computer:
 """
 
 import os
+import re
 import sys
-import json
-import subprocess
+import stat
+import time
+import heapq
+import queue
+import functools
+import atexit
+import threading
 from pathlib import Path
-from datetime import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import ClassVar, Optional
 
 # Add parent path for BasicAgent
 sys.path.insert(0, str(Path(__file__).parent.parent.parent))
@@ -25,19 +33,317 @@ try:
 except:
     RAPP_HOME = Path.home() / ".rapp"
 
+try:
+    from rapp_os.cache import LocalIndex
+except ImportError:
+    LocalIndex = None  # Standalone use: list directories without the index
+
+# Platform never changes at runtime; checked once instead of per call
+_IS_MACOS = sys.platform == "darwin"
+
+# macOS tools by absolute path. Together with close_fds=False (safe, since
+# Python fds are non-inheritable by default) this lets subprocess launch them
+# with posix_spawn rather than fork/exec, which is slow from large processes.
+_OPEN = "/usr/bin/open"
+_OSASCRIPT = "/usr/bin/osascript"
+_OSACOMPILE = "/usr/bin/osacompile"
+_PBCOPY = "/usr/bin/pbcopy"
+_PBPASTE = "/usr/bin/pbpaste"
+_SHORTCUTS = "/usr/bin/shortcuts"
+
+# Marker echoed by the coprocess after each statement so we know the reply is complete
+_SENTINEL = "__RAPP_END__"
+# AppleScript errors are reported on their own line as "[<range>:] [execution
+# ]error: <message> (<number>)", possibly after an interactive "?" prompt.
+# Anchored so a result echoed back (prefixed "=> ") that happens to end in
+# "error (12)" is not mistaken for one.
+_ERROR_RE = re.compile(r"^[?\s]*(?:\d+:\d+:\s*)?(?:execution |syntax )?error: .*\((-?\d+)\)\s*$")
+
+# Separators for batched list reads (U+241F / U+241E, unlikely in chat names)
+_FIELD_SEP = "\u241f"
+_COLUMN_SEP = "\u241e"
+# Frame around a batched result (U+2402 / U+2403), so it can be cut out of
+# whatever the coprocess wraps it in: a prompt, a "=> " echo, or quotes
+_RESULT_START = "\u2402"
+_RESULT_END = "\u2403"
+
+# Compiled AppleScript templates and the directory listing index live here
+CACHE_DIR = RAPP_HOME / "cache"
+
+# AppleScript templates, compiled once to .scpt and run with arguments
+# passed through argv so no user text is ever spliced into script source.
+_SCRIPT_SOURCES = {
+    "notify": (
+        'on run argv\n'
+        '\tdisplay notification (item 2 of argv) with title (item 1 of argv)\n'
+        'end run\n'
+    ),
+    # Takes (recipient, body) pairs, so the iMessage bridge can send a whole
+    # poll's replies in one run
+    "send_imessage": (
+        'on run argv\n'
+        '\ttell application "Messages"\n'
+        '\t\tset targetService to 1st account whose service type = iMessage\n'
+        '\t\trepeat with i from 1 to (count of argv) by 2\n'
+        '\t\t\tsend (item (i + 1) of argv) to participant (item i of argv) of targetService\n'
+        '\t\tend repeat\n'
+        '\tend tell\n'
+        'end run\n'
+    ),
+    # Fetches every chat's id and name in one Apple Event per property,
+    # then joins them into a single string so the result crosses IPC once.
+    "list_chats": (
+        'on run\n'
+        '\tset AppleScript\'s text item delimiters to character id 9247\n'
+        '\ttell application "Messages" to set {rappIds, rappNames} to {id, name} of chats\n'
+        '\treturn (character id 9218) & (rappIds as text) & (character id 9246) & (rappNames as text) & (character id 9219)\n'
+        'end run\n'
+    ),
+}
+_compiled_scripts = set()
+_compile_lock = threading.Lock()
+
+
+def _compiled_script(name: str) -> Path:
+    """
+    Return the path to a compiled template, running osacompile if stale.
+
+    Module-level so the iMessage bridge shares the one CACHE_DIR copy.
+    """
+    compiled = CACHE_DIR / f"{name}.scpt"
+    with _compile_lock:
+        if compiled in _compiled_scripts:
+            return compiled
+
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        source = CACHE_DIR / f"{name}.applescript"
+
+        text = _SCRIPT_SOURCES[name]
+        if not source.exists() or source.read_text() != text:
+            source.write_text(text)
+
+        if not compiled.exists() or compiled.stat().st_mtime < source.stat().st_mtime:
+            import subprocess
+            result = subprocess.run(
+                [_OSACOMPILE, "-o", str(compiled), str(source)],
+                stdin=subprocess.DEVNULL, capture_output=True, text=True, close_fds=False
+            )
+            if result.returncode != 0:
+                raise AppleScriptError(f"osacompile failed: {result.stderr.strip()}")
+
+        _compiled_scripts.add(compiled)
+        return compiled
+
+
+# Characters that must be escaped inside an AppleScript string literal
+_APPLESCRIPT_ESC = str.maketrans({
+    "\\": "\\\\",
+    '"': '\\"',
+    "\n": "\\n",
+    "\r": "\\r",
+})
+
+
+# Inverse of _APPLESCRIPT_ESC, for results echoed back as source literals
+_AS_UNESCAPE = {"\\": "\\", '"': '"', "n": "\n", "r": "\r", "t": "\t"}
+_AS_UNESCAPE_RE = re.compile(r'\\([\\"nrt])')
+
+
+def _as_literal(value: str) -> str:
+    """Quote a Python string as an AppleScript string literal."""
+    return '"' + value.translate(_APPLESCRIPT_ESC) + '"'
+
+
+def _framed_result(output: str) -> Optional[str]:
+    """
+    Cut a _RESULT_START/_RESULT_END framed result out of osascript output.
+
+    Anything around the frame (prompt, "=> " echo, other lines) is ignored.
+    If the value was echoed as a quoted AppleScript literal, its escapes are
+    undone. Returns None when no complete frame is present.
+    """
+    start = output.find(_RESULT_START)
+    end = output.rfind(_RESULT_END)
+    if start < 0 or end < start:
+        return None
+    result = output[start + 1:end]
+    if output[start - 1:start] == '"':
+        result = _AS_UNESCAPE_RE.sub(lambda m: _AS_UNESCAPE[m.group(1)], result)
+    return result
+
+
+@functools.lru_cache(maxsize=None)
+def _run_script_prefix(path: Path) -> str:
+    """`run script` clause for a compiled template; only the arguments vary per call."""
+    return f"run script (POSIX file {_as_literal(str(path))})"
+
+
+class AppleScriptError(Exception):
+    """Raised when a statement sent to osascript fails."""
+    pass
+
+
+class _AppleScriptDaemon:
+    """
+    Long-lived `osascript -i` coprocess.
+
+    Spawning osascript costs a fork/exec plus an AppleScript compiler start-up
+    on every call. Keeping one interactive process around amortizes that cost;
+    statements are piped in on stdin, each followed by a sentinel we wait for.
+    Every line must be a complete statement.
+    """
+
+    def __init__(self, timeout: float = 10):
+        self.timeout = timeout
+        self._proc = None
+        self._lines = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        if self._proc is None or self._proc.poll() is not None:
+            import subprocess
+            self._proc = subprocess.Popen(
+                [_OSASCRIPT, "-i"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+                bufsize=1,
+                close_fds=False
+            )
+            self._lines = queue.Queue()
+            threading.Thread(
+                target=self._pump, args=(self._proc, self._lines), daemon=True
+            ).start()
+        return self._proc
+
+    @staticmethod
+    def _pump(proc, lines):
+        """Forward coprocess output lines to the queue (None on EOF)."""
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def run(self, statement: str) -> str:
+        """
+        Run one AppleScript statement and return its output.
+
+        Raises OSError if the coprocess could not be started or written to,
+        and AppleScriptError if the statement itself failed.
+        """
+        with self._lock:
+            proc = self._ensure_started()
+            try:
+                proc.stdin.write(f'{statement}\nreturn "{_SENTINEL}"\n')
+                proc.stdin.flush()
+            except OSError:
+                self._kill()
+                raise
+
+            # The statement has been delivered from here on, so failures are
+            # reported as AppleScriptError rather than retried elsewhere.
+            output = []
+            while True:
+                try:
+                    line = self._lines.get(timeout=self.timeout)
+                except queue.Empty:
+                    self._kill()
+                    raise AppleScriptError("osascript timed out")
+                if line is None:
+                    self._proc = None
+                    raise AppleScriptError("osascript exited unexpectedly")
+                if _SENTINEL in line:
+                    break
+                output.append(line)
+
+        for line in output:
+            if _ERROR_RE.search(line):
+                raise AppleScriptError(line.strip())
+        return "".join(output).strip()
+
+    def _kill(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc = None
+
+    def close(self):
+        """Terminate the coprocess."""
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+        self._proc = None
+
+
+# Shared by every SystemAgent instance
+_applescript_daemon = _AppleScriptDaemon()
+
+
+def _cached(ttl_by_action, invalidates=None, maxsize=128):
+    """
+    Memoize perform() results per (action, kwargs) for a per-action TTL.
+
+    Actions without a TTL are never cached. `invalidates` maps a mutating
+    action to the cached actions it makes stale.
+    """
+    invalidates = invalidates or {}
+
+    def decorator(perform):
+        @functools.wraps(perform)
+        def wrapper(self, **kwargs):
+            action = kwargs.get("action")
+            cache = self._result_cache
+
+            stale = invalidates.get(action)
+            if stale:
+                with self._cache_lock:
+                    for key in [k for k in cache if k[0] in stale]:
+                        del cache[key]
+
+            ttl = ttl_by_action.get(action)
+            if not ttl:
+                return perform(self, **kwargs)
+            try:
+                key = (action, frozenset(kwargs.items()))
+                hash(key)
+            except TypeError:
+                return perform(self, **kwargs)  # Unhashable arguments
+
+            now = time.monotonic()
+            with self._cache_lock:
+                hit = cache.get(key)
+                if hit is not None and hit[0] > now:
+                    cache.move_to_end(key)
+                    return hit[1]
+
+            result = perform(self, **kwargs)
+
+            with self._cache_lock:
+                cache[key] = (now + ttl, result)
+                cache.move_to_end(key)
+                while len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return result
+        return wrapper
+    return decorator
+
 
 class BasicAgent:
     """Base agent class (inline for standalone use)."""
     def __init__(self, name, metadata):
         self.name = name
         self.metadata = metadata
+        # Backing store for @_cached perform() results
+        self._result_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        # Metadata is fixed at construction, so build the tool schema once
+        self._function_def = {
+            "name": metadata.get("name", name),
+            "description": metadata.get("description", ""),
+            "parameters": metadata.get("parameters", {"type": "object", "properties": {}})
+        }
 
     def get_function_definition(self):
-        return {
-            "name": self.metadata.get("name", self.name),
-            "description": self.metadata.get("description", ""),
-            "parameters": self.metadata.get("parameters", {"type": "object", "properties": {}})
-        }
+        return self._function_def
 
 
 class SystemAgent(BasicAgent):
@@ -47,59 +353,170 @@ class SystemAgent(BasicAgent):
     macOS focused with fallbacks for other platforms.
     """
 
-    def __init__(self):
-        self.name = "System"
-        self.metadata = {
-            "name": self.name,
-            "description": "Interact with the local computer - open apps, send notifications, manage clipboard, send iMessages",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "action": {
-                        "type": "string",
-                        "description": "Action: 'open_app', 'notify', 'clipboard_read', 'clipboard_write', 'send_imessage', 'run_shortcut', 'get_info'",
-                        "enum": ["open_app", "notify", "clipboard_read", "clipboard_write", "send_imessage", "run_shortcut", "get_info"]
-                    },
-                    "app_name": {"type": "string", "description": "Application name to open"},
-                    "title": {"type": "string", "description": "Notification title"},
-                    "message": {"type": "string", "description": "Notification message or iMessage text"},
-                    "text": {"type": "string", "description": "Text for clipboard write"},
-                    "recipient": {"type": "string", "description": "Phone number or email for iMessage"},
-                    "shortcut_name": {"type": "string", "description": "Shortcuts app shortcut name"}
+    name = "System"
+
+    # Shared by every instance; treat as read-only
+    _METADATA: ClassVar[dict] = {
+        "name": name,
+        "description": "Interact with the local computer - open apps, send notifications, manage clipboard, send iMessages",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "description": "Action: 'open_app', 'notify', 'clipboard_read', 'clipboard_write', 'send_imessage', 'list_chats', 'run_shortcut', 'get_info'",
+                    "enum": [sys.intern(a) for a in (
+                        "open_app", "notify", "clipboard_read", "clipboard_write",
+                        "send_imessage", "list_chats", "run_shortcut", "get_info"
+                    )]
                 },
-                "required": ["action"]
-            }
+                "app_name": {"type": "string", "description": "Application name to open"},
+                "title": {"type": "string", "description": "Notification title"},
+                "message": {"type": "string", "description": "Notification message or iMessage text"},
+                "text": {"type": "string", "description": "Text for clipboard write"},
+                "recipient": {"type": "string", "description": "Phone number or email for iMessage"},
+                "shortcut_name": {"type": "string", "description": "Shortcuts app shortcut name"}
+            },
+            "required": ["action"]
         }
-        super().__init__(self.name, self.metadata)
+    }
 
+    def __init__(self):
+        super().__init__(self.name, self._METADATA)
+        self._daemon = _applescript_daemon
+        self._batch_state = threading.local()
+
+    def _compiled_script(self, name: str) -> Path:
+        """Return the path to a compiled template, running osacompile if stale."""
+        return _compiled_script(name)
+
+    def _script_statement(self, name: str, args) -> str:
+        """One-line coprocess statement running a compiled template."""
+        statement = _run_script_prefix(self._compiled_script(name))
+        if args:
+            statement += " with parameters {" + ", ".join(_as_literal(a) for a in args) + "}"
+        return statement
+
+    def _run_script_argv(self, name: str, args) -> str:
+        """Run a compiled template with a one-shot `osascript script.scpt arg...`."""
+        import subprocess
+        result = subprocess.run(
+            [_OSASCRIPT, str(self._compiled_script(name)), *args],
+            stdin=subprocess.DEVNULL, capture_output=True, text=True, close_fds=False
+        )
+        if result.returncode != 0:
+            raise AppleScriptError(result.stderr.strip())
+        return result.stdout.strip()
+
+    def _run_script(self, name: str, *args: str) -> str:
+        """
+        Run a compiled template with the given arguments.
+
+        Uses the shared coprocess when available, otherwise a one-shot
+        `osascript script.scpt arg...` with the arguments passed as argv.
+        """
+        statement = self._script_statement(name, args)
+        try:
+            return self._daemon.run(statement)
+        except OSError:
+            return self._run_script_argv(name, args)
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue notifications and iMessages sent inside the block and deliver
+        them together in a single coprocess round trip when it exits.
+
+        Calls inside the block only report "queued". Delivery happens when
+        the outermost batch exits, so that is where failures surface: the
+        `with` statement raises AppleScriptError if any queued script failed,
+        after every one has been attempted. Nested batches flush with the
+        outermost one. If a block raises, the scripts queued inside it are
+        discarded. Batches are per thread.
+        """
+        state = self._batch_state
+        depth = getattr(state, "depth", 0)
+        if depth == 0:
+            state.pending = []
+        mark = len(state.pending)
+        state.depth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            del state.pending[mark:]
+            raise
+        finally:
+            state.depth -= 1
+            if state.depth == 0:
+                pending, state.pending = state.pending, None
+                if pending:
+                    self._flush_batch(pending)
+
+    def _queue_script(self, name: str, *args: str) -> bool:
+        """Queue a template run if a batch is open on this thread."""
+        if getattr(self._batch_state, "depth", 0):
+            self._batch_state.pending.append((name, args))
+            return True
+        return False
+
+    def _flush_batch(self, pending):
+        """
+        Run queued templates, one statement per line, in one round trip.
+
+        Without the coprocess each template runs on its own; all of them are
+        tried and the failures reported together in one AppleScriptError.
+        """
+        statements = "\n".join(self._script_statement(name, args) for name, args in pending)
+        try:
+            self._daemon.run(statements)
+            return
+        except OSError:
+            pass
+
+        errors = []
+        for name, args in pending:
+            try:
+                self._run_script_argv(name, args)
+            except (AppleScriptError, OSError) as e:
+                errors.append(f"{name}: {e}")
+        if errors:
+            raise AppleScriptError(
+                f"{len(errors)} of {len(pending)} batched scripts failed: " + "; ".join(errors)
+            )
+
+    # action -> handler(self, kwargs), built once at class definition
+    _ACTIONS = {
+        "open_app": lambda self, kw: self._open_app(kw.get("app_name", "")),
+        "notify": lambda self, kw: self._send_notification(kw.get("title", "RAPP"), kw.get("message", "")),
+        "clipboard_read": lambda self, kw: self._clipboard_read(),
+        "clipboard_write": lambda self, kw: self._clipboard_write(kw.get("text", "")),
+        "send_imessage": lambda self, kw: self._send_imessage(kw.get("recipient", ""), kw.get("message", "")),
+        "list_chats": lambda self, kw: self._list_chats(),
+        "run_shortcut": lambda self, kw: self._run_shortcut(kw.get("shortcut_name", "")),
+        "get_info": lambda self, kw: self._get_system_info(),
+    }
+
+    @_cached(
+        ttl_by_action={"clipboard_read": 1, "list_chats": 5},
+        invalidates={"clipboard_write": {"clipboard_read"}, "send_imessage": {"list_chats"}}
+    )
     def perform(self, **kwargs) -> str:
         action = kwargs.get("action")
 
-        if action == "open_app":
-            return self._open_app(kwargs.get("app_name", ""))
-        elif action == "notify":
-            return self._send_notification(kwargs.get("title", "RAPP"), kwargs.get("message", ""))
-        elif action == "clipboard_read":
-            return self._clipboard_read()
-        elif action == "clipboard_write":
-            return self._clipboard_write(kwargs.get("text", ""))
-        elif action == "send_imessage":
-            return self._send_imessage(kwargs.get("recipient", ""), kwargs.get("message", ""))
-        elif action == "run_shortcut":
-            return self._run_shortcut(kwargs.get("shortcut_name", ""))
-        elif action == "get_info":
-            return self._get_system_info()
-        else:
+        handler = self._ACTIONS.get(action)
+        if handler is None:
             return f"Unknown action: {action}"
+        return handler(self, kwargs)
 
     def _open_app(self, app_name: str) -> str:
         """Open an application."""
         if not app_name:
             return "Error: app_name required"
 
-        if sys.platform == "darwin":
+        if _IS_MACOS:
+            import subprocess
             try:
-                subprocess.run(["open", "-a", app_name], check=True)
+                subprocess.run([_OPEN, "-a", app_name], stdin=subprocess.DEVNULL, check=True, close_fds=False)
                 return f"Opened {app_name}"
             except subprocess.CalledProcessError:
                 return f"Could not open {app_name}"
@@ -108,18 +525,26 @@ class SystemAgent(BasicAgent):
 
     def _send_notification(self, title: str, message: str) -> str:
         """Send a system notification."""
-        if sys.platform == "darwin":
-            script = f'display notification "{message}" with title "{title}"'
-            subprocess.run(["osascript", "-e", script])
+        if _IS_MACOS:
+            if self._queue_script("notify", title, message):
+                return f"Notification queued: {title}"
+            try:
+                self._run_script("notify", title, message)
+            except AppleScriptError:
+                pass
             return f"Notification sent: {title}"
         else:
             return "Notifications only supported on macOS"
 
     def _clipboard_read(self) -> str:
         """Read from clipboard."""
-        if sys.platform == "darwin":
-            result = subprocess.run(["pbpaste"], capture_output=True, text=True)
-            content = result.stdout[:1000]  # Limit length
+        if _IS_MACOS:
+            pasteboard = _pasteboard()
+            if pasteboard:
+                pb, string_type = pasteboard
+                content = (pb.stringForType_(string_type) or "")[:1000]  # Limit length
+            else:
+                content = _read_prefix([_PBPASTE], 1000)  # Limit length
             return f"Clipboard contents:\n{content}"
         else:
             return "Clipboard read only supported on macOS"
@@ -129,8 +554,15 @@ class SystemAgent(BasicAgent):
         if not text:
             return "Error: text required"
 
-        if sys.platform == "darwin":
-            subprocess.run(["pbcopy"], input=text.encode(), check=True)
+        if _IS_MACOS:
+            pasteboard = _pasteboard()
+            if pasteboard:
+                pb, string_type = pasteboard
+                pb.clearContents()
+                pb.setString_forType_(text, string_type)
+            else:
+                import subprocess
+                subprocess.run([_PBCOPY], input=text.encode(), check=True, close_fds=False)
             return f"Copied to clipboard: {text[:50]}..."
         else:
             return "Clipboard write only supported on macOS"
@@ -140,41 +572,63 @@ class SystemAgent(BasicAgent):
         if not recipient or not message:
             return "Error: recipient and message required"
 
-        if sys.platform != "darwin":
+        if not _IS_MACOS:
             return "iMessage only available on macOS"
 
-        # Escape for AppleScript
-        message = message.replace('"', '\\"')
-        recipient = recipient.replace('"', '\\"')
-
-        script = f'''
-        tell application "Messages"
-            set targetService to 1st account whose service type = iMessage
-            set targetBuddy to participant "{recipient}" of targetService
-            send "{message}" to targetBuddy
-        end tell
-        '''
+        if self._queue_script("send_imessage", recipient, message):
+            return f"iMessage queued for {recipient}"
 
         try:
-            subprocess.run(["osascript", "-e", script], check=True, capture_output=True)
+            self._run_script("send_imessage", recipient, message)
             return f"iMessage sent to {recipient}"
-        except subprocess.CalledProcessError as e:
+        except AppleScriptError as e:
             return f"Failed to send iMessage: {e}"
 
+    def _list_chats(self) -> str:
+        """List Messages chats using a single batched AppleScript read."""
+        if not _IS_MACOS:
+            return "iMessage only available on macOS"
+
+        try:
+            output = self._run_script("list_chats")
+        except AppleScriptError as e:
+            return f"Failed to list chats: {e}"
+
+        result = _framed_result(output)
+        if result is None:
+            return "Failed to list chats: unexpected osascript output"
+
+        ids, _, names = result.partition(_COLUMN_SEP)
+        ids = ids.split(_FIELD_SEP) if ids else []
+        names = names.split(_FIELD_SEP) if names else []
+
+        lines = []
+        for chat_id, name in list(zip(ids, names))[:50]:  # Limit
+            if name == "missing value":
+                name = ""
+            lines.append(f"{name or chat_id} ({chat_id})")
+
+        if not lines:
+            return "No chats found"
+        return "Chats:\n" + "\n".join(lines)
+
     def _run_shortcut(self, name: str) -> str:
         """Run a Shortcuts app shortcut."""
         if not name:
             return "Error: shortcut_name required"
 
-        if sys.platform != "darwin":
+        if not _IS_MACOS:
             return "Shortcuts only available on macOS"
 
+        import subprocess
         try:
             result = subprocess.run(
-                ["shortcuts", "run", name],
+                [_SHORTCUTS, "run", name],
+                stdin=subprocess.DEVNULL,
                 capture_output=True,
                 text=True,
-                timeout=30
+                timeout=30,
+                close_fds=False
             )
             if result.returncode == 0:
                 return f"Ran shortcut: {name}\nOutput: {result.stdout[:500]}"
@@ -187,48 +641,176 @@ class SystemAgent(BasicAgent):
 
     def _get_system_info(self) -> str:
         """Get basic system information."""
-        info = {
-            "platform": sys.platform,
-            "python": sys.version.split()[0],
-            "user": os.getenv("USER", "unknown"),
-            "home": str(Path.home()),
-            "rapp_home": str(RAPP_HOME),
-            "time": datetime.now().isoformat()
-        }
+        # Cached per second of monotonic time; only "time" could change within that
+        return _system_info_json(int(time.monotonic()))
+
+
+def _read_prefix(cmd, limit: int) -> str:
+    """Read at most `limit` characters of a command's stdout, then stop it."""
+    import subprocess
+    proc = subprocess.Popen(
+        cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+        text=True, close_fds=False
+    )
+    try:
+        return proc.stdout.read(limit)
+    finally:
+        proc.stdout.close()
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+
+
+@functools.lru_cache(maxsize=1)
+def _pasteboard():
+    """
+    General NSPasteboard and its string type via PyObjC, or None.
+
+    Talking to the pasteboard in-process avoids forking pbcopy/pbpaste;
+    without PyObjC installed callers fall back to those tools.
+    """
+    try:
+        from AppKit import NSPasteboard, NSPasteboardTypeString
+    except ImportError:
+        return None
+    return NSPasteboard.generalPasteboard(), NSPasteboardTypeString
+
+
+@functools.lru_cache(maxsize=1)
+def _macos_version() -> str:
+    """macOS product version (fixed for the life of the process)."""
+    import platform
+
+    # Read from SystemVersion.plist in-process rather than forking sw_vers
+    return platform.mac_ver()[0]
+
+
+@functools.lru_cache(maxsize=1)
+def _system_info_json(tick: int) -> str:
+    """Serialized system info for one monotonic-clock second."""
+    import json
+    from datetime import datetime
+
+    info = {
+        "platform": sys.platform,
+        "python": sys.version.split()[0],
+        "user": os.getenv("USER", "unknown"),
+        "home": str(Path.home()),
+        "rapp_home": str(RAPP_HOME),
+        "time": datetime.now().isoformat()
+    }
+
+    if _IS_MACOS:
+        try:
+            info["macos_version"] = _macos_version()
+        except:
+            pass
 
-        if sys.platform == "darwin":
+    return json.dumps(info, indent=2)
+
+
+# Writes larger than this are encoded and written in chunks via os.writev
+_LARGE_WRITE = 256 * 1024
+_WRITE_CHUNK = 64 * 1024
+_WRITEV_GROUP = 16
+
+
+def _write_chunked(path: Path, content: str):
+    """
+    Write text without building one contiguous encoded copy of it.
+
+    Slices are encoded 64K characters at a time and handed to the kernel
+    in groups with os.writev, so peak extra memory stays around 1MB.
+    """
+    import locale
+
+    encoding = locale.getpreferredencoding(False)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666)
+    try:
+        for start in range(0, len(content), _WRITE_CHUNK * _WRITEV_GROUP):
+            buffers = [
+                memoryview(content[i:i + _WRITE_CHUNK].encode(encoding))
+                for i in range(start, min(start + _WRITE_CHUNK * _WRITEV_GROUP, len(content)), _WRITE_CHUNK)
+            ]
+            while buffers:
+                written = os.writev(fd, buffers)
+                # Drop fully written buffers and trim a partially written one
+                while buffers and written >= len(buffers[0]):
+                    written -= len(buffers[0])
+                    buffers.pop(0)
+                if buffers and written:
+                    buffers[0] = buffers[0][written:]
+    finally:
+        os.close(fd)
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def _open_index():
+    """Shared LocalIndex for the current cache directory, or None if unavailable."""
+    if LocalIndex is None:
+        return None
+    db_path = CACHE_DIR / "index.db"
+    with _index_lock:
+        if db_path not in _indexes:
             try:
-                result = subprocess.run(["sw_vers", "-productVersion"], capture_output=True, text=True)
-                info["macos_version"] = result.stdout.strip()
-            except:
-                pass
+                _indexes[db_path] = LocalIndex(db_path)
+            except Exception:
+                _indexes[db_path] = None
+        return _indexes[db_path]
 
-        return json.dumps(info, indent=2)
+
+def _stat(path: Path):
+    """os.stat the path once, returning None if it does not exist."""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
 
 
 class FileAgent(BasicAgent):
     """Agent for file system operations."""
 
-    def __init__(self):
-        self.name = "Files"
-        self.metadata = {
-            "name": self.name,
-            "description": "Read, write, and manage files on the local system",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "action": {
-                        "type": "string",
-                        "enum": ["read", "write", "list", "exists", "delete"]
-                    },
-                    "path": {"type": "string", "description": "File or directory path"},
-                    "content": {"type": "string", "description": "Content to write"}
+    name = "Files"
+
+    # Shared by every instance; treat as read-only
+    _METADATA: ClassVar[dict] = {
+        "name": name,
+        "description": "Read, write, and manage files on the local system",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "action": {
+                    "type": "string",
+                    "enum": [sys.intern(a) for a in ("read", "write", "list", "exists", "delete")]
                 },
-                "required": ["action", "path"]
-            }
+                "path": {"type": "string", "description": "File or directory path"},
+                "content": {"type": "string", "description": "Content to write"}
+            },
+            "required": ["action", "path"]
         }
-        super().__init__(self.name, self.metadata)
+    }
 
+    def __init__(self):
+        super().__init__(self.name, self._METADATA)
+        # Home does not move while we run; resolve it once for the access check
+        self._home = str(Path.home().resolve())
+        self._home_prefix = self._home.rstrip(os.sep) + os.sep
+        self._index = _open_index()
+
+    # action -> handler(self, path, kwargs), built once at class definition
+    _ACTIONS = {
+        "read": lambda self, path, kw: self._read_file(path),
+        "write": lambda self, path, kw: self._write_file(path, kw.get("content", "")),
+        "list": lambda self, path, kw: self._list_dir(path),
+        "exists": lambda self, path, kw: f"Exists: {_stat(path) is not None}",
+        "delete": lambda self, path, kw: self._delete_file(path),
+    }
+
+    # Not @_cached: files change outside the agent. Listings come from the
+    # mtime-checked index, and a read is one stat plus a bounded read.
     def perform(self, **kwargs) -> str:
         action = kwargs.get("action")
         path = kwargs.get("path", "")
@@ -240,32 +822,24 @@ class FileAgent(BasicAgent):
         path = Path(path).expanduser().resolve()
 
         # Security: only allow access within home directory
-        home = Path.home()
-        try:
-            path.relative_to(home)
-        except ValueError:
+        resolved = str(path)
+        if resolved != self._home and not resolved.startswith(self._home_prefix):
             return f"Error: Access denied outside home directory"
 
-        if action == "read":
-            return self._read_file(path)
-        elif action == "write":
-            return self._write_file(path, kwargs.get("content", ""))
-        elif action == "list":
-            return self._list_dir(path)
-        elif action == "exists":
-            return f"Exists: {path.exists()}"
-        elif action == "delete":
-            return self._delete_file(path)
-        else:
+        handler = self._ACTIONS.get(action)
+        if handler is None:
             return f"Unknown action: {action}"
+        return handler(self, path, kwargs)
 
     def _read_file(self, path: Path) -> str:
-        if not path.exists():
+        st = _stat(path)
+        if st is None:
             return f"File not found: {path}"
-        if not path.is_file():
+        if not stat.S_ISREG(st.st_mode):
             return f"Not a file: {path}"
         try:
-            content = path.read_text()[:5000]  # Limit
+            with path.open("r") as f:
+                content = f.read(5000)  # Limit
             return f"Contents of {path.name}:\n{content}"
         except Exception as e:
             return f"Error reading file: {e}"
@@ -275,32 +849,60 @@ class FileAgent(BasicAgent):
             return "Error: content required"
         try:
             path.parent.mkdir(parents=True, exist_ok=True)
-            path.write_text(content)
+            if len(content) > _LARGE_WRITE and hasattr(os, "writev"):
+                _write_chunked(path, content)
+            else:
+                path.write_text(content)
+            self._invalidate(path.parent)
             return f"Written to {path}"
         except Exception as e:
             return f"Error writing file: {e}"
 
     def _list_dir(self, path: Path) -> str:
-        if not path.exists():
+        st = _stat(path)
+        if st is None:
             return f"Directory not found: {path}"
-        if not path.is_dir():
+        if not stat.S_ISDIR(st.st_mode):
             return f"Not a directory: {path}"
         try:
-            items = list(path.iterdir())[:50]  # Limit
+            entries = self._scan_dir(path, st.st_mtime_ns)
             listing = "\n".join(
-                f"{'[DIR]' if p.is_dir() else '[FILE]'} {p.name}"
-                for p in sorted(items)
+                f"{'[DIR]' if is_dir else '[FILE]'} {name}"
+                for name, is_dir in entries
             )
             return f"Contents of {path}:\n{listing}"
         except Exception as e:
             return f"Error listing directory: {e}"
 
+    def _scan_dir(self, path: Path, mtime_ns: int):
+        """First 50 (name, is_dir) entries, from the index while it is current."""
+        if self._index is None:
+            # Keep only the first 50 names without materializing the whole directory
+            with os.scandir(path) as it:
+                entries = heapq.nsmallest(50, it, key=lambda e: e.name)  # Limit
+            return [(e.name, e.is_dir()) for e in entries]
+
+        entries = self._index.list_dir(str(path), mtime_ns, limit=50)
+        if entries is None:
+            with os.scandir(path) as it:
+                scanned = [(e.name, e.is_dir()) for e in it]
+            self._index.store_dir(str(path), mtime_ns, scanned)
+            entries = heapq.nsmallest(50, scanned)  # Limit
+        return entries
+
+    def _invalidate(self, directory: Path):
+        """Drop a directory's indexed listing after we change it."""
+        if self._index is not None:
+            self._index.invalidate(str(directory))
+
     def _delete_file(self, path: Path) -> str:
-        if not path.exists():
+        st = _stat(path)
+        if st is None:
             return f"File not found: {path}"
         try:
-            if path.is_file():
+            if stat.S_ISREG(st.st_mode):
                 path.unlink()
+                self._invalidate(path.parent)
                 return f"Deleted: {path}"
             else:
                 return "Error: Can only delete files, not directories"
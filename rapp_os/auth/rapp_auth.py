@@ -11,19 +11,43 @@ Similar to GitHub CLI device flow:
 """
 
 import os
-import json
+import sys
 import time
-import uuid
-import hashlib
-import secrets
+import random
 import asyncio
-import aiohttp
+import functools
 from pathlib import Path
-from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple
-from dataclasses import dataclass, asdict
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Optional, Dict, Any, Tuple, Mapping
+from dataclasses import dataclass
 from enum import Enum
 
+# aiohttp (and optional httpx) are imported on first network use, so
+# `rapp status` / `rapp logout` don't pay for loading them.
+if TYPE_CHECKING:
+    import aiohttp
+
+# Optional: orjson parses/serializes credentials several times faster and
+# works in bytes directly; fall back to the stdlib when it isn't installed.
+try:
+    import orjson
+
+    def _dumps(data) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+
+    def _load_file(path: Path):
+        # orjson has no streaming API; parse the raw bytes without a text decode
+        return orjson.loads(path.read_bytes())
+except ImportError:
+    import json
+
+    def _dumps(data) -> bytes:
+        return json.dumps(data, indent=2).encode()
+
+    def _load_file(path: Path):
+        with open(path, "rb") as f:
+            return json.load(f)
+
 
 class RappPlan(Enum):
     """RAPP subscription plans - like Anthropic's Claude tiers"""
@@ -33,7 +57,53 @@ class RappPlan(Enum):
     ENTERPRISE = "enterprise"
 
 
-@dataclass
+# Usage limits by plan
+PLAN_LIMITS = {
+    RappPlan.FREE: {
+        "api_calls_per_day": 100,
+        "agents_per_project": 3,
+        "projects": 2,
+        "storage_mb": 100,
+        "support": "community"
+    },
+    RappPlan.PRO: {
+        "api_calls_per_day": 5000,
+        "agents_per_project": 25,
+        "projects": 20,
+        "storage_mb": 5000,
+        "support": "email"
+    },
+    RappPlan.TEAMS: {
+        "api_calls_per_day": 50000,
+        "agents_per_project": 100,
+        "projects": 100,
+        "storage_mb": 50000,
+        "team_members": 25,
+        "support": "priority"
+    },
+    RappPlan.ENTERPRISE: {
+        "api_calls_per_day": -1,  # Unlimited
+        "agents_per_project": -1,
+        "projects": -1,
+        "storage_mb": -1,
+        "team_members": -1,
+        "support": "dedicated",
+        "sla": True,
+        "custom_deployment": True
+    }
+}
+
+# Attach each plan's limits to the enum member so get_limits() is one
+# attribute load
+for _plan, _limits in PLAN_LIMITS.items():
+    _plan._limits = _limits
+del _plan, _limits
+
+# __slots__ drops the per-instance __dict__; dataclass only supports it on 3.10+
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_SLOTS)
 class RappUser:
     """RAPP user account"""
     user_id: str
@@ -44,47 +114,14 @@ class RappUser:
     api_key: Optional[str] = None
     created_at: Optional[str] = None
 
-    # Usage limits by plan
-    PLAN_LIMITS = {
-        RappPlan.FREE: {
-            "api_calls_per_day": 100,
-            "agents_per_project": 3,
-            "projects": 2,
-            "storage_mb": 100,
-            "support": "community"
-        },
-        RappPlan.PRO: {
-            "api_calls_per_day": 5000,
-            "agents_per_project": 25,
-            "projects": 20,
-            "storage_mb": 5000,
-            "support": "email"
-        },
-        RappPlan.TEAMS: {
-            "api_calls_per_day": 50000,
-            "agents_per_project": 100,
-            "projects": 100,
-            "storage_mb": 50000,
-            "team_members": 25,
-            "support": "priority"
-        },
-        RappPlan.ENTERPRISE: {
-            "api_calls_per_day": -1,  # Unlimited
-            "agents_per_project": -1,
-            "projects": -1,
-            "storage_mb": -1,
-            "team_members": -1,
-            "support": "dedicated",
-            "sla": True,
-            "custom_deployment": True
-        }
-    }
+    # Shared with RappPlan; kept for introspection
+    PLAN_LIMITS = PLAN_LIMITS
 
     def get_limits(self) -> Dict[str, Any]:
-        return self.PLAN_LIMITS.get(self.plan, self.PLAN_LIMITS[RappPlan.FREE])
+        return self.plan._limits
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class DeviceCodeResponse:
     """Response from device code request"""
     device_code: str
@@ -95,7 +132,7 @@ class DeviceCodeResponse:
     interval: int
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class TokenResponse:
     """Response from token exchange"""
     access_token: str
@@ -122,21 +159,53 @@ class RappAuthConfig:
     CLIENT_ID = "rapp-desktop-client"
     SCOPE = "openid profile email rapp:read rapp:write"
 
+    # Constant parts of the form bodies (aiohttp does not mutate them)
+    DEVICE_CODE_PAYLOAD = {"client_id": CLIENT_ID, "scope": SCOPE}
+    DEVICE_TOKEN_PAYLOAD = {
+        "client_id": CLIENT_ID,
+        "grant_type": "urn:ietf:params:oauth:grant-type:device_code"
+    }
+    REFRESH_PAYLOAD = {"client_id": CLIENT_ID, "grant_type": "refresh_token"}
+
     # Token storage
     TOKEN_DIR = Path.home() / ".rapp" / "auth"
     TOKEN_FILE = TOKEN_DIR / "credentials.json"
 
+    # Environment is read once at import; endpoints for it are built here
+    _IS_DEV = os.environ.get("RAPP_ENV", "production") == "development"
+    AUTH_URL = DEV_AUTH_BASE_URL if _IS_DEV else AUTH_BASE_URL
+    API_URL = DEV_API_BASE_URL if _IS_DEV else API_BASE_URL
+    DEVICE_CODE_ENDPOINT = f"{AUTH_URL}/device/code"
+    TOKEN_ENDPOINT = f"{AUTH_URL}/oauth/token"
+    USERINFO_ENDPOINT = f"{API_URL}/v1/user"
+
     @classmethod
     def is_development(cls) -> bool:
-        return os.environ.get("RAPP_ENV", "production") == "development"
+        return cls._IS_DEV
 
     @classmethod
     def get_auth_url(cls) -> str:
-        return cls.DEV_AUTH_BASE_URL if cls.is_development() else cls.AUTH_BASE_URL
+        return cls.AUTH_URL
 
     @classmethod
     def get_api_url(cls) -> str:
-        return cls.DEV_API_BASE_URL if cls.is_development() else cls.API_BASE_URL
+        return cls.API_URL
+
+
+# Treat tokens as stale this many seconds before the server-side expiry
+TOKEN_EXPIRY_MARGIN = 60
+
+# Re-warm the API connection during device-flow polling before the
+# connector's 75s keep-alive would drop it
+API_WARM_INTERVAL = 60
+
+_STATIC_HEADERS = (("X-RAPP-Client", "desktop"), ("X-RAPP-Version", "1.0.0"))
+
+
+@functools.lru_cache(maxsize=4)
+def _build_headers(token: str) -> Mapping[str, str]:
+    """Auth headers for a token; tokens change rarely, so the mapping is reused"""
+    return MappingProxyType({"Authorization": f"Bearer {token}", **dict(_STATIC_HEADERS)})
 
 
 class RappAuth:
@@ -161,6 +230,9 @@ class RappAuth:
             # Wait for user to authorize
             token = await auth.poll_for_token(device_code)
             print("Login successful!")
+
+        # Release the shared HTTP session when done (or use `async with RappAuth()`)
+        await auth.close()
     """
 
     def __init__(self):
@@ -168,6 +240,68 @@ class RappAuth:
         self._ensure_auth_dir()
         self._current_user: Optional[RappUser] = None
         self._token: Optional[TokenResponse] = None
+        # Shared HTTP session, created on first request and kept for connection reuse
+        self._session: Optional["aiohttp.ClientSession"] = None
+        # HTTP/2 client for the API host (None until first use, False if unavailable)
+        self._api_client = None
+        # Parsed credentials file, reused while its mtime is unchanged
+        self._creds_mtime: int = 0
+        self._creds_cache: Optional[Tuple[TokenResponse, RappUser]] = None
+        # Until this time the in-memory token is trusted without touching disk
+        self._token_valid_until: float = 0.0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        """Return the shared HTTP session, creating it if needed"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+
+            # Only auth.rapp.ai and api.rapp.ai are ever contacted: a small pool
+            # with cached DNS avoids repeated getaddrinfo calls and caps sockets
+            connector = aiohttp.TCPConnector(
+                limit=20,
+                limit_per_host=10,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True,
+                keepalive_timeout=75
+            )
+            # Per-phase timeouts instead of a total that spans long poll waits
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=None, connect=10, sock_read=30)
+            )
+        return self._session
+
+    def _get_api_client(self):
+        """Return the shared HTTP/2 client for the API host, or None if unavailable"""
+        if self._api_client is None:
+            self._api_client = False
+            # Optional: httpx (with h2) lets API-host requests share one HTTP/2
+            # connection; without it everything goes through aiohttp.
+            try:
+                import httpx
+                self._api_client = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(max_keepalive_connections=10),
+                    timeout=httpx.Timeout(30, connect=10)
+                )
+            except ImportError:
+                pass  # httpx not installed, or installed without the h2 extra
+        return self._api_client or None
+
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        if self._api_client:
+            await self._api_client.aclose()
+        self._api_client = None
 
     def _ensure_auth_dir(self):
         """Create auth directory if it doesn't exist"""
@@ -182,7 +316,7 @@ class RappAuth:
                 "token_type": token.token_type,
                 "expires_in": token.expires_in,
                 "scope": token.scope,
-                "saved_at": datetime.utcnow().isoformat()
+                "saved_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime())
             },
             "user": {
                 "user_id": user.user_id,
@@ -194,17 +328,38 @@ class RappAuth:
             }
         }
 
-        # Secure file permissions
-        self.config.TOKEN_FILE.write_text(json.dumps(data, indent=2))
-        os.chmod(self.config.TOKEN_FILE, 0o600)
+        # Write to a temp file created 0600 and swap it in, so the credentials
+        # are never briefly world-readable or left half-written
+        tmp = self.config.TOKEN_FILE.with_suffix(".tmp")
+        tmp.unlink(missing_ok=True)  # O_EXCL below must create it with our mode
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(_dumps(data))
+            os.replace(tmp, self.config.TOKEN_FILE)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        self._invalidate_credentials()
+        self._token_valid_until = time.time() + token.expires_in - TOKEN_EXPIRY_MARGIN
+
+    def _invalidate_credentials(self):
+        """Drop the cached parse of the credentials file"""
+        self._creds_mtime = 0
+        self._creds_cache = None
 
     def _load_credentials(self) -> Optional[Tuple[TokenResponse, RappUser]]:
         """Load credentials from local file"""
-        if not self.config.TOKEN_FILE.exists():
+        try:
+            mtime = self.config.TOKEN_FILE.stat().st_mtime_ns
+        except OSError:
             return None
 
+        if self._creds_cache is not None and mtime == self._creds_mtime:
+            return self._creds_cache
+
         try:
-            data = json.loads(self.config.TOKEN_FILE.read_text())
+            data = _load_file(self.config.TOKEN_FILE)
 
             token = TokenResponse(
                 access_token=data["token"]["access_token"],
@@ -223,21 +378,27 @@ class RappAuth:
                 api_key=data["user"].get("api_key")
             )
 
-            return token, user
+            self._creds_cache = (token, user)
+            self._creds_mtime = mtime
+            # The file is rewritten whenever a token is issued, so its mtime dates it
+            self._token_valid_until = mtime / 1e9 + token.expires_in - TOKEN_EXPIRY_MARGIN
+            return self._creds_cache
         except Exception:
             return None
 
     def is_authenticated(self) -> bool:
         """Check if user is currently authenticated"""
-        if self._token and self._current_user:
+        if self._token and self._current_user and time.time() < self._token_valid_until:
             return True
 
+        # Cold start or token past its lifetime: pick up credentials from disk,
+        # which another process (desktop app / CLI) may have refreshed
         creds = self._load_credentials()
         if creds:
             self._token, self._current_user = creds
             return True
 
-        return False
+        return bool(self._token and self._current_user)
 
     def get_current_user(self) -> Optional[RappUser]:
         """Get the currently authenticated user"""
@@ -261,32 +422,27 @@ class RappAuth:
         Start the device flow authentication.
         Returns a device code that the user should enter at the verification URL.
         """
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "client_id": self.config.CLIENT_ID,
-                "scope": self.config.SCOPE
-            }
-
-            async with session.post(
-                f"{self.config.get_auth_url()}/device/code",
-                data=payload
-            ) as response:
-                if response.status != 200:
-                    raise AuthError(f"Failed to start device flow: {await response.text()}")
-
-                data = await response.json()
-
-                return DeviceCodeResponse(
-                    device_code=data["device_code"],
-                    user_code=data["user_code"],
-                    verification_uri=data["verification_uri"],
-                    verification_uri_complete=data.get(
-                        "verification_uri_complete",
-                        f"{data['verification_uri']}?user_code={data['user_code']}"
-                    ),
-                    expires_in=data["expires_in"],
-                    interval=data.get("interval", 5)
-                )
+        session = self._get_session()
+        async with session.post(
+            self.config.DEVICE_CODE_ENDPOINT,
+            data=self.config.DEVICE_CODE_PAYLOAD
+        ) as response:
+            if response.status != 200:
+                raise AuthError(f"Failed to start device flow: {await response.text()}")
+
+            data = await response.json()
+
+            return DeviceCodeResponse(
+                device_code=data["device_code"],
+                user_code=data["user_code"],
+                verification_uri=data["verification_uri"],
+                verification_uri_complete=data.get(
+                    "verification_uri_complete",
+                    f"{data['verification_uri']}?user_code={data['user_code']}"
+                ),
+                expires_in=data["expires_in"],
+                interval=data.get("interval", 5)
+            )
 
     async def poll_for_token(
         self,
@@ -306,76 +462,114 @@ class RappAuth:
         Raises:
             AuthError on failure or timeout
         """
-        start_time = time.time()
-        interval = device_code.interval
-
-        async with aiohttp.ClientSession() as session:
-            while time.time() - start_time < device_code.expires_in:
-                payload = {
-                    "client_id": self.config.CLIENT_ID,
-                    "device_code": device_code.device_code,
-                    "grant_type": "urn:ietf:params:oauth:grant-type:device_code"
-                }
-
-                async with session.post(
-                    f"{self.config.get_auth_url()}/oauth/token",
-                    data=payload
-                ) as response:
-                    data = await response.json()
-
-                    if response.status == 200:
-                        # Success! Got the token
-                        token = TokenResponse(
-                            access_token=data["access_token"],
-                            refresh_token=data["refresh_token"],
-                            token_type=data["token_type"],
-                            expires_in=data["expires_in"],
-                            scope=data.get("scope", self.config.SCOPE)
-                        )
-
-                        # Get user info
-                        user = await self._fetch_user_info(token.access_token)
-
-                        # Save credentials
-                        self._save_credentials(token, user)
-                        self._token = token
-                        self._current_user = user
-
-                        return token
-
-                    error = data.get("error")
-
-                    if error == "authorization_pending":
-                        # User hasn't authorized yet, keep polling
-                        if on_pending:
-                            on_pending()
-                        await asyncio.sleep(interval)
-                        continue
-
-                    elif error == "slow_down":
-                        # Rate limited, increase interval
-                        interval += 5
-                        await asyncio.sleep(interval)
-                        continue
-
-                    elif error == "expired_token":
-                        raise AuthError("Device code expired. Please try again.")
-
-                    elif error == "access_denied":
-                        raise AuthError("Authorization denied by user.")
+        # Monotonic, so wall-clock adjustments can't stretch or cut short the wait
+        deadline = time.monotonic() + device_code.expires_in
+        # RFC 8628 default; never poll faster than that even if the server asks to
+        interval = max(device_code.interval, 5)
+
+        # Same request body every poll
+        payload = {
+            **self.config.DEVICE_TOKEN_PAYLOAD,
+            "device_code": device_code.device_code
+        }
 
-                    else:
-                        raise AuthError(f"Authentication failed: {error}")
+        session = self._get_session()
+        warm_after = 0.0
+        warm_task: Optional[asyncio.Task] = None
+        try:
+            now = time.monotonic()
+            while now < deadline:
+                # Keep a connection to the API host open while we wait, so the
+                # user-info fetch after authorization skips DNS/TCP/TLS setup
+                if now >= warm_after:
+                    warm_after = now + API_WARM_INTERVAL
+                    if warm_task is None or warm_task.done():
+                        warm_task = asyncio.ensure_future(self._warm_api_connection())
+
+                async with session.post(self.config.TOKEN_ENDPOINT, data=payload) as response:
+                    status = response.status
+                    data = await response.json()
 
-        raise AuthError("Authentication timed out. Please try again.")
+                # The response is released here, so the keep-alive connection
+                # goes back to the pool while we wait for the next poll.
+                if status == 200:
+                    # Success! Got the token
+                    token = TokenResponse(
+                        access_token=data["access_token"],
+                        refresh_token=data["refresh_token"],
+                        token_type=data["token_type"],
+                        expires_in=data["expires_in"],
+                        scope=data.get("scope", self.config.SCOPE)
+                    )
+
+                    # Get user info
+                    user = await self._fetch_user_info(token.access_token)
+
+                    # Save credentials
+                    self._save_credentials(token, user)
+                    self._token = token
+                    self._current_user = user
+
+                    return token
+
+                error = data.get("error")
+
+                if error == "authorization_pending":
+                    # User hasn't authorized yet, keep polling
+                    if on_pending:
+                        on_pending()
+
+                elif error == "slow_down":
+                    # Rate limited, increase interval
+                    interval += 5
+
+                elif error == "expired_token":
+                    raise AuthError("Device code expired. Please try again.")
+
+                elif error == "access_denied":
+                    raise AuthError("Authorization denied by user.")
+
+                else:
+                    raise AuthError(f"Authentication failed: {error}")
+
+                # Jitter so the desktop app and CLI polling together don't stay in
+                # lockstep; never sleep past the deadline
+                delay = interval + random.uniform(0, interval * 0.2)
+                await asyncio.sleep(min(delay, max(deadline - time.monotonic(), 0)))
+                now = time.monotonic()
+
+            raise AuthError("Authentication timed out. Please try again.")
+        finally:
+            # A warm-up still in flight must not outlive the poll (or the session)
+            if warm_task is not None and not warm_task.done():
+                warm_task.cancel()
+                await asyncio.gather(warm_task, return_exceptions=True)
+
+    async def _warm_api_connection(self):
+        """Open (or refresh) a pooled keep-alive connection to the API host"""
+        try:
+            client = self._get_api_client()
+            if client is not None:
+                await client.head(self.config.API_URL)
+            else:
+                async with self._get_session().head(self.config.API_URL):
+                    pass
+        except Exception:
+            pass  # Best effort; the real request will connect itself
 
     async def _fetch_user_info(self, access_token: str) -> RappUser:
         """Fetch user info from the API"""
-        async with aiohttp.ClientSession() as session:
-            headers = {"Authorization": f"Bearer {access_token}"}
-
-            async with session.get(
-                f"{self.config.get_api_url()}/v1/user",
+        headers = {"Authorization": f"Bearer {access_token}"}
+
+        client = self._get_api_client()
+        if client is not None:
+            response = await client.get(self.config.USERINFO_ENDPOINT, headers=headers)
+            if response.status_code != 200:
+                raise AuthError(f"Failed to fetch user info: {response.text}")
+            data = response.json()
+        else:
+            async with self._get_session().get(
+                self.config.USERINFO_ENDPOINT,
                 headers=headers
             ) as response:
                 if response.status != 200:
@@ -383,59 +577,61 @@ class RappAuth:
 
                 data = await response.json()
 
-                return RappUser(
-                    user_id=data["user_id"],
-                    email=data["email"],
-                    name=data.get("name", data["email"].split("@")[0]),
-                    plan=RappPlan(data.get("plan", "free")),
-                    organization=data.get("organization"),
-                    api_key=data.get("api_key"),
-                    created_at=data.get("created_at")
-                )
+        return RappUser(
+            user_id=data["user_id"],
+            email=data["email"],
+            name=data.get("name", data["email"].split("@")[0]),
+            plan=RappPlan(data.get("plan", "free")),
+            organization=data.get("organization"),
+            api_key=data.get("api_key"),
+            created_at=data.get("created_at")
+        )
 
     async def refresh_token(self) -> TokenResponse:
         """Refresh the access token using the refresh token"""
         if not self._token:
             raise AuthError("No token to refresh. Please login first.")
 
-        async with aiohttp.ClientSession() as session:
-            payload = {
-                "client_id": self.config.CLIENT_ID,
-                "grant_type": "refresh_token",
-                "refresh_token": self._token.refresh_token
-            }
-
-            async with session.post(
-                f"{self.config.get_auth_url()}/oauth/token",
-                data=payload
-            ) as response:
-                if response.status != 200:
-                    # Refresh failed, need to re-authenticate
-                    self.logout()
-                    raise AuthError("Session expired. Please login again.")
-
-                data = await response.json()
+        session = self._get_session()
+        payload = {
+            **self.config.REFRESH_PAYLOAD,
+            "refresh_token": self._token.refresh_token
+        }
 
-                self._token = TokenResponse(
-                    access_token=data["access_token"],
-                    refresh_token=data.get("refresh_token", self._token.refresh_token),
-                    token_type=data["token_type"],
-                    expires_in=data["expires_in"],
-                    scope=data.get("scope", self.config.SCOPE)
-                )
+        async with session.post(
+            self.config.TOKEN_ENDPOINT,
+            data=payload
+        ) as response:
+            if response.status != 200:
+                # Refresh failed, need to re-authenticate
+                self.logout()
+                raise AuthError("Session expired. Please login again.")
+
+            data = await response.json()
+
+            self._token = TokenResponse(
+                access_token=data["access_token"],
+                refresh_token=data.get("refresh_token", self._token.refresh_token),
+                token_type=data["token_type"],
+                expires_in=data["expires_in"],
+                scope=data.get("scope", self.config.SCOPE)
+            )
 
-                # Update stored credentials
-                self._save_credentials(self._token, self._current_user)
+            # Update stored credentials
+            self._save_credentials(self._token, self._current_user)
 
-                return self._token
+            return self._token
 
     def logout(self):
         """Logout and clear stored credentials"""
         if self.config.TOKEN_FILE.exists():
             self.config.TOKEN_FILE.unlink()
 
+        self._invalidate_credentials()
+        self._token_valid_until = 0.0
         self._token = None
         self._current_user = None
+        _build_headers.cache_clear()  # Don't keep bearer tokens around
 
     def get_auth_headers(self) -> Dict[str, str]:
         """Get headers for authenticated API requests"""
@@ -443,11 +639,8 @@ class RappAuth:
         if not token:
             raise AuthError("Not authenticated. Please login first.")
 
-        return {
-            "Authorization": f"Bearer {token}",
-            "X-RAPP-Client": "desktop",
-            "X-RAPP-Version": "1.0.0"
-        }
+        # Copy of the shared per-token mapping, so callers may add to it
+        return dict(_build_headers(token))
 
 
 class AuthError(Exception):
@@ -456,72 +649,78 @@ class AuthError(Exception):
 
 
 # CLI interface
+
+# Clipboard command for this platform (os.name is "posix" on macOS, so key on sys.platform)
+_CLIP_CMD = {
+    'darwin': ['pbcopy'],
+    'win32': ['clip'],
+}.get(sys.platform, ['xclip', '-selection', 'clipboard'])  # Linux
+
+
+def _copy_to_clipboard(text: str):
+    """Copy text to the system clipboard"""
+    import subprocess
+    subprocess.run(_CLIP_CMD, input=text.encode(), check=True)
+
+
 async def login_cli():
     """CLI login flow - similar to `gh auth login`"""
-    auth = RappAuth()
+    async with RappAuth() as auth:
+        if auth.is_authenticated():
+            user = auth.get_current_user()
+            print(f"Already logged in as {user.email} ({user.plan.value} plan)")
+            response = input("Login with a different account? (y/N): ")
+            if response.lower() != 'y':
+                return
+            auth.logout()
 
-    if auth.is_authenticated():
-        user = auth.get_current_user()
-        print(f"Already logged in as {user.email} ({user.plan.value} plan)")
-        response = input("Login with a different account? (y/N): ")
-        if response.lower() != 'y':
-            return
-        auth.logout()
-
-    print("\n🔐 RAPP Authentication")
-    print("=" * 40)
-
-    # Start device flow
-    print("\n⏳ Waiting for authorization...")
-    device_code = await auth.start_device_flow()
-
-    print(f"\n📋 Enter one-time code: {device_code.user_code}")
-    print(f"🌐 at {device_code.verification_uri}")
-    print("\nPress any key to copy to clipboard and open browser...")
-
-    # Copy to clipboard (platform-specific)
-    try:
-        import subprocess
-        if os.name == 'darwin':  # macOS
-            subprocess.run(['pbcopy'], input=device_code.user_code.encode(), check=True)
-        elif os.name == 'nt':  # Windows
-            subprocess.run(['clip'], input=device_code.user_code.encode(), check=True)
-        else:  # Linux
-            subprocess.run(['xclip', '-selection', 'clipboard'], input=device_code.user_code.encode(), check=True)
-    except:
-        pass
-
-    input()
-
-    # Open browser
-    try:
+        print("\n🔐 RAPP Authentication")
+        print("=" * 40)
+
+        # Start device flow
+        print("\n⏳ Waiting for authorization...")
+        device_code = await auth.start_device_flow()
+
+        print(f"\n📋 Enter one-time code: {device_code.user_code}")
+        print(f"🌐 at {device_code.verification_uri}")
+        print("\nPress any key to copy to clipboard and open browser...")
+
+        # Copy to clipboard in a worker thread while we wait for the key press;
+        # skipped when nobody is at a terminal to paste it (CI, piped output)
+        loop = asyncio.get_running_loop()
+        pending = []
+        if sys.stdout.isatty():
+            pending.append(loop.run_in_executor(None, _copy_to_clipboard, device_code.user_code))
+
+        input()
+
+        # Open browser without blocking the event loop
         import webbrowser
-        webbrowser.open(device_code.verification_uri_complete)
-    except:
-        pass
+        pending.append(loop.run_in_executor(None, webbrowser.open, device_code.verification_uri_complete))
+        await asyncio.gather(*pending, return_exceptions=True)
 
-    # Poll for token
-    def on_pending():
-        print(".", end="", flush=True)
+        # Poll for token
+        def on_pending():
+            print(".", end="", flush=True)
 
-    try:
-        await auth.poll_for_token(device_code, on_pending)
-        print("\n")
+        try:
+            await auth.poll_for_token(device_code, on_pending)
+            print("\n")
 
-        user = auth.get_current_user()
-        print(f"✅ Successfully logged in as {user.name} ({user.email})")
-        print(f"📦 Plan: {user.plan.value.upper()}")
-        if user.organization:
-            print(f"🏢 Organization: {user.organization}")
+            user = auth.get_current_user()
+            print(f"✅ Successfully logged in as {user.name} ({user.email})")
+            print(f"📦 Plan: {user.plan.value.upper()}")
+            if user.organization:
+                print(f"🏢 Organization: {user.organization}")
 
-        limits = user.get_limits()
-        print(f"\n📊 Your limits:")
-        print(f"   API calls/day: {limits['api_calls_per_day'] if limits['api_calls_per_day'] > 0 else 'Unlimited'}")
-        print(f"   Projects: {limits['projects'] if limits['projects'] > 0 else 'Unlimited'}")
-        print(f"   Storage: {limits['storage_mb']}MB" if limits['storage_mb'] > 0 else "   Storage: Unlimited")
+            limits = user.get_limits()
+            print(f"\n📊 Your limits:")
+            print(f"   API calls/day: {limits['api_calls_per_day'] if limits['api_calls_per_day'] > 0 else 'Unlimited'}")
+            print(f"   Projects: {limits['projects'] if limits['projects'] > 0 else 'Unlimited'}")
+            print(f"   Storage: {limits['storage_mb']}MB" if limits['storage_mb'] > 0 else "   Storage: Unlimited")
 
-    except AuthError as e:
-        print(f"\n❌ Authentication failed: {e}")
+        except AuthError as e:
+            print(f"\n❌ Authentication failed: {e}")
 
 
 async def logout_cli():
@@ -549,8 +748,6 @@ async def status_cli():
 
 
 if __name__ == "__main__":
-    import sys
-
     if len(sys.argv) < 2:
         print("Usage: python rapp_auth.py [login|logout|status]")
         sys.exit(1)
@@ -15,16 +15,31 @@ import os
 import sys
 import time
 import json
+import select
 import sqlite3
 import subprocess
 import threading
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional, Dict, List, Callable
+from typing import Optional, Dict, Iterator, List, Tuple, Callable
 import logging
 
 # Add parent to path for imports
 sys.path.insert(0, str(Path(__file__).parent.parent / "core"))
+sys.path.insert(0, str(Path(__file__).parent.parent.parent))
+
+# Same long-lived `osascript -i` coprocess SystemAgent uses, its quoting, and
+# its compiled send_imessage template
+from rapp_os.agents.system_agent import (
+    _AppleScriptDaemon, AppleScriptError, _as_literal, _compiled_script, _OSASCRIPT, _SCRIPT_SOURCES
+)
+
+# Sending through Messages' private IMCore framework skips the AppleScript
+# pipeline entirely. It needs PyObjC and is opt-in: private API, and imagent
+# may refuse unentitled clients, in which case replies fall back to osascript.
+IMCORE_FRAMEWORK = "/System/Library/PrivateFrameworks/IMCore.framework"
+USE_IMCORE = sys.platform == "darwin" and os.environ.get("RAPP_IMESSAGE_IMCORE") == "1"
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("imessage_bridge")
@@ -35,6 +50,127 @@ IMESSAGE_DB = Path.home() / "Library/Messages/chat.db"
 # Configuration
 RAPP_HOME = Path.home() / ".rapp"
 BRIDGE_CONFIG = RAPP_HOME / "imessage_bridge.json"
+# last_message_id changes with every message, so instead of rewriting the
+# config it is checkpointed (at most every CHECKPOINT_SEC) to its own file,
+# an 8-byte little-endian integer overwritten in place with os.pwrite.
+LAST_ID_FILE = RAPP_HOME / "imessage_last_id.bin"
+CHECKPOINT_SEC = 5
+
+# Whitelist normalisation: _STRIP_TBL formats stored numbers, _NORMALIZE_TBL
+# also drops "+" to build the suffixes mirrored into allowed_handles
+_STRIP_TBL = str.maketrans("", "", " -()")
+_NORMALIZE_TBL = str.maketrans("", "", " -()+")
+
+
+@lru_cache(maxsize=1024)
+def _user_guid(sender: str) -> str:
+    """Brain stem user GUID for an iMessage handle, memoized per handle."""
+    return f"imessage_{sender.replace('+', '')}"
+
+
+# Read-side tuning for chat.db. Messages.app already runs it in WAL mode, so
+# readers never block its writer; these keep our polls off the write path,
+# serve pages from mmap/cache, and wait out checkpoints instead of failing.
+READ_PRAGMAS = (
+    "PRAGMA query_only=1",
+    "PRAGMA mmap_size=268435456",  # 256MB
+    "PRAGMA cache_size=-20000",    # ~20MB
+    "PRAGMA busy_timeout=5000",
+)
+
+
+# Whitelisted last-10-digit suffixes, mirrored into the connection's temp
+# schema so chat.db rows from other senders are dropped inside SQLite.
+ALLOWED_HANDLES_SQL = "CREATE TEMP TABLE IF NOT EXISTS allowed_handles (suffix TEXT PRIMARY KEY)"
+
+HIGH_WATER_SQL = "SELECT MAX(ROWID) FROM message"
+
+# Inbound messages in a ROWID window, from whitelisted handles only (all
+# handles when the whitelist is empty; numbers shorter than 10 digits match
+# as a suffix of the handle, as in _is_allowed). Kept as one constant so sqlite3's
+# statement cache reuses the compiled statement on every poll. The unary +
+# on is_from_me keeps the planner off chat.db's (is_from_me, date) index,
+# which would visit every inbound message ever received and then sort; the
+# ROWID range seek only touches rows newer than last_message_id.
+NEW_MESSAGES_SQL = """
+    SELECT
+        m.ROWID,
+        m.text,
+        m.is_from_me,
+        m.date,
+        h.id as handle_id,
+        h.service
+    FROM message m
+    LEFT JOIN handle h ON m.handle_id = h.ROWID
+    WHERE m.ROWID > ? AND m.ROWID <= ?
+        AND +m.is_from_me = 0
+        AND m.text IS NOT NULL
+        AND (NOT EXISTS (SELECT 1 FROM allowed_handles)
+             OR substr(h.id, -10) IN allowed_handles
+             OR EXISTS (SELECT 1 FROM allowed_handles a WHERE length(a.suffix) < 10
+                        AND substr(h.id, -length(a.suffix)) = a.suffix))
+    ORDER BY m.ROWID ASC
+    LIMIT 100
+"""
+
+# Rows decoded per fetchmany() while streaming a poll's results.
+FETCH_BATCH = 32
+
+
+# With a file watcher new messages wake the loop immediately; this is only a
+# safety net. Without one (no kqueue) we fall back to the old 2s poll.
+WATCH_FALLBACK_SEC = 30
+POLL_INTERVAL_SEC = 2
+
+
+# One-shot send handler used when the osascript helper is unavailable:
+# SystemAgent's send_imessage template, compiled once and shared with it. It
+# takes (recipient, body) pairs as argv instead of spliced-in string literals.
+SEND_SCRIPT_SOURCE = _SCRIPT_SOURCES["send_imessage"]
+
+
+def _compile_send_script() -> Optional[Path]:
+    """The compiled send_imessage template; None if osacompile fails."""
+    try:
+        return _compiled_script("send_imessage")
+    except (AppleScriptError, OSError) as e:
+        logger.warning(f"Could not compile send script: {e}")
+        return None
+
+
+def _load_imcore():
+    """
+    Load IMCore through PyObjC.
+
+    Returns (chat registry, IMMessage class, NSAttributedString class), or
+    None if PyObjC or any of the private classes is unavailable.
+    """
+    try:
+        import objc
+        from Foundation import NSAttributedString, NSBundle
+    except ImportError:
+        return None
+
+    bundle = NSBundle.bundleWithPath_(IMCORE_FRAMEWORK)
+    if bundle is None or not bundle.load():
+        return None
+    try:
+        registry = objc.lookUpClass("IMChatRegistry").sharedInstance()
+        message_cls = objc.lookUpClass("IMMessage")
+    except objc.nosuchclass_error:
+        return None
+    if registry is None or not message_cls.respondsToSelector_("instantMessageWithText:flags:"):
+        return None
+    return registry, message_cls, NSAttributedString
+
+
+def _open_imessage_db() -> sqlite3.Connection:
+    """Open chat.db read-only with the read-side PRAGMAs applied."""
+    conn = sqlite3.connect(f"file:{IMESSAGE_DB}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute(ALLOWED_HANDLES_SQL)  # temp schema, not chat.db
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
 
 
 class iMessageBridge:
@@ -56,10 +192,26 @@ class iMessageBridge:
         self.prefix = prefix
         self.running = False
         self.last_message_id = 0
+        self._saved_last_id = 0
+        self._next_checkpoint = 0.0
+        self._last_id_fd: Optional[int] = None
         self.process_callback: Optional[Callable] = None
+        # chat.db connection, kept open between polls (see _db)
+        self._conn: Optional[sqlite3.Connection] = None
+        # Set by the chat.db watcher when Messages writes to the database
+        self._wakeup = threading.Event()
+        # Persistent osascript helper, started in start() on macOS
+        self._osa = None
+        # IMCore classes when USE_IMCORE and they load (see _load_imcore)
+        self._imcore = None
+        # Compiled one-shot send script, built in start() (see _compile_send_script)
+        self._send_script: Optional[Path] = None
+        # Replies collected during one poll, sent together (None = send immediately)
+        self._pending_replies: Optional[List[Tuple[str, str]]] = None
 
         # Load config
         self._load_config()
+        self._refresh_allowed()
 
     def _load_config(self):
         """Load configuration from disk."""
@@ -72,6 +224,24 @@ class iMessageBridge:
             except:
                 pass
 
+        # The checkpoint file is at least as new as the config's copy
+        try:
+            raw = LAST_ID_FILE.read_bytes()
+            if len(raw) == 8:
+                self.last_message_id = max(self.last_message_id, int.from_bytes(raw, "little"))
+        except OSError:
+            pass
+        self._saved_last_id = self.last_message_id
+
+    @property
+    def prefix(self) -> str:
+        return self._prefix
+
+    @prefix.setter
+    def prefix(self, value: str):
+        self._prefix = value
+        self._prefix_lc = (value or "").lower()
+
     def _save_config(self):
         """Save configuration to disk."""
         BRIDGE_CONFIG.parent.mkdir(parents=True, exist_ok=True)
@@ -80,24 +250,54 @@ class iMessageBridge:
             "prefix": self.prefix,
             "last_message_id": self.last_message_id
         }, indent=2))
+        self._checkpoint_last_id(force=True)
+
+    def _checkpoint_last_id(self, force: bool = False):
+        """
+        Persist last_message_id if it changed, coalescing bursts.
+
+        Writes at most once per CHECKPOINT_SEC unless forced. The value is a
+        fixed-size 8-byte pwrite at offset 0 on a descriptor kept open, so
+        there is nothing to encode, no rename, and no torn partial value.
+        """
+        if self.last_message_id == self._saved_last_id:
+            return
+        now = time.monotonic()
+        if not force and now < self._next_checkpoint:
+            return
+
+        if self._last_id_fd is None:
+            LAST_ID_FILE.parent.mkdir(parents=True, exist_ok=True)
+            self._last_id_fd = os.open(LAST_ID_FILE, os.O_RDWR | os.O_CREAT, 0o600)
+        os.pwrite(self._last_id_fd, self.last_message_id.to_bytes(8, "little"), 0)
+        self._saved_last_id = self.last_message_id
+        self._next_checkpoint = now + CHECKPOINT_SEC
+
+    def _close_last_id(self):
+        """Close the checkpoint file descriptor if open."""
+        if self._last_id_fd is not None:
+            os.close(self._last_id_fd)
+            self._last_id_fd = None
 
     def add_allowed_number(self, number: str):
         """Add a phone number to the whitelist."""
         # Normalize number
-        number = number.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+        number = number.translate(_STRIP_TBL)
         if not number.startswith("+"):
             number = "+1" + number  # Assume US
 
         if number not in self.allowed_numbers:
             self.allowed_numbers.append(number)
+            self._refresh_allowed()
             self._save_config()
             logger.info(f"Added allowed number: {number}")
 
     def remove_allowed_number(self, number: str):
         """Remove a phone number from the whitelist."""
-        number = number.replace(" ", "").replace("-", "")
+        number = number.translate(_STRIP_TBL)
         if number in self.allowed_numbers:
             self.allowed_numbers.remove(number)
+            self._refresh_allowed()
             self._save_config()
 
     def _check_permissions(self) -> bool:
@@ -116,94 +316,227 @@ class iMessageBridge:
             logger.error("Grant Full Disk Access to Terminal/Python in System Preferences > Privacy & Security")
             return False
 
-    def _get_new_messages(self) -> List[Dict]:
-        """Get new messages since last check."""
-        messages = []
-
+    def _db(self) -> sqlite3.Connection:
+        """Return the open chat.db connection, opening it on first use."""
+        if self._conn is None:
+            self._conn = _open_imessage_db()
+            self._load_allowed_handles()
+        return self._conn
+
+    def _load_allowed_handles(self):
+        """Copy the whitelist into the connection's allowed_handles temp table."""
+        conn = self._conn
+        # query_only also covers the temp schema; chat.db itself stays mode=ro
+        conn.execute("PRAGMA query_only=0")
         try:
-            conn = sqlite3.connect(f"file:{IMESSAGE_DB}?mode=ro", uri=True)
-            cursor = conn.cursor()
-
-            # Query for new messages
-            query = """
-                SELECT
-                    m.ROWID,
-                    m.text,
-                    m.is_from_me,
-                    m.date,
-                    h.id as handle_id,
-                    h.service
-                FROM message m
-                LEFT JOIN handle h ON m.handle_id = h.ROWID
-                WHERE m.ROWID > ?
-                    AND m.is_from_me = 0
-                    AND m.text IS NOT NULL
-                ORDER BY m.ROWID ASC
-                LIMIT 100
-            """
-
-            cursor.execute(query, (self.last_message_id,))
-            rows = cursor.fetchall()
-
-            for row in rows:
-                msg_id, text, is_from_me, date, handle_id, service = row
-
-                # Update last message ID
-                if msg_id > self.last_message_id:
-                    self.last_message_id = msg_id
-
-                messages.append({
-                    "id": msg_id,
-                    "text": text,
-                    "from": handle_id,
-                    "service": service,
-                    "date": date
-                })
+            with conn:
+                conn.execute("DELETE FROM allowed_handles")
+                conn.executemany(
+                    "INSERT OR IGNORE INTO allowed_handles (suffix) VALUES (?)",
+                    ((suffix,) for suffix in self._allowed_suffixes)
+                )
+        finally:
+            conn.execute("PRAGMA query_only=1")
 
-            conn.close()
+    def _close_db(self):
+        """Close the chat.db connection if open."""
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except sqlite3.Error:
+                pass
+            self._conn = None
+
+    def _get_new_messages(self) -> Iterator[Dict]:
+        """
+        Yield new messages since last check, oldest first.
+
+        Rows are decoded in small batches as the caller consumes them, and
+        last_message_id advances per yielded row, so stopping mid-way (or a
+        failure while processing) resumes after the last message handed out.
+        """
+        cursor = None
+        try:
+            conn = self._db()
+            # Upper bound first: rows the whitelist filters out never come back,
+            # so the window is what lets last_message_id move past them
+            high_water = conn.execute(HIGH_WATER_SQL).fetchone()[0] or 0
+            cursor = conn.execute(NEW_MESSAGES_SQL, (self.last_message_id, high_water))
+            count = 0
+
+            for rows in iter(lambda: cursor.fetchmany(FETCH_BATCH), []):
+                if count and not self.running:
+                    return  # Stopped; the rest is read on the next start
+                for msg_id, text, is_from_me, date, handle_id, service in rows:
+                    count += 1
+
+                    # Update last message ID
+                    if msg_id > self.last_message_id:
+                        self.last_message_id = msg_id
+
+                    yield {
+                        "id": msg_id,
+                        "text": text,
+                        "from": handle_id,
+                        "service": service,
+                        "date": date
+                    }
+
+            if count < 100 and high_water > self.last_message_id:
+                self.last_message_id = high_water  # Nothing allowed left in the window
 
         except Exception as e:
             logger.error(f"Error reading messages: {e}")
+            self._close_db()  # Reopen on the next poll
+        finally:
+            if cursor is not None:
+                cursor.close()
+
+    def _send_via_imcore(self, replies: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """
+        Send replies through IMCore, one framework call each.
+
+        Only replies to an existing chat are sent this way (the bridge always
+        answers someone who has written to it). Returns the replies that were
+        not sent, for the AppleScript path to deliver.
+        """
+        if self._imcore is None:
+            return replies
+
+        registry, message_cls, attributed_cls = self._imcore
+        unsent = []
+        for to, message in replies:
+            try:
+                chat = registry.existingChatWithChatIdentifier_(to)
+                if chat is None:
+                    unsent.append((to, message))
+                    continue
+                text = attributed_cls.alloc().initWithString_(message)
+                chat.sendMessage_(message_cls.instantMessageWithText_flags_(text, 0))
+            except Exception as e:
+                logger.warning(f"IMCore send failed, using AppleScript: {e}")
+                unsent.append((to, message))
+
+        if len(unsent) < len(replies):
+            logger.info(f"Sent {len(replies) - len(unsent)} message(s) via IMCore")
+        return unsent
 
-        return messages
+    def _send_via_helper(self, replies: List[Tuple[str, str]]) -> Optional[bool]:
+        """
+        Send replies through the persistent osascript helper.
+
+        Returns None if the helper is unavailable or could not be written to,
+        so the caller falls back to a one-shot osascript. Once the statements
+        have been delivered a failure is final, so nothing is sent twice.
+        """
+        if self._osa is None:
+            return None
+
+        statement = "\n".join(
+            f'tell application "Messages" to send {_as_literal(message)} to participant '
+            f'{_as_literal(to)} of (1st account whose service type = iMessage)'
+            for to, message in replies
+        )
+        try:
+            self._osa.run(statement)
+        except OSError:
+            return None
+        except AppleScriptError as e:
+            logger.error(f"Failed to send message: {e}")
+            return False
+
+        logger.info(f"Sent {len(replies)} message(s) via osascript helper")
+        return True
 
     def _send_imessage(self, to: str, message: str) -> bool:
-        """Send an iMessage via AppleScript."""
-        # Escape quotes in message
-        message = message.replace('"', '\\"').replace("'", "\\'")
-
-        script = f'''
-        tell application "Messages"
-            set targetService to 1st account whose service type = iMessage
-            set targetBuddy to participant "{to}" of targetService
-            send "{message}" to targetBuddy
-        end tell
-        '''
+        """Send an iMessage via IMCore, or AppleScript."""
+        if not self._send_via_imcore([(to, message)]):
+            return True
+        sent = self._send_via_helper([(to, message)])
+        if sent is not None:
+            return sent
 
         try:
-            subprocess.run(
-                ["osascript", "-e", script],
-                capture_output=True,
-                timeout=10
-            )
+            self._run_send_script([(to, message)])
             logger.info(f"Sent message to {to}")
             return True
         except Exception as e:
             logger.error(f"Failed to send message: {e}")
             return False
 
+    def _send_imessages(self, replies: List[Tuple[str, str]]) -> bool:
+        """Send several iMessages via IMCore, or a single osascript run."""
+        replies = self._send_via_imcore(replies)
+        if not replies:
+            return True
+        sent = self._send_via_helper(replies)
+        if sent is not None:
+            return sent
+
+        try:
+            self._run_send_script(replies)
+            logger.info(f"Sent {len(replies)} messages")
+            return True
+        except Exception as e:
+            logger.error(f"Failed to send messages: {e}")
+            return False
+
+    def _run_send_script(self, replies: List[Tuple[str, str]]):
+        """
+        Run the send handler once for all replies.
+
+        Recipients and bodies go in as argv, so nothing is escaped. Uses the
+        compiled script when start() built one, the source via -e otherwise.
+        Raises AppleScriptError if osascript reports a failure.
+        """
+        args = [part for reply in replies for part in reply]
+        if self._send_script is not None:
+            cmd = [_OSASCRIPT, str(self._send_script), *args]
+        else:
+            cmd = [_OSASCRIPT, "-e", SEND_SCRIPT_SOURCE, *args]
+        timeout = 10 if len(replies) == 1 else 10 + 2 * len(replies)
+        result = subprocess.run(
+            cmd, stdin=subprocess.DEVNULL, capture_output=True, text=True,
+            timeout=timeout, close_fds=False
+        )
+        if result.returncode != 0:
+            raise AppleScriptError(result.stderr.strip())
+
+    def _reply(self, to: str, message: str):
+        """Send a reply now, or queue it while a poll's batch is being processed."""
+        if self._pending_replies is None:
+            self._send_imessage(to, message)
+        else:
+            self._pending_replies.append((to, message))
+
+    def _flush_replies(self):
+        """Deliver replies queued during this poll in one AppleScript run."""
+        replies, self._pending_replies = self._pending_replies, None
+        if not replies:
+            return
+        if len(replies) == 1:
+            self._send_imessage(*replies[0])
+        else:
+            self._send_imessages(replies)
+
+    def _refresh_allowed(self):
+        """Rebuild the set of whitelisted last-10-digit suffixes."""
+        self._allowed_suffixes = frozenset(
+            n.translate(_NORMALIZE_TBL)[-10:] for n in self.allowed_numbers
+        )
+        # Short codes and short national numbers match as a suffix instead
+        self._short_suffixes = tuple(s for s in self._allowed_suffixes if len(s) < 10)
+        if self._conn is not None:
+            self._load_allowed_handles()
+
     def _is_allowed(self, sender: str) -> bool:
         """Check if sender is in whitelist."""
-        if not self.allowed_numbers:
+        if not self._allowed_suffixes:
             return True  # No whitelist = allow all
 
-        # Normalize and check
-        sender_normalized = sender.replace(" ", "").replace("-", "")
-        for allowed in self.allowed_numbers:
-            allowed_normalized = allowed.replace(" ", "").replace("-", "")
-            if sender_normalized.endswith(allowed_normalized[-10:]):
-                return True
-        return False
+        # Compare last 10 digits
+        sender = sender.translate(_NORMALIZE_TBL)
+        return sender[-10:] in self._allowed_suffixes or sender.endswith(self._short_suffixes)
 
     def _process_message(self, message: Dict):
         """Process an incoming message."""
@@ -217,8 +550,10 @@ class iMessageBridge:
 
         # Check for command prefix
         if self.prefix:
-            if text.lower().startswith(self.prefix.lower()):
-                text = text[len(self.prefix):].strip()
+            # Lowercase only the prefix-length slice, not the whole message
+            n = len(self._prefix_lc)
+            if text[:n].lower() == self._prefix_lc:
+                text = text[n:].strip()
             else:
                 return  # Not a command
 
@@ -229,7 +564,7 @@ class iMessageBridge:
             try:
                 response = self.process_callback(
                     user_input=text,
-                    user_guid=f"imessage_{sender.replace('+', '')}",
+                    user_guid=_user_guid(sender),
                     context_guid="imessage"
                 )
 
@@ -240,11 +575,11 @@ class iMessageBridge:
                 if len(reply) > 1500:
                     reply = reply[:1500] + "... (truncated)"
 
-                self._send_imessage(sender, reply)
+                self._reply(sender, reply)
 
             except Exception as e:
                 logger.error(f"Error processing message: {e}")
-                self._send_imessage(sender, f"Error: {str(e)[:100]}")
+                self._reply(sender, f"Error: {str(e)[:100]}")
 
     def set_processor(self, callback: Callable):
         """Set the callback for processing messages."""
@@ -258,31 +593,119 @@ class iMessageBridge:
         self.running = True
         self._save_config()
 
+        # One helper for the bridge's lifetime instead of an osascript per reply
+        if _AppleScriptDaemon is not None:
+            self._osa = _AppleScriptDaemon(timeout=30)
+        self._send_script = _compile_send_script()
+        if USE_IMCORE:
+            self._imcore = _load_imcore()
+            if self._imcore is None:
+                logger.warning("IMCore unavailable, sending with AppleScript")
+
         logger.info(f"iMessage bridge started (prefix: {self.prefix})")
         logger.info(f"Allowed numbers: {self.allowed_numbers or 'ALL'}")
 
+        # Wake on writes to chat.db instead of sleeping between polls
+        watching = hasattr(select, "kqueue")
+        if watching:
+            threading.Thread(target=self._watch_db, daemon=True).start()
+        timeout = WATCH_FALLBACK_SEC if watching else POLL_INTERVAL_SEC
+
         # Monitoring loop
-        while self.running:
-            try:
-                messages = self._get_new_messages()
-                for msg in messages:
-                    self._process_message(msg)
-                    self._save_config()
+        try:
+            while self.running:
+                try:
+                    # Clear before reading so a write during the drain is not missed
+                    self._wakeup.clear()
+                    count = 0
+                    self._pending_replies = []
+                    try:
+                        for msg in self._get_new_messages():
+                            count += 1
+                            self._process_message(msg)
+                    finally:
+                        self._flush_replies()
+                    self._checkpoint_last_id()
+
+                    if count < 100:  # Otherwise more are waiting (LIMIT 100)
+                        if self.last_message_id != self._saved_last_id:
+                            # Coalesced checkpoint pending; come back to write it
+                            self._wakeup.wait(max(self._next_checkpoint - time.monotonic(), 0))
+                        else:
+                            self._wakeup.wait(timeout)
+
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    logger.error(f"Error in monitor loop: {e}")
+                    time.sleep(5)
+        finally:
+            # However the loop ends (Ctrl+C included), keep the ID of the
+            # last message handed out so a restart does not answer it again
+            self._checkpoint_last_id(force=True)
+            self._close_last_id()
+            self._close_db()
+            self._close_helper()
+        return True
 
-                time.sleep(2)  # Check every 2 seconds
+    def _close_helper(self):
+        """Terminate the osascript helper if running."""
+        if self._osa is not None:
+            self._osa.close()
+            self._osa = None
 
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                logger.error(f"Error in monitor loop: {e}")
-                time.sleep(5)
+    def _watch_db(self):
+        """
+        Signal the monitor loop whenever chat.db or its WAL changes (kqueue).
 
-        return True
+        Messages.app appends every inbound message to chat.db-wal, so a
+        NOTE_WRITE there means there may be something new to read. The WAL
+        is recreated after checkpoints, so the watch is re-armed on
+        delete/rename.
+        """
+        flags = select.KQ_NOTE_WRITE | select.KQ_NOTE_EXTEND | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME
+        # O_EVTONLY (macOS) watches without holding the file open for I/O
+        open_flags = os.O_RDONLY | getattr(os, "O_EVTONLY", 0)
+        paths = (IMESSAGE_DB, IMESSAGE_DB.with_name(IMESSAGE_DB.name + "-wal"))
+
+        kq = select.kqueue()
+        fds = []
+        try:
+            while self.running:
+                if not fds:
+                    for path in paths:
+                        try:
+                            fds.append(os.open(path, open_flags))
+                        except OSError:
+                            pass  # No WAL yet
+                    kq.control([
+                        select.kevent(fd, filter=select.KQ_FILTER_VNODE,
+                                      flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR, fflags=flags)
+                        for fd in fds
+                    ], 0)
+
+                events = kq.control(None, 4, 1.0)
+                if events:
+                    self._wakeup.set()
+                if len(fds) < len(paths) or any(
+                        e.fflags & (select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME) for e in events):
+                    for fd in fds:
+                        os.close(fd)
+                    fds = []
+        except Exception as e:
+            logger.error(f"chat.db watcher stopped, polling every {WATCH_FALLBACK_SEC}s: {e}")
+        finally:
+            for fd in fds:
+                os.close(fd)
+            kq.close()
 
     def stop(self):
         """Stop monitoring."""
+        # Only signal the monitor thread: it may be mid-query, mid-send or
+        # mid-checkpoint, and start()'s finally writes the last ID and closes
+        # chat.db, the helper and the checkpoint descriptor once the loop exits
         self.running = False
-        self._save_config()
+        self._wakeup.set()
 
 
 def create_imessage_context():
@@ -20,22 +20,50 @@ import time
 import hmac
 import hashlib
 import logging
-import threading
 import requests
+import queue
+import threading
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, List, Callable
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, List, Callable, Union
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 
 # Add parent to path
 sys.path.insert(0, str(Path(__file__).parent.parent / "core"))
 
+# Optional: orjson parses webhook bodies and serializes replies several times
+# faster, bytes in and bytes out; fall back to the stdlib when not installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(data) -> bytes:
+        return json.dumps(data, separators=(",", ":")).encode()
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("whatsapp_bridge")
 
 # Configuration
 RAPP_HOME = Path.home() / ".rapp"
 BRIDGE_CONFIG = RAPP_HOME / "whatsapp_bridge.json"
+# Written only by setup_whatsapp; _save_config carries them over untouched
+SECRET_KEYS = ("access_token", "app_secret")
+
+# str.translate tables for add_allowed_number (keeps the "+") and for
+# matching webhook "from" numbers against last-10-digit suffixes
+_STRIP_TBL = str.maketrans("", "", " -()")
+_NORMALIZE_TBL = str.maketrans("", "", " -()+")
+
+
+@lru_cache(maxsize=1024)
+def _user_guid(sender: str) -> str:
+    """Brain stem user GUID for a WhatsApp sender, memoized per number."""
+    return f"whatsapp_{sender.replace('+', '')}"
 
 
 class WhatsAppBridge:
@@ -52,7 +80,8 @@ class WhatsAppBridge:
         verify_token: str = None,
         webhook_port: int = 7072,
         prefix: str = "",
-        allowed_numbers: List[str] = None
+        allowed_numbers: List[str] = None,
+        app_secret: str = None
     ):
         """
         Initialize the WhatsApp bridge.
@@ -64,6 +93,8 @@ class WhatsAppBridge:
             webhook_port: Port for webhook server
             prefix: Optional command prefix (empty = respond to all)
             allowed_numbers: Phone numbers allowed to send commands
+            app_secret: Meta app secret for verifying webhook signatures
+                (falls back to WHATSAPP_APP_SECRET; unset = no verification)
         """
         self.phone_number_id = phone_number_id
         self.access_token = access_token
@@ -71,13 +102,23 @@ class WhatsAppBridge:
         self.webhook_port = webhook_port
         self.prefix = prefix
         self.allowed_numbers = allowed_numbers or []
+        self.app_secret = app_secret or os.environ.get("WHATSAPP_APP_SECRET")
 
         self.running = False
         self.process_callback: Optional[Callable] = None
         self.webhook_server = None
+        # Pooled keep-alive connection to graph.facebook.com, shared by all
+        # reply threads so each send skips the TCP/TLS handshake
+        self._http = requests.Session()
+        # Incoming (sender, text) pairs for the worker threads; the webhook
+        # only enqueues, so no thread is created on the request path
+        self.worker_count = int(os.environ.get("RAPP_WA_WORKERS", "8"))
+        self._queue = queue.SimpleQueue()
+        self._workers: List[threading.Thread] = []
 
         # Load config
         self._load_config()
+        self._refresh_allowed()
 
         # WhatsApp API base URL
         self.api_base = "https://graph.facebook.com/v18.0"
@@ -89,6 +130,7 @@ class WhatsAppBridge:
                 config = json.loads(BRIDGE_CONFIG.read_text())
                 self.phone_number_id = config.get("phone_number_id", self.phone_number_id)
                 self.access_token = config.get("access_token", self.access_token)
+                self.app_secret = config.get("app_secret", self.app_secret)
                 self.verify_token = config.get("verify_token", self.verify_token)
                 self.webhook_port = config.get("webhook_port", self.webhook_port)
                 self.prefix = config.get("prefix", self.prefix)
@@ -96,42 +138,63 @@ class WhatsAppBridge:
             except Exception as e:
                 logger.warning(f"Failed to load config: {e}")
 
+    @property
+    def prefix(self) -> str:
+        return self._prefix
+
+    @prefix.setter
+    def prefix(self, value: str):
+        self._prefix = value
+        self._prefix_lc = (value or "").lower()
+
     def _save_config(self):
-        """Save configuration to disk."""
+        """Save configuration to disk, keeping any secrets setup wrote there."""
         BRIDGE_CONFIG.parent.mkdir(parents=True, exist_ok=True)
-        BRIDGE_CONFIG.write_text(json.dumps({
+        config = {
             "phone_number_id": self.phone_number_id,
             "verify_token": self.verify_token,
             "webhook_port": self.webhook_port,
             "prefix": self.prefix,
             "allowed_numbers": self.allowed_numbers
-            # Note: access_token not saved for security
-        }, indent=2))
+        }
+        # access_token and app_secret are never written from memory (they may
+        # come from the environment), but copies already on disk are kept
+        try:
+            saved = json.loads(BRIDGE_CONFIG.read_text())
+            config.update({k: saved[k] for k in SECRET_KEYS if k in saved})
+        except (OSError, ValueError):
+            pass
+        BRIDGE_CONFIG.write_text(json.dumps(config, indent=2))
 
     def add_allowed_number(self, number: str):
         """Add a phone number to the whitelist."""
         # Normalize number (remove spaces, dashes, ensure + prefix)
-        number = number.replace(" ", "").replace("-", "").replace("(", "").replace(")", "")
+        number = number.translate(_STRIP_TBL)
         if not number.startswith("+"):
             number = "+" + number
 
         if number not in self.allowed_numbers:
             self.allowed_numbers.append(number)
+            self._refresh_allowed()
             self._save_config()
             logger.info(f"Added allowed number: {number}")
 
+    def _refresh_allowed(self):
+        """Rebuild the set of whitelisted last-10-digit suffixes."""
+        self._allowed_suffixes = frozenset(
+            n.translate(_NORMALIZE_TBL)[-10:] for n in self.allowed_numbers
+        )
+        # Short codes and short national numbers match as a suffix instead
+        self._short_suffixes = tuple(s for s in self._allowed_suffixes if len(s) < 10)
+
     def _is_allowed(self, sender: str) -> bool:
         """Check if sender is in whitelist."""
-        if not self.allowed_numbers:
+        if not self._allowed_suffixes:
             return True  # No whitelist = allow all
 
-        sender_normalized = sender.replace(" ", "").replace("-", "")
-        for allowed in self.allowed_numbers:
-            allowed_normalized = allowed.replace(" ", "").replace("-", "")
-            # Compare last 10 digits
-            if sender_normalized[-10:] == allowed_normalized[-10:]:
-                return True
-        return False
+        # Compare last 10 digits
+        sender = sender.translate(_NORMALIZE_TBL)
+        return sender[-10:] in self._allowed_suffixes or sender.endswith(self._short_suffixes)
 
     def send_message(self, to: str, message: str) -> bool:
         """Send a WhatsApp message."""
@@ -158,7 +221,7 @@ class WhatsAppBridge:
         }
 
         try:
-            response = requests.post(url, headers=headers, json=payload)
+            response = self._http.post(url, headers=headers, data=_dumps(payload), timeout=10)
             if response.status_code == 200:
                 logger.info(f"Sent message to {to}")
                 return True
@@ -178,8 +241,10 @@ class WhatsAppBridge:
 
         # Check prefix if set
         if self.prefix:
-            if text.lower().startswith(self.prefix.lower()):
-                text = text[len(self.prefix):].strip()
+            # Lowercase only the prefix-length slice, not the whole message
+            n = len(self._prefix_lc)
+            if text[:n].lower() == self._prefix_lc:
+                text = text[n:].strip()
             else:
                 return  # Not a command
 
@@ -190,7 +255,7 @@ class WhatsAppBridge:
             try:
                 response = self.process_callback(
                     user_input=text,
-                    user_guid=f"whatsapp_{sender.replace('+', '')}",
+                    user_guid=_user_guid(sender),
                     context_guid="whatsapp"
                 )
 
@@ -205,11 +270,34 @@ class WhatsAppBridge:
         """Set the callback for processing messages."""
         self.process_callback = callback
 
+    def _verify_signature(self, body: Union[bytes, bytearray], header: str) -> bool:
+        """Check an X-Hub-Signature-256 header ("sha256=<hex>") against the body."""
+        method, _, signature = header.partition("=")
+        if method != "sha256":
+            return False
+        # One-shot C HMAC over the raw bytes (OpenSSL SHA-256); constant-time compare
+        expected = hmac.digest(self.app_secret.encode(), body, hashlib.sha256).hex()
+        return hmac.compare_digest(expected, signature)
+
     def _create_webhook_handler(self):
         """Create HTTP handler for WhatsApp webhook."""
         bridge = self
 
         class WebhookHandler(BaseHTTPRequestHandler):
+            # Keep-alive: Meta reuses one connection for a stream of deliveries,
+            # so they share a handler thread instead of one per request. Every
+            # response therefore carries a Content-Length (see _respond).
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, status: int, body: bytes = b"", content_type: str = "text/plain"):
+                self.send_response(status)
+                if body:
+                    self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
             def do_GET(self):
                 """Handle webhook verification."""
                 from urllib.parse import urlparse, parse_qs
@@ -220,22 +308,29 @@ class WhatsAppBridge:
                 challenge = query.get("hub.challenge", [""])[0]
 
                 if mode == "subscribe" and token == bridge.verify_token:
-                    self.send_response(200)
-                    self.send_header("Content-Type", "text/plain")
-                    self.end_headers()
-                    self.wfile.write(challenge.encode())
+                    self._respond(200, challenge.encode())
                     logger.info("Webhook verified")
                 else:
-                    self.send_response(403)
-                    self.end_headers()
+                    self._respond(403)
 
             def do_POST(self):
                 """Handle incoming messages."""
                 content_length = int(self.headers.get("Content-Length", 0))
-                body = self.rfile.read(content_length).decode()
+                # Read exactly the body (json.load(self.rfile) would wait for EOF
+                # on a keep-alive connection) into one buffer that the signature
+                # check and the parser both use as-is, without decoding
+                body = bytearray(content_length)
+                del body[self.rfile.readinto(body):]  # Short if the client hung up
+
+                # Meta signs the raw body with the app secret (X-Hub-Signature-256)
+                if bridge.app_secret and not bridge._verify_signature(
+                        body, self.headers.get("X-Hub-Signature-256", "")):
+                    logger.warning("Rejected webhook with invalid signature")
+                    self._respond(401)
+                    return
 
                 try:
-                    data = json.loads(body)
+                    data = _loads(body)
 
                     # Extract messages from webhook payload
                     if "entry" in data:
@@ -249,17 +344,13 @@ class WhatsAppBridge:
                                         sender = msg.get("from", "")
                                         text = msg.get("text", {}).get("body", "")
 
-                                        # Process in thread to not block webhook
-                                        threading.Thread(
-                                            target=bridge._process_incoming_message,
-                                            args=(sender, text)
-                                        ).start()
+                                        # Process on a worker to not block webhook
+                                        bridge._queue.put_nowait((sender, text))
 
                 except Exception as e:
                     logger.error(f"Error processing webhook: {e}")
 
-                self.send_response(200)
-                self.end_headers()
+                self._respond(200)
 
             def log_message(self, format, *args):
                 pass  # Suppress logging
@@ -269,7 +360,8 @@ class WhatsAppBridge:
     def start_webhook_server(self):
         """Start the webhook server."""
         handler = self._create_webhook_handler()
-        self.webhook_server = HTTPServer(("0.0.0.0", self.webhook_port), handler)
+        # One thread per connection so a slow request never stalls Meta's deliveries
+        self.webhook_server = ThreadingHTTPServer(("0.0.0.0", self.webhook_port), handler)
 
         logger.info(f"WhatsApp webhook server started on port {self.webhook_port}")
         self.webhook_server.serve_forever()
@@ -283,15 +375,53 @@ class WhatsAppBridge:
         logger.info(f"Webhook port: {self.webhook_port}")
         logger.info(f"Allowed numbers: {self.allowed_numbers or 'ALL'}")
         logger.info(f"Command prefix: '{self.prefix}' (empty = respond to all)")
+        if not self.app_secret:
+            logger.warning("No app secret configured: webhook signatures are NOT verified")
+
+        # Workers first, so the first delivery is picked up immediately
+        self._start_workers()
 
         # Start webhook server
         self.start_webhook_server()
 
+    def _start_workers(self):
+        """Start the long-lived threads that process queued messages."""
+        while len(self._workers) < self.worker_count:
+            worker = threading.Thread(
+                target=self._worker,
+                name=f"whatsapp-{len(self._workers)}",
+                daemon=True
+            )
+            worker.start()
+            self._workers.append(worker)
+
+    def _stop_workers(self, wait: bool = False):
+        """Ask every worker to exit once the messages queued so far are done."""
+        for _ in self._workers:
+            self._queue.put(None)
+        if wait:
+            for worker in self._workers:
+                worker.join()
+        self._workers = []
+
+    def _worker(self):
+        """Process queued messages until a None sentinel arrives."""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self._process_incoming_message(*item)
+            except Exception as e:
+                logger.error(f"Error processing message: {e}")
+
     def stop(self):
         """Stop the bridge."""
         self.running = False
         if self.webhook_server:
             self.webhook_server.shutdown()
+        self._stop_workers()
+        self._http.close()
         self._save_config()
 
 
@@ -338,11 +468,13 @@ def setup_whatsapp():
     phone_id = input("Enter Phone Number ID: ").strip()
     access_token = input("Enter Access Token: ").strip()
     verify_token = input("Enter Verify Token (or press Enter for default): ").strip() or "rapp_verify_token"
+    app_secret = input("Enter App Secret (or press Enter to skip signature checks): ").strip()
 
     config = {
         "phone_number_id": phone_id,
         "access_token": access_token,
         "verify_token": verify_token,
+        "app_secret": app_secret or None,
         "webhook_port": 7072,
         "prefix": "",
         "allowed_numbers": []
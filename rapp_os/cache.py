@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+RAPP Local Index - Persistent SQLite cache for directory listings
+
+Agents list the same directories over and over within a conversation.
+Rather than re-scanning the file system each time, listings are stored in
+a local SQLite database and served from there while the directory is
+unchanged.
+
+A cached listing is only trusted while the directory's mtime matches the
+one recorded when it was scanned (adding, removing or renaming an entry
+always bumps it), so the index never serves stale names.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List, Optional, Tuple
+
+RAPP_HOME = Path.home() / ".rapp"
+INDEX_DB = RAPP_HOME / "cache" / "index.db"
+
+# A directory modified this recently may change again within the same mtime
+# tick, so its listing is not cached (same idea as git's "racy" index check).
+RACY_WINDOW_NS = 2_000_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    parent TEXT NOT NULL,
+    name TEXT NOT NULL,
+    is_dir INTEGER NOT NULL,
+    PRIMARY KEY (parent, name)
+) WITHOUT ROWID;
+"""
+
+
+class LocalIndex:
+    """SQLite-backed cache of directory listings."""
+
+    def __init__(self, db_path: Path = INDEX_DB):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            str(self.db_path), isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def list_dir(self, path: str, mtime_ns: int, limit: int = 50) -> Optional[List[Tuple[str, bool]]]:
+        """
+        Return up to `limit` (name, is_dir) entries in name order.
+
+        Returns None if the directory is not indexed or has changed since.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns FROM dirs WHERE path = ?", (path,)
+            ).fetchone()
+            if row is None or row[0] != mtime_ns:
+                return None
+            rows = self._conn.execute(
+                "SELECT name, is_dir FROM files WHERE parent = ? ORDER BY name LIMIT ?",
+                (path, limit)
+            ).fetchall()
+        return [(name, bool(is_dir)) for name, is_dir in rows]
+
+    def store_dir(self, path: str, mtime_ns: int, entries: Iterable[Tuple[str, bool]]):
+        """Replace the indexed listing for a directory."""
+        if time.time_ns() - mtime_ns < RACY_WINDOW_NS:
+            self.invalidate(path)
+            return
+
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute("DELETE FROM files WHERE parent = ?", (path,))
+                self._conn.executemany(
+                    "INSERT INTO files (parent, name, is_dir) VALUES (?, ?, ?)",
+                    ((path, name, int(is_dir)) for name, is_dir in entries)
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                    (path, mtime_ns)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def invalidate(self, path: str):
+        """Forget the indexed listing for a directory."""
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+            self._conn.execute("DELETE FROM files WHERE parent = ?", (path,))
+            self._conn.execute("COMMIT")
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self._conn.close()
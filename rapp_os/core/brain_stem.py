@@ -17,15 +17,45 @@ GUIDs:
 
 import os
 import sys
+import copy
 import json
 import uuid
 import logging
+import threading
+import time
 import importlib.util
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, List, Optional, Any
+from types import SimpleNamespace
+from typing import Dict, Iterator, List, Optional, Any, TextIO, Tuple
 from dataclasses import dataclass, field
 
+# Optional: orjson (de)serializes several times faster and works in bytes;
+# fall back to the stdlib when it isn't installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(data, indent: bool = False) -> bytes:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2 if indent else 0)
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(data, indent: bool = False) -> bytes:
+        if indent:
+            return json.dumps(data, indent=2).encode()
+        return json.dumps(data, separators=(",", ":")).encode()
+
+# Optional: Aho-Corasick matching of agent names for direct routing
+# (falls back to one substring test per agent)
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("rapp_brain_stem")
@@ -38,6 +68,23 @@ PROJECTS_DIR = RAPP_HOME / "projects"
 MEMORY_DIR = RAPP_HOME / "memory"
 CONTEXTS_DIR = RAPP_HOME / "contexts"
 
+# Characters of user memory included in the system prompt
+USER_MEMORY_TAIL = 2000
+
+# User memory files kept open for appending
+USER_FILES_OPEN = 16
+
+# Messages of a session kept/returned, and the file size that triggers
+# trimming the append-only session log back to them
+SESSION_HISTORY = 20
+SESSION_MAX_BYTES = 256 * 1024
+
+# Upper bound on agent calls run at once for a single model response
+MAX_PARALLEL_TOOLS = 8
+
+# Requests of a /api/rapp/batch call processed at once
+MAX_PARALLEL_REQUESTS = 8
+
 
 @dataclass
 class RappContext:
@@ -49,6 +96,14 @@ class RappContext:
     skills: List[str] = field(default_factory=list)
     system_prompt: str = ""
     config: Dict[str, Any] = field(default_factory=dict)
+    # (agent ids, system prompt + agent list), built by _build_messages
+    _system_head: Optional[Tuple[Tuple[str, ...], str]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    # (registry version, enabled agents), built by _get_agents_for_context
+    _resolved: Optional[Tuple[int, Dict[str, Any]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
 
 @dataclass
@@ -74,49 +129,173 @@ class RappResponse:
 
 
 class AgentRegistry:
-    """Registry of all available agents."""
+    """
+    Registry of all available agents.
+
+    Agent modules are imported on first use. Each import records the file's
+    stat and the agent classes, IDs and metadata it defines in
+    AGENTS_DIR/.manifest.json; while a file is unchanged, discovery reads
+    the manifest instead of executing the module. (Imports already reuse
+    CPython's __pycache__ bytecode.)
+    """
 
     def __init__(self):
         self.agents: Dict[str, Any] = {}
         self.agent_metadata: Dict[str, Dict] = {}
+        # Discovered but not yet imported: agent id -> defining file
+        self._agent_paths: Dict[str, Path] = {}
+        # file name -> {"mtime_ns", "size", "agents": {id: {"class", "metadata"}}}
+        self._manifest: Dict[str, Dict] = {}
+        self._manifest_dirty = False
+        # agent id -> get_function_definition() result, built once per load
+        self.function_defs: Dict[str, Dict] = {}
+        # Bumped whenever the agent listing may have changed (for ETags)
+        self.version = 0
+        # Server threads may ask for the same unloaded agent at once
+        self._load_lock = threading.Lock()
 
     def load_agents(self):
-        """Load all agents from the agents directory."""
+        """Discover all agents in the agents directory."""
         self.agents.clear()
         self.agent_metadata.clear()
+        self.function_defs.clear()
+        self._agent_paths.clear()
+        self.version += 1
 
         if not AGENTS_DIR.exists():
             AGENTS_DIR.mkdir(parents=True, exist_ok=True)
             return
 
+        self._read_manifest()
+        seen = set()
         for agent_file in AGENTS_DIR.glob("*_agent.py"):
             if agent_file.name.startswith("_") or agent_file.name == "basic_agent.py":
                 continue
+            seen.add(agent_file.name)
             try:
-                self._load_agent_file(agent_file)
+                if not self._discover_agent_file(agent_file):
+                    self._load_agent_file(agent_file)
             except Exception as e:
                 logger.warning(f"Failed to load {agent_file.name}: {e}")
 
+        for name in set(self._manifest) - seen:
+            del self._manifest[name]  # File was removed
+            self._manifest_dirty = True
+        self._write_manifest()
+
+    @staticmethod
+    def _manifest_path() -> Path:
+        return AGENTS_DIR / ".manifest.json"
+
+    def _read_manifest(self):
+        try:
+            manifest = _loads(self._manifest_path().read_bytes())
+        except (OSError, ValueError):
+            manifest = {}
+        self._manifest = manifest if isinstance(manifest, dict) else {}
+        self._manifest_dirty = False
+
+    def _write_manifest(self):
+        if not self._manifest_dirty:
+            return
+        try:
+            self._manifest_path().write_bytes(_dumps(self._manifest))
+            self._manifest_dirty = False
+        except OSError as e:
+            logger.debug(f"Could not write agent manifest: {e}")
+
+    def _discover_agent_file(self, agent_file: Path) -> bool:
+        """Register a file's agents from the manifest; False if missing or stale."""
+        try:
+            entry = self._manifest[agent_file.name]
+            st = agent_file.stat()
+            if (entry["mtime_ns"], entry["size"]) != (st.st_mtime_ns, st.st_size):
+                return False
+            agents = {aid: info["metadata"] for aid, info in entry["agents"].items()}
+        except (OSError, KeyError, TypeError, AttributeError):
+            return False
+
+        for agent_id, metadata in agents.items():
+            self._agent_paths[agent_id] = agent_file
+            self.agent_metadata[agent_id] = metadata
+        return True
+
     def _load_agent_file(self, agent_file: Path):
         """Load a single agent file."""
+        st = agent_file.stat()
         spec = importlib.util.spec_from_file_location(agent_file.stem, agent_file)
         module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(module)
 
-        for name, obj in module.__dict__.items():
-            if (isinstance(obj, type) and
-                name.endswith("Agent") and
-                name != "BasicAgent" and
-                hasattr(obj, "perform")):
-                instance = obj()
-                agent_id = getattr(instance, 'name', name)
-                self.agents[agent_id] = instance
-                self.agent_metadata[agent_id] = getattr(instance, 'metadata', {})
-                logger.info(f"Loaded agent: {agent_id}")
+        # A manifest entry for these exact bytes already names the agent
+        # classes; only an unknown or changed file needs the module scan
+        entry = self._manifest.get(agent_file.name)
+        classes = None
+        try:
+            if (entry["mtime_ns"], entry["size"]) == (st.st_mtime_ns, st.st_size):
+                classes = [(info["class"], getattr(module, info["class"]))
+                           for info in entry["agents"].values()]
+        except (KeyError, TypeError, AttributeError):
+            classes = None
+        if classes is None:
+            classes = [
+                (name, obj) for name, obj in module.__dict__.items()
+                if (isinstance(obj, type) and
+                    name.endswith("Agent") and
+                    name != "BasicAgent" and
+                    hasattr(obj, "perform"))
+            ]
+
+        loaded = {}
+        for name, obj in classes:
+            instance = obj()
+            agent_id = getattr(instance, 'name', name)
+            self.agents[agent_id] = instance
+            self.agent_metadata[agent_id] = getattr(instance, 'metadata', {})
+            self.function_defs.pop(agent_id, None)
+            self._agent_paths.pop(agent_id, None)
+            loaded[agent_id] = {"class": name, "metadata": self.agent_metadata[agent_id]}
+            logger.info(f"Loaded agent: {agent_id}")
+
+        entry = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "agents": loaded}
+        if self._manifest.get(agent_file.name) != entry:
+            try:
+                _dumps(entry)
+            except (TypeError, ValueError) as e:
+                # Metadata that can't be stored: this file is imported at every start
+                logger.debug(f"Not recording {agent_file.name} in the manifest: {e}")
+                self._manifest.pop(agent_file.name, None)
+            else:
+                self._manifest[agent_file.name] = entry
+            self._manifest_dirty = True
 
     def get_agent(self, agent_id: str):
-        """Get an agent by ID."""
-        return self.agents.get(agent_id)
+        """Get an agent by ID, importing its module on first use."""
+        agent = self.agents.get(agent_id)
+        if agent is None and agent_id in self._agent_paths:
+            with self._load_lock:
+                agent_file = self._agent_paths.pop(agent_id, None)  # Don't retry a failed import
+                if agent_file is not None:
+                    try:
+                        self._load_agent_file(agent_file)
+                    except Exception as e:
+                        logger.warning(f"Failed to load {agent_file.name}: {e}")
+                    self._write_manifest()
+                agent = self.agents.get(agent_id)
+        return agent
+
+    def get_function_definition(self, agent_id: str, agent: Any) -> Optional[Dict]:
+        """An agent's function definition, memoized until the next load."""
+        fd = self.function_defs.get(agent_id)
+        if fd is None and hasattr(agent, 'get_function_definition'):
+            fd = self.function_defs[agent_id] = agent.get_function_definition()
+        return fd
+
+    def load_all(self) -> Dict[str, Any]:
+        """Import every discovered agent and return all loaded agents."""
+        for agent_id in list(self._agent_paths):
+            self.get_agent(agent_id)
+        return self.agents
 
     def list_agents(self) -> List[Dict]:
         """List all available agents."""
@@ -131,6 +310,10 @@ class ContextManager:
 
     def __init__(self):
         self.contexts: Dict[str, RappContext] = {}
+        # path -> (mtime_ns, size, parsed JSON); unchanged files are not re-read
+        self._ctx_cache: Dict[str, Tuple[int, int, Dict]] = {}
+        # Bumped whenever the context listing may have changed (for ETags)
+        self.version = 0
         self._ensure_default_context()
 
     def _ensure_default_context(self):
@@ -148,28 +331,42 @@ class ContextManager:
                 "system_prompt": "You are a helpful AI assistant powered by RAPP.",
                 "config": {}
             }
-            default_path.write_text(json.dumps(default_context, indent=2))
+            default_path.write_bytes(_dumps(default_context, indent=True))
 
     def load_contexts(self):
-        """Load all contexts from disk."""
+        """Load all contexts from disk, re-parsing only files that changed."""
         self.contexts.clear()
+        self.version += 1
+        cache = {}
 
         for ctx_file in CONTEXTS_DIR.glob("*.json"):
+            key = str(ctx_file)
             try:
-                data = json.loads(ctx_file.read_text())
+                st = ctx_file.stat()
+                cached = self._ctx_cache.get(key)
+                if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+                    data = cached[2]
+                else:
+                    data = _loads(ctx_file.read_bytes())
+                cache[key] = (st.st_mtime_ns, st.st_size, data)
+                # A fresh context every load, so in-memory changes to the
+                # last one do not survive a reload
                 ctx = RappContext(
                     guid=data.get("guid", ctx_file.stem),
                     name=data.get("name", ctx_file.stem),
                     description=data.get("description", ""),
-                    agents=data.get("agents", ["*"]),
-                    skills=data.get("skills", ["*"]),
+                    agents=list(data.get("agents", ["*"])),
+                    skills=list(data.get("skills", ["*"])),
                     system_prompt=data.get("system_prompt", ""),
-                    config=data.get("config", {})
+                    config=copy.deepcopy(data.get("config", {}))
                 )
                 self.contexts[ctx.guid] = ctx
             except Exception as e:
                 logger.warning(f"Failed to load context {ctx_file}: {e}")
 
+        # Files that disappeared drop out of the cache
+        self._ctx_cache = cache
+
     def get_context(self, guid: str) -> Optional[RappContext]:
         """Get a context by GUID."""
         return self.contexts.get(guid, self.contexts.get("default"))
@@ -186,7 +383,7 @@ class ContextManager:
 
         # Save to disk
         ctx_file = CONTEXTS_DIR / f"{guid}.json"
-        ctx_file.write_text(json.dumps({
+        data = {
             "guid": ctx.guid,
             "name": ctx.name,
             "description": ctx.description,
@@ -194,9 +391,15 @@ class ContextManager:
             "skills": ctx.skills,
             "system_prompt": ctx.system_prompt,
             "config": ctx.config
-        }, indent=2))
+        }
+        ctx_file.write_bytes(_dumps(data, indent=True))
+        # The next load_contexts needn't re-parse what was just written; keep
+        # a copy, since ctx's lists and config may be changed in memory
+        st = ctx_file.stat()
+        self._ctx_cache[str(ctx_file)] = (st.st_mtime_ns, st.st_size, copy.deepcopy(data))
 
         self.contexts[guid] = ctx
+        self.version += 1
         return ctx
 
     def list_contexts(self) -> List[Dict]:
@@ -212,6 +415,17 @@ class MemoryManager:
 
     def __init__(self):
         MEMORY_DIR.mkdir(parents=True, exist_ok=True)
+        # user guid -> (mtime_ns, size, last USER_MEMORY_TAIL chars)
+        self._user_mem_cache: Dict[str, Tuple[int, int, str]] = {}
+        # Append handles for recently written user memory files (LRU); the
+        # server's request threads share them, so _user_lock guards both
+        self._user_files: "OrderedDict[str, TextIO]" = OrderedDict()
+        self._user_lock = threading.Lock()
+        # Session writes queued by record_turn, applied in order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rapp-io")
+        # Entry timestamp, re-formatted only when the second changes
+        self._ts_sec = -1
+        self._ts_str = ""
 
     def get_user_memory(self, user_guid: str) -> str:
         """Get memory for a user."""
@@ -220,23 +434,160 @@ class MemoryManager:
             return mem_file.read_text()
         return ""
 
+    def get_user_memory_tail(self, user_guid: str) -> str:
+        """The last USER_MEMORY_TAIL characters of a user's memory, re-read only when it changes."""
+        mem_file = MEMORY_DIR / f"user_{user_guid}.txt"
+        try:
+            st = mem_file.stat()
+        except FileNotFoundError:
+            self._user_mem_cache.pop(user_guid, None)
+            return ""
+
+        cached = self._user_mem_cache.get(user_guid)
+        if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+
+        tail = mem_file.read_text()[-USER_MEMORY_TAIL:]
+        self._user_mem_cache[user_guid] = (st.st_mtime_ns, st.st_size, tail)
+        return tail
+
     def append_user_memory(self, user_guid: str, content: str):
         """Append to user memory."""
-        mem_file = MEMORY_DIR / f"user_{user_guid}.txt"
-        with open(mem_file, "a") as f:
-            f.write(f"\n[{datetime.now().isoformat()}] {content}")
+        now = int(time.time())
+        if now != self._ts_sec:
+            self._ts_sec = now
+            self._ts_str = datetime.fromtimestamp(now).isoformat()
+        entry = f"\n[{self._ts_str}] {content}"
+
+        with self._user_lock:
+            cached = self._user_mem_cache.get(user_guid)
+            f = self._user_file(user_guid)
+            before = os.fstat(f.fileno())
+            if before.st_nlink == 0:  # Deleted since it was opened
+                self._close_user_file(user_guid)
+                f = self._user_file(user_guid)
+                before = os.fstat(f.fileno())
+            f.write(entry)
+            f.flush()
+            st = os.fstat(f.fileno())
+
+            # Extend the cached tail instead of re-reading the file next time,
+            # provided the cache matched the file we appended to
+            if cached and cached[:2] == (before.st_mtime_ns, before.st_size):
+                tail = (cached[2] + entry)[-USER_MEMORY_TAIL:]
+                self._user_mem_cache[user_guid] = (st.st_mtime_ns, st.st_size, tail)
+
+    def _user_file(self, user_guid: str) -> TextIO:
+        """An append handle for a user's memory file, kept open across appends."""
+        f = self._user_files.get(user_guid)
+        if f is not None:
+            self._user_files.move_to_end(user_guid)
+            return f
+
+        f = self._user_files[user_guid] = open(MEMORY_DIR / f"user_{user_guid}.txt", "a")
+        if len(self._user_files) > USER_FILES_OPEN:
+            _, oldest = self._user_files.popitem(last=False)
+            oldest.close()
+        return f
+
+    def _close_user_file(self, user_guid: str):
+        f = self._user_files.pop(user_guid, None)
+        if f is not None:
+            f.close()
+
+    def close(self):
+        """Finish queued session writes and close the cached user memory file handles."""
+        self.flush()
+        with self._user_lock:
+            for user_guid in list(self._user_files):
+                self._close_user_file(user_guid)
+
+    def _session_file(self, session_guid: str) -> Path:
+        return MEMORY_DIR / f"session_{session_guid}.jsonl"
 
     def get_session_memory(self, session_guid: str) -> List[Dict]:
-        """Get conversation history for a session."""
-        mem_file = MEMORY_DIR / f"session_{session_guid}.json"
-        if mem_file.exists():
-            return json.loads(mem_file.read_text())
-        return []
+        """Get the last SESSION_HISTORY messages for a session."""
+        # Read on the writer thread: after queued writes, and never racing
+        # one of them to migrate a legacy file
+        return self._writer.submit(self._read_session, self._session_file(session_guid)).result()
 
     def save_session_memory(self, session_guid: str, history: List[Dict]):
-        """Save conversation history for a session."""
-        mem_file = MEMORY_DIR / f"session_{session_guid}.json"
-        mem_file.write_text(json.dumps(history, indent=2))
+        """Replace the stored history for a session."""
+        self._write_session(self._session_file(session_guid), history)
+
+    def append_session_memory(self, session_guid: str, messages: List[Dict]):
+        """
+        Append messages to a session's history, one JSON line each.
+
+        Only the new messages are written; once the file passes
+        SESSION_MAX_BYTES it is rewritten with just the recent tail.
+        """
+        mem_file = self._session_file(session_guid)
+        if not mem_file.exists():
+            self._migrate_session(mem_file)
+        self._append_session(mem_file, messages)
+
+    def record_turn(self, session_guid: str, turn: List[Dict], history: List[Dict]):
+        """
+        Queue a finished turn to be saved off the request thread.
+
+        The turn is appended to a known session; a new session is stored
+        as `history` (which should end with the turn) instead. Writes run
+        one at a time, in the order they were queued.
+        """
+        mem_file = self._session_file(session_guid)
+        self._writer.submit(self._record_turn, mem_file, turn, history[-SESSION_HISTORY:])
+
+    def flush(self):
+        """Wait for queued session writes to finish."""
+        self._writer.submit(int).result()
+
+    def _record_turn(self, mem_file: Path, turn: List[Dict], history: List[Dict]):
+        try:
+            if mem_file.exists() or self._migrate_session(mem_file):
+                self._append_session(mem_file, turn)
+            else:
+                self._write_session(mem_file, history)
+        except Exception as e:
+            logger.error(f"Failed to save {mem_file.name}: {e}")
+
+    def _migrate_session(self, mem_file: Path) -> bool:
+        """
+        Convert a session saved before the JSONL format (one indented JSON
+        array in session_<guid>.json) to mem_file. Returns whether there was
+        one to convert.
+        """
+        legacy = mem_file.with_suffix(".json")
+        try:
+            history = _loads(legacy.read_bytes())
+        except FileNotFoundError:
+            return False
+        except ValueError as e:
+            logger.error(f"Ignoring unreadable {legacy.name}: {e}")
+            return False
+
+        self._write_session(mem_file, history)
+        legacy.unlink()
+        return True
+
+    def _read_session(self, mem_file: Path) -> List[Dict]:
+        if not mem_file.exists() and not self._migrate_session(mem_file):
+            return []
+        with open(mem_file, "rb") as f:
+            lines = deque(f, maxlen=SESSION_HISTORY)
+        return [_loads(line) for line in lines if line.strip()]
+
+    def _write_session(self, mem_file: Path, history: List[Dict]):
+        mem_file.write_bytes(b"".join(_dumps(msg) + b"\n" for msg in history))
+
+    def _append_session(self, mem_file: Path, messages: List[Dict]):
+        with open(mem_file, "ab", buffering=8192) as f:
+            for msg in messages:
+                f.write(_dumps(msg) + b"\n")
+            size = f.tell()
+
+        if size > SESSION_MAX_BYTES:
+            self._write_session(mem_file, self._read_session(mem_file))
 
 
 class RappBrainStem:
@@ -254,12 +605,28 @@ class RappBrainStem:
         self.agent_registry.load_agents()
         self.context_manager.load_contexts()
 
+        # context guid -> (agent ids, tools array) for the last request in it
+        self._tools_cache: Dict[str, Tuple[Tuple[str, ...], List[Dict]]] = {}
+
+        # (agent ids, lowercased names, name automaton) for _direct_agent_route
+        self._route_index: Optional[Tuple[Tuple[str, ...], List[Tuple[str, str]], Any]] = None
+
+        # Independent tool calls from one model turn run side by side
+        self._tool_pool = ThreadPoolExecutor(
+            max_workers=MAX_PARALLEL_TOOLS, thread_name_prefix="rapp-tool"
+        )
+
         # AI client (configure based on available provider)
         self.ai_client = None
         self._init_ai_client()
 
+    def close(self):
+        """Finish pending memory writes and release open memory files."""
+        self.memory_manager.close()
+
     def _init_ai_client(self):
         """Initialize AI client based on available credentials."""
+        http_client = _http_client()
         # Try Azure OpenAI first
         if os.getenv("AZURE_OPENAI_ENDPOINT"):
             try:
@@ -267,7 +634,8 @@ class RappBrainStem:
                 self.ai_client = AzureOpenAI(
                     azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT"),
                     api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-                    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+                    api_version=os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+                    http_client=http_client
                 )
                 self.model = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4o")
                 logger.info("Using Azure OpenAI")
@@ -279,7 +647,7 @@ class RappBrainStem:
         if os.getenv("OPENAI_API_KEY"):
             try:
                 from openai import OpenAI
-                self.ai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+                self.ai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"), http_client=http_client)
                 self.model = os.getenv("OPENAI_MODEL", "gpt-4o")
                 logger.info("Using OpenAI")
                 return
@@ -290,15 +658,12 @@ class RappBrainStem:
 
     def reload(self):
         """Reload agents and contexts."""
+        self._tools_cache.clear()
         self.agent_registry.load_agents()
         self.context_manager.load_contexts()
 
-    def process(self, request: RappRequest) -> RappResponse:
-        """
-        Process a request through the brain stem.
-
-        Routes to appropriate agents based on context GUID.
-        """
+    def _prepare(self, request: RappRequest) -> Tuple[RappContext, Dict[str, Any], List[Dict], List[Dict]]:
+        """Resolve context and agents and build the messages and tools for a request."""
         # Ensure session GUID
         if not request.session_guid:
             request.session_guid = str(uuid.uuid4())
@@ -312,64 +677,59 @@ class RappBrainStem:
         available_agents = self._get_agents_for_context(context)
 
         # Get user memory
-        user_memory = self.memory_manager.get_user_memory(request.user_guid)
+        user_memory = self.memory_manager.get_user_memory_tail(request.user_guid)
 
         # Build messages
         messages = self._build_messages(
             request, context, user_memory, available_agents
         )
 
-        # Get agent function definitions
-        functions = [
-            agent.get_function_definition()
-            for agent in available_agents.values()
-            if hasattr(agent, 'get_function_definition')
-        ]
+        # Get agent tool definitions
+        tools = self._get_tools(context, available_agents)
+
+        return context, available_agents, messages, tools
+
+    def process(self, request: RappRequest) -> RappResponse:
+        """
+        Process a request through the brain stem.
+
+        Routes to appropriate agents based on context GUID.
+        """
+        context, available_agents, messages, tools = self._prepare(request)
 
         # Call AI
         response_text = ""
         agents_used = []
         agent_logs = []
 
-        if self.ai_client and functions:
+        if self.ai_client and tools:
             try:
                 response = self.ai_client.chat.completions.create(
                     model=self.model,
                     messages=messages,
-                    functions=functions if functions else None,
-                    function_call="auto" if functions else None,
+                    tools=tools,
+                    tool_choice="auto",
                     max_tokens=4096
                 )
 
                 msg = response.choices[0].message
-
-                # Handle function calls
-                if msg.function_call:
-                    func_name = msg.function_call.name
-                    func_args = json.loads(msg.function_call.arguments or "{}")
-
-                    if func_name in available_agents:
-                        agent = available_agents[func_name]
-                        try:
-                            result = agent.perform(**func_args)
-                            agents_used.append(func_name)
-                            agent_logs.append(f"{func_name}: {result[:200]}...")
-
-                            # Get final response with agent result
-                            messages.append({"role": "assistant", "content": None, "function_call": msg.function_call})
-                            messages.append({"role": "function", "name": func_name, "content": str(result)})
-
-                            final_response = self.ai_client.chat.completions.create(
-                                model=self.model,
-                                messages=messages,
-                                max_tokens=4096
-                            )
-                            response_text = final_response.choices[0].message.content or ""
-                        except Exception as e:
-                            agent_logs.append(f"{func_name} error: {e}")
-                            response_text = f"Agent error: {e}"
+                tool_calls = msg.tool_calls or []
+
+                # Handle tool calls (the model may request several at once)
+                if any(tc.function.name in available_agents for tc in tool_calls):
+                    error = self._apply_tool_calls(
+                        messages, msg.content, tool_calls, available_agents, agents_used, agent_logs
+                    )
+                    if error:
+                        response_text = error
                     else:
-                        response_text = msg.content or ""
+                        # Get final response with the agent results
+                        final_response = self.ai_client.chat.completions.create(
+                            model=self.model,
+                            messages=messages,
+                            max_tokens=4096
+                        )
+                        response_text = final_response.choices[0].message.content or ""
                 else:
                     response_text = msg.content or ""
 
@@ -380,19 +740,145 @@ class RappBrainStem:
             # No AI client - try direct agent routing
             response_text = self._direct_agent_route(request, available_agents)
 
-        # Parse voice response if present
-        voice_response = ""
-        if "|||VOICE|||" in response_text:
-            parts = response_text.split("|||VOICE|||")
-            response_text = parts[0].strip()
-            voice_response = parts[1].strip() if len(parts) > 1 else ""
+        return self._finish(request, context, response_text, agent_logs, agents_used)
+
+    def process_stream(self, request: RappRequest) -> Iterator[Dict]:
+        """
+        Process a request, yielding the reply as it is generated.
+
+        Yields {"delta": text} events while the model streams, then one
+        {"done": True, ...} event carrying the same fields as process()'s
+        response. Session memory is written only once the stream completes.
+        """
+        context, available_agents, messages, tools = self._prepare(request)
+
+        parts: List[str] = []
+        agents_used = []
+        agent_logs = []
+
+        if self.ai_client and tools:
+            try:
+                content, tool_calls = yield from self._stream_completion(
+                    parts, messages=messages, tools=tools, tool_choice="auto"
+                )
+
+                if any(tc.function.name in available_agents for tc in tool_calls):
+                    error = self._apply_tool_calls(
+                        messages, content, tool_calls, available_agents, agents_used, agent_logs
+                    )
+                    if error:
+                        parts.append(error)
+                        yield {"delta": error}
+                    else:
+                        yield from self._stream_completion(parts, messages=messages)
+
+            except Exception as e:
+                logger.error(f"AI call failed: {e}")
+                parts.append(f"AI error: {e}")
+                yield {"delta": parts[-1]}
+        else:
+            # No AI client - try direct agent routing
+            parts.append(self._direct_agent_route(request, available_agents))
+            yield {"delta": parts[-1]}
+
+        response = self._finish(request, context, "".join(parts), agent_logs, agents_used)
+        yield {"done": True, **_response_dict(response)}
+
+    def _stream_completion(self, parts: List[str], **kwargs):
+        """
+        Stream one completion, yielding {"delta": text} events.
+
+        Text is also appended to parts. Tool-call fragments are buffered by
+        index until the stream ends. Returns (content or None, tool calls)
+        as a generator return value, for use with yield from.
+        """
+        stream = self.ai_client.chat.completions.create(
+            model=self.model, max_tokens=4096, stream=True, **kwargs
+        )
+
+        content = []
+        calls: Dict[int, Dict[str, str]] = {}
+        for chunk in stream:
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content.append(delta.content)
+                parts.append(delta.content)
+                yield {"delta": delta.content}
+            for tc in delta.tool_calls or []:
+                call = calls.setdefault(tc.index, {"id": "", "name": "", "arguments": ""})
+                if tc.id:
+                    call["id"] = tc.id
+                if tc.function:
+                    call["name"] += tc.function.name or ""
+                    call["arguments"] += tc.function.arguments or ""
+
+        tool_calls = [
+            SimpleNamespace(id=c["id"], function=SimpleNamespace(name=c["name"], arguments=c["arguments"]))
+            for _, c in sorted(calls.items())
+        ]
+        return "".join(content) or None, tool_calls
+
+    def _apply_tool_calls(self, messages: List[Dict], content: Optional[str], tool_calls: List[Any],
+                          agents: Dict[str, Any], agents_used: List[str], agent_logs: List[str]) -> Optional[str]:
+        """
+        Run a turn's tool calls and append the assistant/tool messages.
+
+        Returns an error reply instead if every call failed.
+        """
+        results = self._run_tool_calls(tool_calls, agents)
+
+        failures = []
+        for tc, (ok, result) in zip(tool_calls, results):
+            func_name = tc.function.name
+            if ok:
+                agents_used.append(func_name)
+                agent_logs.append(f"{func_name}: {result[:200]}...")
+            else:
+                agent_logs.append(f"{func_name} error: {result}")
+                failures.append(result)
+
+        if len(failures) == len(tool_calls):
+            return f"Agent error: {failures[0]}"
+
+        messages.append({
+            "role": "assistant",
+            "content": content,
+            "tool_calls": [
+                {
+                    "id": tc.id,
+                    "type": "function",
+                    "function": {
+                        "name": tc.function.name,
+                        "arguments": tc.function.arguments
+                    }
+                }
+                for tc in tool_calls
+            ]
+        })
+        for tc, (ok, result) in zip(tool_calls, results):
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tc.id,
+                "content": str(result) if ok else f"Error: {result}"
+            })
+        return None
+
+    def _finish(self, request: RappRequest, context: RappContext, response_text: str,
+                agent_logs: List[str], agents_used: List[str]) -> RappResponse:
+        """Split off the voice response, save session memory and build the response."""
+        response_text, voice_response = self._split_voice_response(response_text)
 
-        # Save session memory
-        history = request.conversation_history + [
+        # Save session memory in the background: just this turn, or the
+        # client's history too the first time the session is seen
+        turn = [
             {"role": "user", "content": request.user_input},
             {"role": "assistant", "content": response_text}
         ]
-        self.memory_manager.save_session_memory(request.session_guid, history[-20:])
+        self.memory_manager.record_turn(
+            request.session_guid, turn, request.conversation_history + turn
+        )
 
         return RappResponse(
             response=response_text,
@@ -403,28 +889,84 @@ class RappBrainStem:
             context_guid=context.guid
         )
 
+    @staticmethod
+    def _split_voice_response(text: str) -> Tuple[str, str]:
+        """Split "main|||VOICE|||voice" into (main, voice); voice is "" if absent."""
+        if "|||VOICE|||" not in text:
+            return text, ""
+        parts = text.split("|||VOICE|||")
+        return parts[0].strip(), parts[1].strip()
+
+    def _get_tools(self, context: RappContext, agents: Dict[str, Any]) -> List[Dict]:
+        """Tools array for a context, rebuilt only when its agent set changes."""
+        ids = tuple(agents)
+        cached = self._tools_cache.get(context.guid)
+        if cached and cached[0] == ids:
+            return cached[1]
+
+        tools = []
+        for aid, agent in agents.items():
+            fd = self.agent_registry.get_function_definition(aid, agent)
+            if fd is not None:
+                tools.append({"type": "function", "function": fd})
+        self._tools_cache[context.guid] = (ids, tools)
+        return tools
+
+    def _run_tool_calls(self, tool_calls: List[Any], agents: Dict[str, Any]) -> List[Tuple[bool, Any]]:
+        """
+        Run the agents for a batch of tool calls, concurrently when there are several.
+
+        Returns (ok, result-or-exception) per call, in order.
+        """
+        def run(tc):
+            agent = agents.get(tc.function.name)
+            if agent is None:
+                return False, f"Unknown agent: {tc.function.name}"
+            try:
+                return True, agent.perform(**_loads(tc.function.arguments or "{}"))
+            except Exception as e:
+                return False, e
+
+        if len(tool_calls) == 1:
+            return [run(tool_calls[0])]
+        return list(self._tool_pool.map(run, tool_calls))
+
     def _get_agents_for_context(self, context: RappContext) -> Dict[str, Any]:
-        """Get agents enabled for a context."""
-        if "*" in context.agents:
-            return self.agent_registry.agents.copy()
+        """Get agents enabled for a context, resolved once per agent load."""
+        registry = self.agent_registry
+        resolved = context._resolved
+        if resolved and resolved[0] == registry.version:
+            return resolved[1]
 
-        return {
-            aid: agent
-            for aid, agent in self.agent_registry.agents.items()
-            if aid in context.agents
-        }
+        version = registry.version
+        if "*" in context.agents:
+            agents = registry.load_all().copy()
+        else:
+            # Only the context's own agents get imported
+            agents = {}
+            for aid in context.agents:
+                agent = registry.get_agent(aid)
+                if agent is not None:
+                    agents[aid] = agent
+        context._resolved = (version, agents)
+        return agents
 
     def _build_messages(self, request: RappRequest, context: RappContext,
                         user_memory: str, agents: Dict) -> List[Dict]:
         """Build messages for AI call."""
-        system_content = context.system_prompt or "You are a helpful AI assistant."
+        # The prompt and agent list only change with the context's agent set;
+        # they stay first so provider-side prompt caching can reuse the prefix
+        ids = tuple(agents)
+        head = context._system_head
+        if head is None or head[0] != ids:
+            system_head = context.system_prompt or "You are a helpful AI assistant."
+            if agents:
+                system_head += f"\n\nAvailable agents: {', '.join(ids)}"
+            head = context._system_head = (ids, system_head)
+        system_content = head[1]
 
         if user_memory:
-            system_content += f"\n\nUser Memory:\n{user_memory[-2000:]}"
-
-        if agents:
-            agent_list = ", ".join(agents.keys())
-            system_content += f"\n\nAvailable agents: {agent_list}"
+            system_content += f"\n\nUser Memory:\n{user_memory[-USER_MEMORY_TAIL:]}"
 
         messages = [{"role": "system", "content": system_content}]
 
@@ -440,31 +982,94 @@ class RappBrainStem:
 
         return messages
 
+    def _mentioned_agents(self, agents: Dict, text_lower: str) -> List[str]:
+        """Agents whose name occurs in the (lowercased) text, in agent order."""
+        ids = tuple(agents)
+        index = self._route_index
+        if index is None or index[0] != ids:
+            lowered = [(aid, aid.lower()) for aid in ids]
+            automaton = None
+            if ahocorasick is not None and any(low for _, low in lowered):
+                automaton = ahocorasick.Automaton()
+                for _, low in lowered:
+                    if low:
+                        automaton.add_word(low, low)
+                automaton.make_automaton()
+            index = self._route_index = (ids, lowered, automaton)
+
+        _, lowered, automaton = index
+        if automaton is None:
+            return [aid for aid, low in lowered if low in text_lower]
+        # One pass over the text for every name at once
+        found = {low for _, low in automaton.iter(text_lower)}
+        found.add("")  # An empty name is "in" any text, as with the substring test
+        return [aid for aid, low in lowered if low in found]
+
     def _direct_agent_route(self, request: RappRequest, agents: Dict) -> str:
         """Route directly to agent without AI (fallback)."""
         user_lower = request.user_input.lower()
 
-        for agent_name, agent in agents.items():
-            if agent_name.lower() in user_lower:
-                try:
-                    return agent.perform(action="help", request=request.user_input)
-                except:
-                    pass
+        for agent_name in self._mentioned_agents(agents, user_lower):
+            try:
+                return agents[agent_name].perform(action="help", request=request.user_input)
+            except:
+                pass
 
         return f"Available agents: {', '.join(agents.keys())}"
 
 
+def _http_client():
+    """
+    A keep-alive (HTTP/2 when h2 is installed) client shared by the AI SDK.
+
+    Built on the SDK's own DefaultHttpxClient, so its timeouts and redirect
+    handling stay as they are and retries are left to its max_retries.
+    Returns None to let the SDK build its default client if httpx (or an
+    SDK new enough to export DefaultHttpxClient) is missing.
+    """
+    try:
+        import httpx
+        from openai import DEFAULT_CONNECTION_LIMITS, DefaultHttpxClient
+    except ImportError:
+        return None
+
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+
+    return DefaultHttpxClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=DEFAULT_CONNECTION_LIMITS.max_connections,
+            max_keepalive_connections=MAX_PARALLEL_TOOLS,
+            keepalive_expiry=120
+        )
+    )
+
+
 # Global brain stem instance
 _brain_stem: Optional[RappBrainStem] = None
+_brain_stem_lock = threading.Lock()
 
 def get_brain_stem() -> RappBrainStem:
     """Get or create the global brain stem instance."""
     global _brain_stem
     if _brain_stem is None:
-        _brain_stem = RappBrainStem()
+        # Server threads may race on the first request; build it only once
+        with _brain_stem_lock:
+            if _brain_stem is None:
+                _brain_stem = RappBrainStem()
     return _brain_stem
 
 
+def close_brain_stem():
+    """Close the global brain stem's files, if it was ever created."""
+    if _brain_stem is not None:
+        _brain_stem.close()
+
+
 def process_request(
     user_input: str,
     user_guid: str = "default",
@@ -489,6 +1094,61 @@ def process_request(
 
     response = brain.process(request)
 
+    return _response_dict(response)
+
+
+def stream_request(
+    user_input: str,
+    user_guid: str = "default",
+    session_guid: str = "",
+    context_guid: str = "default",
+    conversation_history: List[Dict] = None
+) -> Iterator[Dict]:
+    """
+    Process a request through the brain stem, streaming the reply.
+
+    Yields {"delta": ...} events, then a final {"done": True, ...} event with
+    the fields process_request returns.
+    """
+    brain = get_brain_stem()
+
+    request = RappRequest(
+        user_input=user_input,
+        user_guid=user_guid,
+        session_guid=session_guid,
+        context_guid=context_guid,
+        conversation_history=conversation_history or []
+    )
+
+    return brain.process_stream(request)
+
+
+def process_batch(entries: List[Dict]) -> List[Dict]:
+    """
+    Process several requests concurrently.
+
+    Each entry holds process_request's keyword arguments. Results come back
+    in entry order; an entry that fails gets {"error": ...} instead.
+    """
+    if not entries:
+        return []
+
+    def run(kwargs: Dict) -> Dict:
+        try:
+            return process_request(**kwargs)
+        except Exception as e:
+            logger.error(f"Batch request failed: {e}")
+            return {"error": str(e)}
+
+    # Not the brain stem's tool pool: a request waiting on its own tool
+    # calls must never hold one of those workers
+    workers = min(len(entries), MAX_PARALLEL_REQUESTS)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="rapp-batch") as pool:
+        return list(pool.map(run, entries))
+
+
+def _response_dict(response: RappResponse) -> Dict:
+    """The API's JSON shape for a response."""
     return {
         "response": response.response,
         "voice_response": response.voice_response,
@@ -502,7 +1162,7 @@ def process_request(
 if __name__ == "__main__":
     # Test the brain stem
     brain = get_brain_stem()
-    print(f"Loaded {len(brain.agent_registry.agents)} agents")
+    print(f"Found {len(brain.agent_registry.agent_metadata)} agents")
     print(f"Loaded {len(brain.context_manager.contexts)} contexts")
 
     # Test request
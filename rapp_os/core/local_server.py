@@ -6,37 +6,128 @@ Runs locally and provides REST API for RAPP Desktop and external integrations.
 """
 
 import json
+import uuid
 import asyncio
-from http.server import HTTPServer, BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
-from typing import Dict, Any
+from typing import Any, Callable, Dict, Iterator, Tuple, Union
 import threading
 
-from brain_stem import process_request, get_brain_stem
+from brain_stem import process_request, process_batch, stream_request, get_brain_stem, close_brain_stem
 
 DEFAULT_PORT = 7071
 
+# Optional: orjson parses request bodies and encodes responses several times
+# faster, straight from/to bytes; fall back to the stdlib when not installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+
+    def _dumps(data) -> bytes:
+        return json.dumps(data).encode()
+
+
+# /health never changes; encode it once
+_HEALTH_BODY = _dumps({"status": "ok", "service": "rapp-brain-stem"})
+
+# Listing versions restart at 0 with the process; the salt keeps an ETag from
+# a previous run from matching a different listing in this one
+_ETAG_SALT = uuid.uuid4().hex[:8]
+
+# path -> (source object, version, etag, encoded body) for /agents and /contexts
+_listing_cache: Dict[str, Tuple[Any, int, str, bytes]] = {}
+
 
 class RappRequestHandler(BaseHTTPRequestHandler):
     """HTTP request handler for RAPP local server."""
 
+    # Keep-alive: the desktop app polls over one connection instead of a new
+    # one per request, so every response carries a Content-Length (the SSE
+    # stream closes its connection instead). Idle connections drop after
+    # `timeout` seconds.
+    protocol_version = "HTTP/1.1"
+    timeout = 30
+
     def _set_cors_headers(self):
         """Set CORS headers for cross-origin requests."""
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, If-None-Match')
+        self.send_header('Access-Control-Expose-Headers', 'ETag')
 
-    def _send_json(self, data: Dict, status: int = 200):
-        """Send JSON response."""
+    def _send_json(self, data: Union[Dict, bytes], status: int = 200):
+        """Send JSON response (a dict, or an already encoded body)."""
+        payload = data if isinstance(data, bytes) else _dumps(data)
         self.send_response(status)
         self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self._set_cors_headers()
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_events(self, events: Iterator[Dict]):
+        """
+        Send events as a Server-Sent Events stream, one data line each.
+
+        The response has no Content-Length; it ends when the connection
+        closes. A client that disconnects stops the stream.
+        """
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self._set_cors_headers()
+        self.end_headers()
+        try:
+            for event in events:
+                self.wfile.write(b"data: " + _dumps(event) + b"\n\n")
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            # Headers are already out; report the failure as the last event
+            self.wfile.write(b"data: " + _dumps({"error": str(e)}) + b"\n\n")
+        finally:
+            events.close()
+
+    def _send_listing(self, path: str, source: Any, build: Callable[[], Dict]):
+        """
+        Send a listing that only changes when source.version does.
+
+        The encoded body is cached per version, and a client presenting the
+        current ETag in If-None-Match gets a bodiless 304.
+        """
+        cached = _listing_cache.get(path)
+        if cached is None or cached[0] is not source or cached[1] != source.version:
+            etag = f'W/"{path.strip("/")}-{_ETAG_SALT}-{source.version}"'
+            cached = _listing_cache[path] = (source, source.version, etag, _dumps(build()))
+        _, _, etag, payload = cached
+
+        if_none_match = self.headers.get('If-None-Match', '')
+        if etag in (tag.strip() for tag in if_none_match.split(',')):
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self._set_cors_headers()
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('ETag', etag)
         self._set_cors_headers()
         self.end_headers()
-        self.wfile.write(json.dumps(data).encode())
+        self.wfile.write(payload)
 
     def do_OPTIONS(self):
         """Handle CORS preflight."""
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self._set_cors_headers()
         self.end_headers()
 
@@ -46,17 +137,15 @@ class RappRequestHandler(BaseHTTPRequestHandler):
         path = parsed.path
 
         if path == '/health':
-            self._send_json({"status": "ok", "service": "rapp-brain-stem"})
+            self._send_json(_HEALTH_BODY)
 
         elif path == '/agents':
-            brain = get_brain_stem()
-            agents = brain.agent_registry.list_agents()
-            self._send_json({"agents": agents})
+            registry = get_brain_stem().agent_registry
+            self._send_listing(path, registry, lambda: {"agents": registry.list_agents()})
 
         elif path == '/contexts':
-            brain = get_brain_stem()
-            contexts = brain.context_manager.list_contexts()
-            self._send_json({"contexts": contexts})
+            manager = get_brain_stem().context_manager
+            self._send_listing(path, manager, lambda: {"contexts": manager.list_contexts()})
 
         elif path == '/reload':
             brain = get_brain_stem()
@@ -73,29 +162,50 @@ class RappRequestHandler(BaseHTTPRequestHandler):
 
         # Read body
         content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode() if content_length else '{}'
+        body = self.rfile.read(content_length) if content_length else b'{}'
 
         try:
-            data = json.loads(body)
-        except json.JSONDecodeError:
+            data = _loads(body)
+        except ValueError:  # Malformed JSON or not UTF-8
             self._send_json({"error": "Invalid JSON"}, 400)
             return
+        if not isinstance(data, dict):
+            self._send_json({"error": "Request body must be a JSON object"}, 400)
+            return
+
+        # An escaping exception would drop the keep-alive connection unanswered
+        try:
+            self._route_post(path, data)
+        except Exception as e:
+            self._send_json({"error": f"Internal error: {e}"}, 500)
 
-        if path in ['/api/rapp', '/api/chat', '/api/process']:
+    def _route_post(self, path: str, data: Dict):
+        """Dispatch a parsed POST body to its endpoint."""
+        if path in ['/api/rapp', '/api/chat', '/api/process', '/api/rapp/stream']:
             # Main RAPP endpoint
-            user_input = data.get('user_input', data.get('message', ''))
-            if not user_input:
+            kwargs = _request_kwargs(data)
+            if not kwargs["user_input"]:
                 self._send_json({"error": "user_input required"}, 400)
                 return
 
-            result = process_request(
-                user_input=user_input,
-                user_guid=data.get('user_guid', 'default'),
-                session_guid=data.get('session_guid', ''),
-                context_guid=data.get('context_guid', 'default'),
-                conversation_history=data.get('conversation_history', [])
-            )
-            self._send_json(result)
+            if path == '/api/rapp/stream':
+                self._send_events(stream_request(**kwargs))
+            else:
+                self._send_json(process_request(**kwargs))
+
+        elif path == '/api/rapp/batch':
+            # Several RAPP requests, processed concurrently
+            entries = data.get('requests')
+            if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+                self._send_json({"error": "requests must be a list of objects"}, 400)
+                return
+
+            batch = [_request_kwargs(e) for e in entries]
+            if not all(kwargs["user_input"] for kwargs in batch):
+                self._send_json({"error": "user_input required"}, 400)
+                return
+
+            self._send_json({"responses": process_batch(batch)})
 
         elif path == '/api/context/create':
             # Create new context
@@ -120,6 +230,28 @@ class RappRequestHandler(BaseHTTPRequestHandler):
         pass
 
 
+def _request_kwargs(data: Dict) -> Dict:
+    """process_request's keyword arguments from a request body."""
+    return {
+        "user_input": data.get('user_input', data.get('message', '')),
+        "user_guid": data.get('user_guid', 'default'),
+        "session_guid": data.get('session_guid', ''),
+        "context_guid": data.get('context_guid', 'default'),
+        "conversation_history": data.get('conversation_history', [])
+    }
+
+
+class RappHTTPServer(ThreadingHTTPServer):
+    """Threaded server with a listen backlog sized for bursts of clients."""
+
+    # socketserver's default of 5 refuses connections once a few clients
+    # (desktop app, bridges, batch callers) connect at the same moment
+    request_queue_size = 128
+
+    # Don't let stop() wait on clients idling on a keep-alive connection
+    block_on_close = False
+
+
 class RappLocalServer:
     """Local HTTP server for RAPP brain stem."""
 
@@ -130,7 +262,10 @@ class RappLocalServer:
 
     def start(self):
         """Start the server in a background thread."""
-        self.server = HTTPServer(('127.0.0.1', self.port), RappRequestHandler)
+        # A thread per connection: one slow model round trip must not hold up
+        # /health or other clients
+        self.server = RappHTTPServer(('127.0.0.1', self.port), RappRequestHandler)
+        self.port = self.server.server_address[1]  # The one picked for port 0
         self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
         self.thread.start()
         print(f"RAPP Brain Stem running at http://127.0.0.1:{self.port}")
@@ -139,7 +274,9 @@ class RappLocalServer:
         """Stop the server."""
         if self.server:
             self.server.shutdown()
+            self.server.server_close()
             self.server = None
+            close_brain_stem()  # Session writes and memory file handles
 
 
 def main():
@@ -96,7 +96,7 @@ class RappOS:
 
         # Initialize brain stem
         self.brain_stem = get_brain_stem()
-        print(f"  Brain Stem: {len(self.brain_stem.agent_registry.agents)} agents loaded")
+        print(f"  Brain Stem: {len(self.brain_stem.agent_registry.agent_metadata)} agents available")
         print(f"  Contexts: {len(self.brain_stem.context_manager.contexts)} contexts")
 
         # Initialize local server
@@ -143,6 +143,9 @@ class RappOS:
         if self.imessage_bridge:
             self.imessage_bridge.stop()
 
+        if self.brain_stem:
+            self.brain_stem.close()
+
     def run(self):
         """Run RAPP OS (blocking)."""
         self.initialize()
@@ -0,0 +1,18 @@
+"""
+Shared pytest fixtures for the RAPP Desktop tests.
+
+The rapp_os module directories are put on sys.path by `pythonpath` in
+pytest.ini, so test modules import brain_stem, local_server, system_agent,
+etc. directly.
+"""
+
+import pytest
+
+
+@pytest.fixture(scope="module")
+def http():
+    """A requests session, so a module's calls to a live server share connections."""
+    import requests  # Only when a live-server test runs
+
+    with requests.Session() as session:
+        yield session
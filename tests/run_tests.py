@@ -6,12 +6,18 @@ Usage:
     python tests/run_tests.py              # Run all tests
     python tests/run_tests.py --unit       # Run only unit tests
     python tests/run_tests.py --coverage   # Run with coverage
+    python tests/run_tests.py --coverage-html  # ... plus an HTML report
     python tests/run_tests.py --verbose    # Verbose output
+    python tests/run_tests.py --no-xdist   # Run in a single process
+    python tests/run_tests.py --lf         # Re-run only last run's failures
+    python tests/run_tests.py --testmon    # Run only tests affected by changes
 """
 
 import os
 import sys
 import argparse
+import hashlib
+import importlib.util
 import subprocess
 from pathlib import Path
 
@@ -19,46 +25,96 @@ from pathlib import Path
 PROJECT_ROOT = Path(__file__).parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 
+REQUIREMENTS = PROJECT_ROOT / "tests" / "requirements.txt"
+CACHE_DIR = PROJECT_ROOT / ".pytest_cache"
+
 
 def run_tests(args):
     """Run the test suite."""
-    cmd = ["python", "-m", "pytest"]
-
-    # Add test path
-    test_path = PROJECT_ROOT / "tests"
-    cmd.append(str(test_path))
+    # Test paths come from testpaths in pytest.ini
+    pytest_args = []
 
     # Options
     if args.verbose:
-        cmd.append("-v")
+        pytest_args.append("-v")
 
-    if args.coverage:
-        cmd.extend([
-            "--cov=rapp_os",
-            "--cov-report=term-missing",
-            "--cov-report=html:coverage_report"
-        ])
+    if args.coverage or args.coverage_html:
+        pytest_args.extend(["--cov=rapp_os", "--cov-report=term-missing"])
+
+    # Writing a page per module costs as much as a small run itself
+    if args.coverage_html:
+        pytest_args.append("--cov-report=html:coverage_report")
 
     if args.unit:
-        cmd.extend(["-m", "not integration and not slow"])
+        pytest_args.extend(["-m", "not integration and not slow"])
 
     if args.integration:
-        cmd.extend(["-m", "integration"])
+        pytest_args.extend(["-m", "integration"])
 
     if args.pattern:
-        cmd.extend(["-k", args.pattern])
+        pytest_args.extend(["-k", args.pattern])
 
     if args.failfast:
-        cmd.append("-x")
+        pytest_args.append("-x")
+
+    if args.last_failed:
+        pytest_args.append("--last-failed")
+
+    if args.failed_first:
+        pytest_args.append("--failed-first")
+
+    # Opt-in: testmon's bookkeeping slows down plain and -k runs
+    if args.testmon:
+        os.environ["TESTMON_DATAFILE"] = str(PROJECT_ROOT / ".testmondata")
+        pytest_args.append("--testmon")
+
+    # Spread test files over worker processes. loadfile keeps each file on
+    # one worker, so a file's live servers never race another's for a port.
+    # Skipped for -k runs, where spawning workers outweighs the tests, and
+    # for --testmon, which doesn't track tests run on xdist workers.
+    if (not args.no_xdist and not args.pattern and not args.testmon
+            and importlib.util.find_spec("xdist")):
+        pytest_args.extend(["-n", "auto", "--maxprocesses", "8", "--dist", "loadfile"])
 
     # Print command
-    print(f"Running: {' '.join(cmd)}")
+    print(f"Running: pytest {' '.join(pytest_args)}")
     print("=" * 60)
 
-    # Run tests
-    result = subprocess.run(cmd, cwd=PROJECT_ROOT)
+    # Run tests, in this interpreter unless a fresh one was asked for
+    if args.subprocess:
+        cmd = [sys.executable, "-m", "pytest", *pytest_args]
+        return subprocess.run(cmd, cwd=PROJECT_ROOT).returncode
+
+    import pytest
+
+    os.chdir(PROJECT_ROOT)
+    return int(pytest.main(pytest_args))
 
-    return result.returncode
+
+def check_dependencies():
+    """
+    Install the test dependencies if pytest is missing.
+
+    A passing check is remembered per version of requirements.txt, so
+    later runs skip it until the requirements change.
+    """
+    req_hash = hashlib.sha256(REQUIREMENTS.read_bytes()).hexdigest()[:16]
+    marker = CACHE_DIR / f"deps_ok_{req_hash}"
+    if marker.exists():
+        return
+
+    try:
+        import pytest
+    except ImportError:
+        print("Installing test dependencies...")
+        result = subprocess.run([
+            sys.executable, "-m", "pip", "install", "-r", str(REQUIREMENTS)
+        ])
+        if result.returncode != 0:
+            return
+
+    CACHE_DIR.mkdir(exist_ok=True)
+    marker.touch()
 
 
 def main():
@@ -74,6 +130,11 @@ def main():
         action="store_true",
         help="Run with coverage report"
     )
+    parser.add_argument(
+        "--coverage-html",
+        action="store_true",
+        help="Run with coverage, also writing an HTML report to coverage_report/"
+    )
     parser.add_argument(
         "--unit", "-u",
         action="store_true",
@@ -93,18 +154,37 @@ def main():
         action="store_true",
         help="Stop on first failure"
     )
+    parser.add_argument(
+        "--lf", "--last-failed",
+        dest="last_failed",
+        action="store_true",
+        help="Run only the tests that failed last time"
+    )
+    parser.add_argument(
+        "--ff", "--failed-first",
+        dest="failed_first",
+        action="store_true",
+        help="Run last time's failures first, then the rest"
+    )
+    parser.add_argument(
+        "--testmon",
+        action="store_true",
+        help="Run only tests affected by changes since the last run (pytest-testmon)"
+    )
+    parser.add_argument(
+        "--subprocess",
+        action="store_true",
+        help="Run pytest in a separate interpreter"
+    )
+    parser.add_argument(
+        "--no-xdist",
+        action="store_true",
+        help="Run tests in a single process"
+    )
 
     args = parser.parse_args()
 
-    # Check dependencies
-    try:
-        import pytest
-    except ImportError:
-        print("Installing test dependencies...")
-        subprocess.run([
-            sys.executable, "-m", "pip", "install", "-r",
-            str(PROJECT_ROOT / "tests" / "requirements.txt")
-        ])
+    check_dependencies()
 
     # Run tests
     exit_code = run_tests(args)
@@ -6,16 +6,34 @@ Run: pytest tests/test_brain_stem.py -v
 """
 
 import os
-import sys
 import json
 import pytest
 import tempfile
-from pathlib import Path
 from unittest.mock import Mock, patch, MagicMock
 
-# Add rapp_os to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os" / "core"))
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os"))
+
+@pytest.fixture
+def patched_dirs(tmp_path):
+    """Point the brain stem's RAPP home and data directories into tmp_path."""
+    with patch.multiple(
+        'brain_stem',
+        RAPP_HOME=tmp_path,
+        AGENTS_DIR=tmp_path / "agents",
+        CONTEXTS_DIR=tmp_path / "contexts",
+        MEMORY_DIR=tmp_path / "memory"
+    ):
+        yield tmp_path
+
+
+@pytest.fixture(scope="module")
+def contexts_dir(tmp_path_factory):
+    """A contexts directory holding just default.json, shared by read-only tests."""
+    from brain_stem import ContextManager
+
+    path = tmp_path_factory.mktemp("contexts")
+    with patch('brain_stem.CONTEXTS_DIR', path):
+        ContextManager()  # Writes default.json
+    return path
 
 
 class TestAgentRegistry:
@@ -49,6 +67,33 @@ class TestAgentRegistry:
         registry = AgentRegistry()
         assert registry.list_agents() == []
 
+    def test_agents_imported_on_first_use(self, tmp_path):
+        """Test a known agent file is listed from the manifest and imported lazily."""
+        from brain_stem import AgentRegistry
+
+        agents_dir = tmp_path / "agents"
+        agents_dir.mkdir()
+        (agents_dir / "echo_agent.py").write_text(
+            "class EchoAgent:\n"
+            "    name = 'Echo'\n"
+            "    metadata = {'description': 'echo'}\n"
+            "    def perform(self, **kwargs):\n"
+            "        return 'echo'\n"
+        )
+
+        with patch('brain_stem.AGENTS_DIR', agents_dir):
+            first = AgentRegistry()
+            first.load_agents()  # Not in the manifest yet: imported now
+            assert "Echo" in first.agents
+            manifest = json.loads((agents_dir / ".manifest.json").read_text())
+            assert manifest["echo_agent.py"]["agents"]["Echo"]["class"] == "EchoAgent"
+
+            registry = AgentRegistry()
+            registry.load_agents()
+            assert registry.agents == {}
+            assert registry.list_agents() == [{"id": "Echo", "metadata": {"description": "echo"}}]
+            assert registry.get_agent("Echo").perform() == "echo"
+
 
 class TestContextManager:
     """Tests for ContextManager class."""
@@ -61,11 +106,11 @@ class TestContextManager:
             manager = ContextManager()
             assert (tmp_path / "default.json").exists()
 
-    def test_get_context_returns_default(self, tmp_path):
+    def test_get_context_returns_default(self, contexts_dir):
         """Test get_context returns default for unknown GUID."""
         from brain_stem import ContextManager
 
-        with patch('brain_stem.CONTEXTS_DIR', tmp_path):
+        with patch('brain_stem.CONTEXTS_DIR', contexts_dir):
             manager = ContextManager()
             manager.load_contexts()
             ctx = manager.get_context("unknown_guid")
@@ -87,17 +132,69 @@ class TestContextManager:
             assert "agent1" in ctx.agents
             assert ctx.guid in manager.contexts
 
-    def test_list_contexts(self, tmp_path):
+    def test_list_contexts(self, contexts_dir):
         """Test listing all contexts."""
         from brain_stem import ContextManager
 
-        with patch('brain_stem.CONTEXTS_DIR', tmp_path):
+        with patch('brain_stem.CONTEXTS_DIR', contexts_dir):
             manager = ContextManager()
             manager.load_contexts()
             contexts = manager.list_contexts()
             assert len(contexts) >= 1  # At least default
             assert any(c["guid"] == "default" for c in contexts)
 
+    def test_load_contexts_reparses_only_changed_files(self, tmp_path):
+        """Test reloading reuses unchanged parses and picks up edits."""
+        from brain_stem import ContextManager
+
+        with patch('brain_stem.CONTEXTS_DIR', tmp_path):
+            manager = ContextManager()
+            manager.load_contexts()
+            default_data = manager._ctx_cache[str(tmp_path / "default.json")][2]
+
+            ctx_file = tmp_path / "extra.json"
+            ctx_file.write_text(json.dumps({"guid": "extra", "name": "Extra"}))
+            manager.load_contexts()
+            assert manager._ctx_cache[str(tmp_path / "default.json")][2] is default_data
+            assert manager.contexts["extra"].name == "Extra"
+
+            ctx_file.write_text(json.dumps({"guid": "extra", "name": "Extra v2"}))
+            manager.load_contexts()
+            assert manager.contexts["extra"].name == "Extra v2"
+
+            ctx_file.unlink()
+            manager.load_contexts()
+            assert "extra" not in manager.contexts
+            assert str(ctx_file) not in manager._ctx_cache
+
+            created = manager.create_context(name="Created", agents=["*"], description="")
+            manager.load_contexts()
+            assert manager.contexts[created.guid] == created
+
+    def test_reload_discards_in_memory_changes(self, tmp_path):
+        """Test a reload resets contexts to what is on disk, even when unchanged."""
+        from brain_stem import ContextManager
+
+        with patch('brain_stem.CONTEXTS_DIR', tmp_path):
+            manager = ContextManager()
+            manager.load_contexts()
+            ctx = manager.contexts["default"]
+            ctx.name = "Renamed"
+            ctx.agents.append("extra")
+            ctx.config["key"] = "value"
+
+            manager.load_contexts()
+            reloaded = manager.contexts["default"]
+            assert reloaded is not ctx
+            assert reloaded.name == "Default Context"
+            assert reloaded.agents == ["*"]
+            assert reloaded.config == {}
+
+            created = manager.create_context(name="Created", agents=["*"], description="")
+            created.agents.append("extra")
+            manager.load_contexts()
+            assert manager.contexts[created.guid].agents == ["*"]
+
 
 class TestMemoryManager:
     """Tests for MemoryManager class."""
@@ -121,6 +218,37 @@ class TestMemoryManager:
             memory = manager.get_user_memory("test_user")
             assert "Test content" in memory
 
+    def test_user_memory_tail_follows_appends(self, tmp_path):
+        """Test the cached memory tail is extended on append and trimmed."""
+        from brain_stem import MemoryManager, USER_MEMORY_TAIL
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            assert manager.get_user_memory_tail("test_user") == ""
+            manager.append_user_memory("test_user", "x" * USER_MEMORY_TAIL)
+            manager.get_user_memory_tail("test_user")  # Primes the cache
+
+            manager.append_user_memory("test_user", "Latest fact")
+            tail = manager.get_user_memory_tail("test_user")
+            assert len(tail) == USER_MEMORY_TAIL
+            assert tail.endswith("Latest fact")
+            assert tail == manager.get_user_memory("test_user")[-USER_MEMORY_TAIL:]
+
+    def test_user_memory_reopens_deleted_file(self, tmp_path):
+        """Test appends survive the memory file being removed underneath."""
+        from brain_stem import MemoryManager
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            manager.append_user_memory("test_user", "Old fact")
+            (tmp_path / "user_test_user.txt").unlink()
+
+            manager.append_user_memory("test_user", "New fact")
+            memory = manager.get_user_memory("test_user")
+            assert "New fact" in memory
+            assert "Old fact" not in memory
+            manager.close()
+
     def test_session_memory_roundtrip(self, tmp_path):
         """Test saving and loading session memory."""
         from brain_stem import MemoryManager
@@ -136,6 +264,74 @@ class TestMemoryManager:
             assert len(loaded) == 2
             assert loaded[0]["content"] == "Hello"
 
+    def test_session_memory_append(self, tmp_path):
+        """Test appended turns are read back as the most recent history."""
+        from brain_stem import MemoryManager, SESSION_HISTORY
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            for i in range(SESSION_HISTORY):
+                manager.append_session_memory("session123", [
+                    {"role": "user", "content": f"Q{i}"},
+                    {"role": "assistant", "content": f"A{i}"}
+                ])
+            loaded = manager.get_session_memory("session123")
+            assert len(loaded) == SESSION_HISTORY
+            assert loaded[-1] == {"role": "assistant", "content": f"A{SESSION_HISTORY - 1}"}
+
+    def test_record_turn_saves_in_background(self, tmp_path):
+        """Test queued turns start a session from history, then append."""
+        from brain_stem import MemoryManager
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            first = [{"role": "user", "content": "Q1"}, {"role": "assistant", "content": "A1"}]
+            second = [{"role": "user", "content": "Q2"}, {"role": "assistant", "content": "A2"}]
+            earlier = [{"role": "user", "content": "Q0"}]
+            manager.record_turn("s1", first, earlier + first)
+            manager.record_turn("s1", second, second)
+            assert manager.get_session_memory("s1") == earlier + first + second
+
+    def test_close_brain_stem_closes_memory(self):
+        """Test close_brain_stem closes the global instance's memory, without creating one."""
+        import brain_stem
+
+        with patch.object(brain_stem, '_brain_stem', None):
+            brain_stem.close_brain_stem()  # Nothing to close
+        with patch.object(brain_stem, '_brain_stem', MagicMock()) as mock_brain:
+            brain_stem.close_brain_stem()
+        mock_brain.close.assert_called_once_with()
+
+        brain = MagicMock()
+        brain_stem.RappBrainStem.close(brain)
+        brain.memory_manager.close.assert_called_once_with()
+
+    def test_legacy_session_read_and_migrated(self, tmp_path):
+        """Test a session saved as one JSON array is still read, then kept as JSONL."""
+        from brain_stem import MemoryManager
+
+        history = [{"role": "user", "content": "Old Q"}, {"role": "assistant", "content": "Old A"}]
+        (tmp_path / "session_s1.json").write_text(json.dumps(history, indent=2))
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            assert manager.get_session_memory("s1") == history
+            assert not (tmp_path / "session_s1.json").exists()
+            assert (tmp_path / "session_s1.jsonl").exists()
+
+    def test_legacy_session_extended_by_record_turn(self, tmp_path):
+        """Test the first recorded turn appends to a legacy history instead of replacing it."""
+        from brain_stem import MemoryManager
+
+        old = [{"role": "user", "content": "Old Q"}, {"role": "assistant", "content": "Old A"}]
+        (tmp_path / "session_s1.json").write_text(json.dumps(old, indent=2))
+        turn = [{"role": "user", "content": "Q"}, {"role": "assistant", "content": "A"}]
+
+        with patch('brain_stem.MEMORY_DIR', tmp_path):
+            manager = MemoryManager()
+            manager.record_turn("s1", turn, turn)
+            assert manager.get_session_memory("s1") == old + turn
+
 
 class TestRappRequest:
     """Tests for RappRequest dataclass."""
@@ -171,100 +367,190 @@ class TestRappResponse:
 class TestRappBrainStem:
     """Tests for RappBrainStem class."""
 
-    def test_brain_stem_initialization(self, tmp_path):
+    def test_brain_stem_initialization(self, patched_dirs):
         """Test brain stem initializes components."""
         from brain_stem import RappBrainStem
 
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        brain = RappBrainStem()
-                        assert brain.agent_registry is not None
-                        assert brain.context_manager is not None
-                        assert brain.memory_manager is not None
+        brain = RappBrainStem()
+        assert brain.agent_registry is not None
+        assert brain.context_manager is not None
+        assert brain.memory_manager is not None
 
-    def test_get_agents_for_wildcard_context(self, tmp_path):
+    def test_get_agents_for_wildcard_context(self, patched_dirs):
         """Test that wildcard context returns all agents."""
         from brain_stem import RappBrainStem, RappContext
 
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        brain = RappBrainStem()
-                        brain.agent_registry.agents = {"agent1": Mock(), "agent2": Mock()}
+        brain = RappBrainStem()
+        brain.agent_registry.agents = {"agent1": Mock(), "agent2": Mock()}
+
+        context = RappContext(
+            guid="test",
+            name="Test",
+            description="",
+            agents=["*"]
+        )
+
+        agents = brain._get_agents_for_context(context)
+        assert len(agents) == 2
+
+    def test_tools_cached_per_context(self, patched_dirs):
+        """Test function definitions are built once and reused across requests."""
+        from brain_stem import RappBrainStem, RappContext
+
+        brain = RappBrainStem()
+        agent = Mock()
+        agent.get_function_definition.return_value = {"name": "Echo"}
+        agents = {"Echo": agent}
+        context = RappContext(guid="test", name="Test", description="")
+
+        tools = brain._get_tools(context, agents)
+        assert tools == [{"type": "function", "function": {"name": "Echo"}}]
+        assert brain._get_tools(context, agents) is tools
+        agent.get_function_definition.assert_called_once()
+
+        brain.reload()
+        assert brain._get_tools(context, agents) is not tools
+
+    def test_context_agents_resolved_once(self, patched_dirs):
+        """Test a context's agents are resolved once until agents are reloaded."""
+        from brain_stem import RappBrainStem, RappContext
+
+        brain = RappBrainStem()
+        brain.agent_registry.agents["Echo"] = Mock()
+        context = RappContext(guid="test", name="Test", description="",
+                              agents=["Echo", "Missing"])
+
+        agents = brain._get_agents_for_context(context)
+        assert list(agents) == ["Echo"]
+        assert brain._get_agents_for_context(context) is agents
 
-                        context = RappContext(
-                            guid="test",
-                            name="Test",
-                            description="",
-                            agents=["*"]
-                        )
+        brain.reload()
+        assert brain._get_agents_for_context(context) == {}
 
-                        agents = brain._get_agents_for_context(context)
-                        assert len(agents) == 2
+    def test_process_stream_deltas(self, patched_dirs):
+        """Test streamed text is forwarded and saved once the stream ends."""
+        from brain_stem import RappBrainStem, RappRequest
 
-    def test_voice_response_parsing(self, tmp_path):
+        brain = RappBrainStem()
+        agent = Mock()
+        agent.get_function_definition.return_value = {"name": "Echo"}
+        brain.agent_registry.agents = {"Echo": agent}
+
+        chunks = []
+        for text in ("Hel", "lo"):
+            chunk = MagicMock()
+            chunk.choices[0].delta.content = text
+            chunk.choices[0].delta.tool_calls = None
+            chunks.append(chunk)
+        brain.ai_client = Mock()
+        brain.ai_client.chat.completions.create.return_value = iter(chunks)
+        brain.model = "test-model"
+
+        request = RappRequest(user_input="Hi", session_guid="s1")
+        events = list(brain.process_stream(request))
+
+        assert events[:2] == [{"delta": "Hel"}, {"delta": "lo"}]
+        assert events[-1]["done"] is True
+        assert events[-1]["response"] == "Hello"
+        history = brain.memory_manager.get_session_memory("s1")
+        assert history[-1] == {"role": "assistant", "content": "Hello"}
+
+    def test_direct_agent_route_by_name(self, patched_dirs):
+        """Test AI-less routing picks the agent named in the input."""
+        from brain_stem import RappBrainStem, RappRequest
+
+        brain = RappBrainStem()
+        agents = {"Weather": Mock(), "Calendar": Mock()}
+        agents["Calendar"].perform.return_value = "calendar help"
+
+        request = RappRequest(user_input="open my CALENDAR please")
+        assert brain._direct_agent_route(request, agents) == "calendar help"
+        agents["Weather"].perform.assert_not_called()
+
+        request = RappRequest(user_input="hello")
+        assert brain._direct_agent_route(request, agents) == "Available agents: Weather, Calendar"
+
+    def test_parallel_tool_calls(self, patched_dirs):
+        """Test every tool call in one model turn is run and answered."""
+        from brain_stem import RappBrainStem, RappRequest
+
+        brain = RappBrainStem()
+        agents = {}
+        for name in ("Weather", "Calendar"):
+            agent = Mock()
+            agent.perform.return_value = f"{name} result"
+            agent.get_function_definition.return_value = {"name": name}
+            agents[name] = agent
+        brain.agent_registry.agents = agents
+
+        calls = []
+        for i, name in enumerate(agents):
+            tc = Mock(id=f"call_{i}")
+            tc.function.name = name
+            tc.function.arguments = '{"city": "Paris"}'
+            calls.append(tc)
+        first = MagicMock()
+        first.choices[0].message.tool_calls = calls
+        first.choices[0].message.content = None
+        final = MagicMock()
+        final.choices[0].message.content = "All done"
+
+        brain.ai_client = Mock()
+        brain.ai_client.chat.completions.create.side_effect = [first, final]
+        brain.model = "test-model"
+
+        response = brain.process(RappRequest(user_input="Plan my day"))
+
+        assert response.response == "All done"
+        assert response.agents_used == ["Weather", "Calendar"]
+        for agent in agents.values():
+            agent.perform.assert_called_once_with(city="Paris")
+        messages = brain.ai_client.chat.completions.create.call_args[1]["messages"]
+        tool_messages = [m for m in messages if m["role"] == "tool"]
+        assert [m["tool_call_id"] for m in tool_messages] == ["call_0", "call_1"]
+
+    def test_voice_response_parsing(self):
         """Test parsing of voice response delimiter."""
         from brain_stem import RappBrainStem
 
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        brain = RappBrainStem()
-
-                        # Test the response parsing logic
-                        response_text = "Full response|||VOICE|||Short voice"
-                        if "|||VOICE|||" in response_text:
-                            parts = response_text.split("|||VOICE|||")
-                            main = parts[0].strip()
-                            voice = parts[1].strip()
-                            assert main == "Full response"
-                            assert voice == "Short voice"
+        split = RappBrainStem._split_voice_response
+        assert split("Full response|||VOICE|||Short voice") == ("Full response", "Short voice")
+        assert split("Only text") == ("Only text", "")
 
 
 class TestProcessRequest:
     """Tests for the process_request function."""
 
-    def test_process_request_returns_dict(self, tmp_path):
+    def test_process_request_returns_dict(self, patched_dirs):
         """Test process_request returns expected dictionary structure."""
         from brain_stem import process_request
 
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        with patch('brain_stem._brain_stem', None):
-                            result = process_request("Hello")
-                            assert "response" in result
-                            assert "session_guid" in result
-                            assert "context_guid" in result
+        with patch('brain_stem._brain_stem', None):
+            result = process_request("Hello")
+            assert "response" in result
+            assert "session_guid" in result
+            assert "context_guid" in result
 
 
+@pytest.mark.integration
 class TestIntegration:
     """Integration tests for brain stem."""
 
-    def test_full_request_flow(self, tmp_path):
+    def test_full_request_flow(self, patched_dirs):
         """Test complete request flow without AI."""
         from brain_stem import RappBrainStem, RappRequest
 
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        brain = RappBrainStem()
-
-                        request = RappRequest(
-                            user_input="What agents are available?",
-                            user_guid="test_user",
-                            context_guid="default"
-                        )
-
-                        response = brain.process(request)
-                        assert response.response != ""
-                        assert response.session_guid != ""
+        brain = RappBrainStem()
+
+        request = RappRequest(
+            user_input="What agents are available?",
+            user_guid="test_user",
+            context_guid="default"
+        )
+
+        response = brain.process(request)
+        assert response.response != ""
+        assert response.session_guid != ""
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Tests for RAPP Local Index
+
+Run: pytest tests/test_cache.py -v
+"""
+
+import time
+import pytest
+
+# Old enough to be outside the racy window
+OLD_MTIME = 1_000_000_000
+
+
+class TestLocalIndex:
+    """Tests for LocalIndex class."""
+
+    @pytest.fixture
+    def index(self, tmp_path):
+        from cache import LocalIndex
+        index = LocalIndex(tmp_path / "index.db")
+        yield index
+        index.close()
+
+    def test_unknown_directory(self, index):
+        """Test listing an unindexed directory returns None."""
+        assert index.list_dir("/nowhere", OLD_MTIME) is None
+
+    def test_store_and_list(self, index):
+        """Test stored entries come back sorted and limited."""
+        entries = [(f"file{i:02d}", False) for i in range(10, 0, -1)] + [("dir", True)]
+        index.store_dir("/home/user", OLD_MTIME, entries)
+
+        listed = index.list_dir("/home/user", OLD_MTIME, limit=3)
+        assert listed == [("dir", True), ("file01", False), ("file02", False)]
+
+    def test_mtime_change_invalidates(self, index):
+        """Test a changed directory mtime is treated as a miss."""
+        index.store_dir("/home/user", OLD_MTIME, [("a", False)])
+        assert index.list_dir("/home/user", OLD_MTIME + 1) is None
+
+    def test_racy_mtime_not_cached(self, index):
+        """Test directories modified just now are not cached."""
+        index.store_dir("/home/user", time.time_ns(), [("a", False)])
+        assert index.list_dir("/home/user", time.time_ns()) is None
+
+    def test_invalidate(self, index):
+        """Test invalidate drops the listing."""
+        index.store_dir("/home/user", OLD_MTIME, [("a", False)])
+        index.invalidate("/home/user")
+        assert index.list_dir("/home/user", OLD_MTIME) is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Tests for RAPP iMessage Bridge
+
+Run: pytest tests/test_imessage_bridge.py -v
+"""
+
+import sqlite3
+import pytest
+from types import SimpleNamespace
+
+import imessage_bridge
+from imessage_bridge import iMessageBridge
+
+
+CHAT_DB_SCHEMA = """
+    CREATE TABLE handle (ROWID INTEGER PRIMARY KEY, id TEXT, service TEXT);
+    CREATE TABLE message (
+        ROWID INTEGER PRIMARY KEY, text TEXT, is_from_me INTEGER,
+        date INTEGER, handle_id INTEGER
+    );
+"""
+
+
+@pytest.fixture
+def chat_db(tmp_path, monkeypatch):
+    """An empty chat.db stand-in; returns add(sender, text, is_from_me=0)."""
+    path = tmp_path / "chat.db"
+    conn = sqlite3.connect(path)
+    conn.executescript(CHAT_DB_SCHEMA)
+    monkeypatch.setattr(imessage_bridge, "IMESSAGE_DB", path)
+
+    def add(sender, text, is_from_me=0):
+        row = conn.execute("SELECT ROWID FROM handle WHERE id = ?", (sender,)).fetchone()
+        handle = row[0] if row else conn.execute(
+            "INSERT INTO handle (id, service) VALUES (?, 'iMessage')", (sender,)
+        ).lastrowid
+        msg_id = conn.execute(
+            "INSERT INTO message (text, is_from_me, date, handle_id) VALUES (?, ?, 0, ?)",
+            (text, is_from_me, handle)
+        ).lastrowid
+        conn.commit()
+        return msg_id
+
+    yield add
+    conn.close()
+
+
+@pytest.fixture
+def osascript_runs(monkeypatch):
+    """Record osascript command lines instead of running them."""
+    runs = []
+
+    def run(cmd, **kwargs):
+        runs.append((cmd, kwargs))
+        return SimpleNamespace(returncode=0, stdout="", stderr="")
+
+    monkeypatch.setattr(imessage_bridge.subprocess, "run", run)
+    return runs
+
+
+@pytest.fixture
+def bridge_factory(tmp_path, monkeypatch, osascript_runs):
+    """Build bridges whose config and checkpoint live in tmp_path and that never send."""
+    monkeypatch.setattr(imessage_bridge, "BRIDGE_CONFIG", tmp_path / "imessage_bridge.json")
+    monkeypatch.setattr(imessage_bridge, "LAST_ID_FILE", tmp_path / "imessage_last_id.bin")
+    monkeypatch.setattr(imessage_bridge, "_AppleScriptDaemon", None)
+    monkeypatch.setattr(imessage_bridge, "_compile_send_script", lambda: None)
+    return iMessageBridge
+
+
+class TestMonitorLoop:
+    """Tests for the start() monitoring loop."""
+
+    def test_interrupt_checkpoints_last_id(self, chat_db, bridge_factory, osascript_runs):
+        """Test Ctrl+C mid-poll still writes the last handed-out message ID."""
+        for text in ("/rapp one", "/rapp two", "/rapp three"):
+            chat_db("+15551234567", text)
+
+        def processor(user_input, **kwargs):
+            if user_input == "three":
+                raise KeyboardInterrupt
+            return {"response": "OK"}
+
+        bridge = bridge_factory()
+        bridge.set_processor(processor)
+        assert bridge.start() is True
+
+        assert bridge._last_id_fd is None
+        assert imessage_bridge.LAST_ID_FILE.read_bytes() == (3).to_bytes(8, "little")
+        assert osascript_runs[-1][0][3:] == ["+15551234567", "OK", "+15551234567", "OK"]
+        # A restarted bridge resumes after the interrupted message
+        assert bridge_factory().last_message_id == 3
+
+    def test_stop_leaves_teardown_to_monitor_thread(self, chat_db, bridge_factory):
+        """Test stop() only signals; the monitor thread's finally closes resources."""
+        bridge = bridge_factory()
+        bridge.running = True
+        conn = bridge._db()
+        helper = bridge._osa = SimpleNamespace(run=lambda statement: None)
+        bridge.last_message_id = 1
+        bridge._checkpoint_last_id(force=True)
+        fd = bridge._last_id_fd
+        bridge.last_message_id = 2
+
+        bridge.stop()
+
+        assert not bridge.running
+        assert bridge._wakeup.is_set()
+        assert bridge._conn is conn
+        assert bridge._osa is helper
+        assert bridge._last_id_fd == fd
+        assert imessage_bridge.LAST_ID_FILE.read_bytes() == (1).to_bytes(8, "little")
+        conn.execute("SELECT 1")  # Still usable by an in-flight poll
+        bridge._close_db()
+        bridge._close_last_id()
+
+
+class TestReadingMessages:
+    """Tests for streaming new rows out of chat.db."""
+
+    def test_whitelist_filtered_in_query(self, chat_db, bridge_factory):
+        """Test only whitelisted handles come back from the chat.db query."""
+        chat_db("+15551234567", "allowed")
+        chat_db("+15559999999", "blocked")
+        chat_db("+15551234567", "mine", is_from_me=1)
+        chat_db("5551234567", "allowed, no country code")
+
+        bridge = bridge_factory(allowed_numbers=["+1 (555) 123-4567"])
+        bridge.running = True
+        texts = [m["text"] for m in bridge._get_new_messages()]
+
+        assert texts == ["allowed", "allowed, no country code"]
+        assert bridge.last_message_id == 4
+
+    def test_whitelist_short_numbers_match_as_suffix(self, chat_db, bridge_factory):
+        """Test whitelisted short codes match in the query and in _is_allowed."""
+        chat_db("72345", "short code")
+        chat_db("+4472345", "short national number")
+        chat_db("2345", "too short")
+        chat_db("+15559999999", "blocked")
+
+        bridge = bridge_factory(allowed_numbers=["+15551234567", "72345"])
+        bridge.running = True
+        messages = list(bridge._get_new_messages())
+
+        assert [m["text"] for m in messages] == ["short code", "short national number"]
+        assert all(bridge._is_allowed(m["from"]) for m in messages)
+        assert not bridge._is_allowed("2345")
+
+    def test_whitelist_follows_changes(self, chat_db, bridge_factory):
+        """Test adding a number reloads the open connection's temp table."""
+        chat_db("+15559999999", "first")
+        bridge = bridge_factory(allowed_numbers=["+15551234567"])
+        bridge.running = True
+        assert list(bridge._get_new_messages()) == []
+
+        bridge.add_allowed_number("+15559999999")
+        chat_db("+15559999999", "second")
+        assert [m["text"] for m in bridge._get_new_messages()] == ["second"]
+
+    def test_high_water_skips_filtered_rows(self, chat_db, bridge_factory):
+        """Test last_message_id moves past rows the whitelist filters out."""
+        for _ in range(3):
+            chat_db("+15559999999", "blocked")
+
+        bridge = bridge_factory(allowed_numbers=["+15551234567"])
+        bridge.running = True
+        assert list(bridge._get_new_messages()) == []
+        assert bridge.last_message_id == 3
+
+    def test_stop_mid_stream_resumes_after_last_yielded(self, chat_db, bridge_factory, monkeypatch):
+        """Test stopping between fetchmany batches leaves the rest for the next poll."""
+        monkeypatch.setattr(imessage_bridge, "FETCH_BATCH", 2)
+        for i in range(5):
+            chat_db("+15551234567", f"m{i}")
+
+        bridge = bridge_factory()
+        bridge.running = True
+        seen = []
+        for msg in bridge._get_new_messages():
+            seen.append(msg["text"])
+            bridge.running = False  # Takes effect at the next batch
+
+        assert seen == ["m0", "m1"]
+        assert bridge.last_message_id == 2
+
+        bridge.running = True
+        assert [m["text"] for m in bridge._get_new_messages()] == ["m2", "m3", "m4"]
+
+
+class TestLastIdCheckpoint:
+    """Tests for persisting last_message_id."""
+
+    def test_checkpoints_coalesced(self, bridge_factory):
+        """Test checkpoints are written at most once per CHECKPOINT_SEC unless forced."""
+        bridge = bridge_factory()
+        path = imessage_bridge.LAST_ID_FILE
+
+        bridge.last_message_id = 1
+        bridge._checkpoint_last_id()
+        assert path.read_bytes() == (1).to_bytes(8, "little")
+
+        bridge.last_message_id = 2
+        bridge._checkpoint_last_id()
+        assert path.read_bytes() == (1).to_bytes(8, "little")  # Within the window
+
+        bridge._checkpoint_last_id(force=True)
+        assert path.read_bytes() == (2).to_bytes(8, "little")
+        bridge._close_last_id()
+
+    def test_checkpoint_loaded_over_config(self, bridge_factory):
+        """Test a newer checkpoint file wins over the config's copy."""
+        imessage_bridge.BRIDGE_CONFIG.write_text('{"last_message_id": 5}')
+        imessage_bridge.LAST_ID_FILE.write_bytes((9).to_bytes(8, "little"))
+        assert bridge_factory().last_message_id == 9
+
+
+class TestSending:
+    """Tests for reply delivery."""
+
+    def test_helper_statement_quotes_text(self, bridge_factory):
+        """Test replies sent through the osascript helper are quoted literals."""
+        statements = []
+        bridge = bridge_factory()
+        bridge._osa = SimpleNamespace(run=statements.append)
+
+        assert bridge._send_via_helper([("+15551234567", 'Say "hi"\nbye \\o/')]) is True
+        assert statements == [
+            'tell application "Messages" to send "Say \\"hi\\"\\nbye \\\\o/" to participant '
+            '"+15551234567" of (1st account whose service type = iMessage)'
+        ]
+
+    def test_send_script_argv_layout(self, bridge_factory, osascript_runs, tmp_path):
+        """Test replies go to the send handler as recipient, body argv pairs."""
+        bridge = bridge_factory()
+        bridge._run_send_script([("+15551111111", "one"), ("+15552222222", 'two "2"')])
+        cmd, kwargs = osascript_runs[-1]
+        assert cmd == ["/usr/bin/osascript", "-e", imessage_bridge.SEND_SCRIPT_SOURCE,
+                       "+15551111111", "one", "+15552222222", 'two "2"']
+        assert kwargs["timeout"] == 14
+
+        bridge._send_script = tmp_path / "send.scpt"
+        bridge._run_send_script([("+15551111111", "one")])
+        cmd, kwargs = osascript_runs[-1]
+        assert cmd == ["/usr/bin/osascript", str(tmp_path / "send.scpt"), "+15551111111", "one"]
+        assert kwargs["timeout"] == 10
+
+    def test_send_script_shared_with_system_agent(self, tmp_path, monkeypatch, osascript_runs):
+        """Test the one-shot send script is SystemAgent's compiled template."""
+        from rapp_os.agents import system_agent
+
+        monkeypatch.setattr(system_agent, "CACHE_DIR", tmp_path)
+        monkeypatch.setattr(system_agent, "_compiled_scripts", set())
+
+        assert imessage_bridge._compile_send_script() == tmp_path / "send_imessage.scpt"
+        assert osascript_runs[-1][0][0] == "/usr/bin/osacompile"
+        assert imessage_bridge.SEND_SCRIPT_SOURCE is system_agent._SCRIPT_SOURCES["send_imessage"]
+
+    def test_failed_send_reported(self, bridge_factory, monkeypatch):
+        """Test a non-zero osascript exit is a failed send, not a delivered one."""
+        def run(cmd, **kwargs):
+            return SimpleNamespace(returncode=1, stdout="", stderr="execution error: nope (-1728)")
+
+        monkeypatch.setattr(imessage_bridge.subprocess, "run", run)
+        bridge = bridge_factory()
+        assert bridge._send_imessage("+15551111111", "one") is False
+        assert bridge._send_imessages([("+15551111111", "one"), ("+15552222222", "two")]) is False
+
+    def test_replies_batched_per_poll(self, bridge_factory, osascript_runs):
+        """Test replies queued during a poll go out in one osascript run."""
+        bridge = bridge_factory()
+        bridge._pending_replies = []
+        bridge._reply("+15551111111", "one")
+        bridge._reply("+15552222222", "two")
+        assert osascript_runs == []
+
+        bridge._flush_replies()
+        assert len(osascript_runs) == 1
+        assert bridge._pending_replies is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
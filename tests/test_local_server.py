@@ -6,30 +6,59 @@ Run: pytest tests/test_local_server.py -v
 """
 
 import os
-import sys
 import json
 import pytest
 import tempfile
 import threading
-import time
-import requests
-from pathlib import Path
+from http.client import HTTPConnection
 from unittest.mock import Mock, patch, MagicMock
 
-# Add rapp_os to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os" / "core"))
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os"))
-
 
 @pytest.fixture
 def mock_brain_stem(tmp_path):
     """Create a mock brain stem for testing."""
-    with patch('local_server.RAPP_HOME', tmp_path):
-        with patch('brain_stem.RAPP_HOME', tmp_path):
-            with patch('brain_stem.AGENTS_DIR', tmp_path / "agents"):
-                with patch('brain_stem.CONTEXTS_DIR', tmp_path / "contexts"):
-                    with patch('brain_stem.MEMORY_DIR', tmp_path / "memory"):
-                        yield
+    with patch.multiple(
+        'brain_stem',
+        RAPP_HOME=tmp_path,
+        AGENTS_DIR=tmp_path / "agents",
+        CONTEXTS_DIR=tmp_path / "contexts",
+        MEMORY_DIR=tmp_path / "memory"
+    ):
+        yield
+
+
+@pytest.fixture(scope="module")
+def live_server():
+    """Start one server, with the brain stem mocked, for the module's endpoint tests."""
+    from local_server import RappLocalServer
+
+    with patch('local_server.process_request') as mock_process:
+        mock_process.return_value = {
+            "response": "Test response",
+            "voice_response": "",
+            "agent_logs": [],
+            "agents_used": [],
+            "session_guid": "test_session",
+            "context_guid": "default"
+        }
+
+        with patch('local_server.get_brain_stem') as mock_brain:
+            mock_context = MagicMock()
+            mock_context.guid = "new_context_id"
+            mock_context.name = "Test Context"
+
+            mock_brain_instance = MagicMock()
+            mock_brain_instance.agent_registry.list_agents.return_value = []
+            mock_brain_instance.context_manager.list_contexts.return_value = []
+            mock_brain_instance.context_manager.create_context.return_value = mock_context
+            mock_brain.return_value = mock_brain_instance
+
+            server = RappLocalServer(port=0)
+            server.start()  # Listening once start() returns
+
+            yield server, mock_process, mock_brain_instance
+
+            server.stop()
 
 
 class TestRappLocalServer:
@@ -52,81 +81,73 @@ class TestRappLocalServer:
         assert server.port == 8080
 
 
+@pytest.mark.integration
 class TestServerEndpoints:
     """Tests for HTTP endpoints."""
 
     @pytest.fixture
-    def running_server(self, tmp_path):
-        """Start a server for testing."""
-        from local_server import RappLocalServer
-
-        with patch('local_server.process_request') as mock_process:
-            mock_process.return_value = {
-                "response": "Test response",
-                "voice_response": "",
-                "agent_logs": [],
-                "agents_used": [],
-                "session_guid": "test_session",
-                "context_guid": "default"
-            }
-
-            with patch('local_server.get_brain_stem') as mock_brain:
-                mock_brain_instance = MagicMock()
-                mock_brain_instance.agent_registry.list_agents.return_value = []
-                mock_brain_instance.context_manager.list_contexts.return_value = []
-                mock_brain.return_value = mock_brain_instance
-
-                server = RappLocalServer(port=7999)
-                server.start()
-                time.sleep(0.2)  # Wait for server to start
+    def running_server(self, live_server):
+        """The shared server, with a fresh call history on the process mock."""
+        server, mock_process, _ = live_server
+        mock_process.reset_mock()
+        return server, mock_process
 
-                yield server, mock_process
-
-                server.stop()
-
-    def test_health_endpoint(self, running_server):
+    def test_health_endpoint(self, running_server, http):
         """Test /health endpoint returns OK."""
         server, _ = running_server
-        response = requests.get(f"http://127.0.0.1:{server.port}/health")
+        response = http.get(f"http://127.0.0.1:{server.port}/health")
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "ok"
         assert data["service"] == "rapp-brain-stem"
 
-    def test_agents_endpoint(self, running_server):
+    def test_agents_endpoint(self, running_server, http):
         """Test /agents endpoint returns agent list."""
         server, _ = running_server
-        response = requests.get(f"http://127.0.0.1:{server.port}/agents")
+        response = http.get(f"http://127.0.0.1:{server.port}/agents")
         assert response.status_code == 200
         data = response.json()
         assert "agents" in data
 
-    def test_contexts_endpoint(self, running_server):
+    def test_agents_endpoint_etag(self, running_server, http):
+        """Test /agents answers 304 to a matching If-None-Match."""
+        server, _ = running_server
+        url = f"http://127.0.0.1:{server.port}/agents"
+        etag = http.get(url).headers["ETag"]
+
+        response = http.get(url, headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        assert response.content == b""
+
+        response = http.get(url, headers={"If-None-Match": 'W/"stale"'})
+        assert response.status_code == 200
+
+    def test_contexts_endpoint(self, running_server, http):
         """Test /contexts endpoint returns context list."""
         server, _ = running_server
-        response = requests.get(f"http://127.0.0.1:{server.port}/contexts")
+        response = http.get(f"http://127.0.0.1:{server.port}/contexts")
         assert response.status_code == 200
         data = response.json()
         assert "contexts" in data
 
-    def test_reload_endpoint(self, running_server):
+    def test_reload_endpoint(self, running_server, http):
         """Test /reload endpoint triggers reload."""
         server, _ = running_server
-        response = requests.get(f"http://127.0.0.1:{server.port}/reload")
+        response = http.get(f"http://127.0.0.1:{server.port}/reload")
         assert response.status_code == 200
         data = response.json()
         assert data["status"] == "reloaded"
 
-    def test_not_found_endpoint(self, running_server):
+    def test_not_found_endpoint(self, running_server, http):
         """Test unknown endpoint returns 404."""
         server, _ = running_server
-        response = requests.get(f"http://127.0.0.1:{server.port}/unknown")
+        response = http.get(f"http://127.0.0.1:{server.port}/unknown")
         assert response.status_code == 404
 
-    def test_chat_endpoint(self, running_server):
+    def test_chat_endpoint(self, running_server, http):
         """Test /api/rapp chat endpoint."""
         server, mock_process = running_server
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{server.port}/api/rapp",
             json={"user_input": "Hello"}
         )
@@ -135,10 +156,88 @@ class TestServerEndpoints:
         assert "response" in data
         mock_process.assert_called()
 
-    def test_chat_endpoint_missing_input(self, running_server):
+    def test_chat_stream_endpoint(self, running_server, http):
+        """Test /api/rapp/stream sends Server-Sent Events."""
+        server, _ = running_server
+
+        def events(**kwargs):
+            yield {"delta": "Hel"}
+            yield {"delta": "lo"}
+            yield {"done": True, "response": "Hello"}
+
+        with patch('local_server.stream_request', side_effect=events):
+            response = http.post(
+                f"http://127.0.0.1:{server.port}/api/rapp/stream",
+                json={"user_input": "Hi"}
+            )
+        assert response.status_code == 200
+        assert response.headers["Content-Type"] == "text/event-stream"
+        lines = [line for line in response.text.split("\n") if line]
+        assert [json.loads(line[len("data: "):]) for line in lines] == [
+            {"delta": "Hel"}, {"delta": "lo"}, {"done": True, "response": "Hello"}
+        ]
+
+    def test_chat_stream_error_event(self, running_server, http):
+        """Test a failure mid-stream ends the stream with an error event."""
+        server, _ = running_server
+
+        def events(**kwargs):
+            yield {"delta": "Hel"}
+            raise RuntimeError("boom")
+
+        with patch('local_server.stream_request', side_effect=events):
+            response = http.post(
+                f"http://127.0.0.1:{server.port}/api/rapp/stream",
+                json={"user_input": "Hi"}
+            )
+        lines = [line for line in response.text.split("\n") if line]
+        assert [json.loads(line[len("data: "):]) for line in lines] == [
+            {"delta": "Hel"}, {"error": "boom"}
+        ]
+
+    def test_batch_endpoint(self, running_server, http):
+        """Test /api/rapp/batch returns one response per request, in order."""
+        server, _ = running_server
+
+        def batch(entries):
+            return [{"response": e["user_input"].upper()} for e in entries]
+
+        with patch('local_server.process_batch', side_effect=batch) as mock_batch:
+            response = http.post(
+                f"http://127.0.0.1:{server.port}/api/rapp/batch",
+                json={"requests": [{"user_input": "a"}, {"message": "b", "context_guid": "ctx"}]}
+            )
+        assert response.status_code == 200
+        assert response.json() == {"responses": [{"response": "A"}, {"response": "B"}]}
+        assert mock_batch.call_args[0][0][1]["context_guid"] == "ctx"
+
+        response = http.post(
+            f"http://127.0.0.1:{server.port}/api/rapp/batch",
+            json={"requests": [{"user_input": "a"}, {}]}
+        )
+        assert response.status_code == 400
+
+    def test_handler_error_returns_500(self, running_server, http):
+        """Test an exception while processing is answered on the same connection."""
+        server, mock_process = running_server
+        mock_process.side_effect = RuntimeError("boom")
+        try:
+            response = http.post(
+                f"http://127.0.0.1:{server.port}/api/rapp",
+                json={"user_input": "Hello"}
+            )
+        finally:
+            mock_process.side_effect = None
+        assert response.status_code == 500
+        assert "boom" in response.json()["error"]
+
+        # The keep-alive connection is still usable
+        assert http.get(f"http://127.0.0.1:{server.port}/health").status_code == 200
+
+    def test_chat_endpoint_missing_input(self, running_server, http):
         """Test chat endpoint requires user_input."""
         server, _ = running_server
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{server.port}/api/rapp",
             json={}
         )
@@ -146,19 +245,19 @@ class TestServerEndpoints:
         data = response.json()
         assert "error" in data
 
-    def test_chat_with_message_key(self, running_server):
+    def test_chat_with_message_key(self, running_server, http):
         """Test chat endpoint accepts 'message' as alternative key."""
         server, mock_process = running_server
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{server.port}/api/rapp",
             json={"message": "Hello via message key"}
         )
         assert response.status_code == 200
 
-    def test_chat_with_all_params(self, running_server):
+    def test_chat_with_all_params(self, running_server, http):
         """Test chat endpoint with all parameters."""
         server, mock_process = running_server
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{server.port}/api/chat",
             json={
                 "user_input": "Hello",
@@ -180,77 +279,42 @@ class TestServerEndpoints:
         assert call_kwargs["context_guid"] == "test_context"
 
 
+@pytest.mark.integration
 class TestCORS:
     """Tests for CORS headers."""
 
     @pytest.fixture
-    def running_server(self):
-        """Start a server for CORS testing."""
-        from local_server import RappLocalServer
-
-        with patch('local_server.process_request') as mock_process:
-            mock_process.return_value = {
-                "response": "OK",
-                "voice_response": "",
-                "agent_logs": [],
-                "agents_used": [],
-                "session_guid": "",
-                "context_guid": ""
-            }
+    def running_server(self, live_server):
+        """The shared server."""
+        return live_server[0]
 
-            with patch('local_server.get_brain_stem') as mock_brain:
-                mock_brain.return_value = MagicMock()
-
-                server = RappLocalServer(port=7998)
-                server.start()
-                time.sleep(0.2)
-
-                yield server
-
-                server.stop()
-
-    def test_cors_headers_present(self, running_server):
+    def test_cors_headers_present(self, running_server, http):
         """Test CORS headers are present in response."""
-        response = requests.get(f"http://127.0.0.1:{running_server.port}/health")
+        response = http.get(f"http://127.0.0.1:{running_server.port}/health")
         assert "Access-Control-Allow-Origin" in response.headers
         assert response.headers["Access-Control-Allow-Origin"] == "*"
 
-    def test_options_preflight(self, running_server):
+    def test_options_preflight(self, running_server, http):
         """Test OPTIONS preflight request."""
-        response = requests.options(f"http://127.0.0.1:{running_server.port}/api/rapp")
+        response = http.options(f"http://127.0.0.1:{running_server.port}/api/rapp")
         assert response.status_code == 200
         assert "Access-Control-Allow-Methods" in response.headers
 
 
+@pytest.mark.integration
 class TestContextCreation:
     """Tests for context creation endpoint."""
 
     @pytest.fixture
-    def running_server(self):
-        """Start a server for context testing."""
-        from local_server import RappLocalServer
-
-        with patch('local_server.get_brain_stem') as mock_brain:
-            mock_context = MagicMock()
-            mock_context.guid = "new_context_id"
-            mock_context.name = "Test Context"
-
-            mock_brain_instance = MagicMock()
-            mock_brain_instance.context_manager.create_context.return_value = mock_context
-            mock_brain.return_value = mock_brain_instance
-
-            server = RappLocalServer(port=7997)
-            server.start()
-            time.sleep(0.2)
-
-            yield server, mock_brain_instance
+    def running_server(self, live_server):
+        """The shared server and its mocked brain stem."""
+        server, _, mock_brain_instance = live_server
+        return server, mock_brain_instance
 
-            server.stop()
-
-    def test_create_context_endpoint(self, running_server):
+    def test_create_context_endpoint(self, running_server, http):
         """Test /api/context/create endpoint."""
         server, mock_brain = running_server
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{server.port}/api/context/create",
             json={
                 "name": "Test Context",
@@ -264,28 +328,18 @@ class TestContextCreation:
         assert "name" in data
 
 
+@pytest.mark.integration
 class TestInvalidJSON:
     """Tests for invalid JSON handling."""
 
     @pytest.fixture
-    def running_server(self):
-        """Start a server for JSON testing."""
-        from local_server import RappLocalServer
-
-        with patch('local_server.get_brain_stem') as mock_brain:
-            mock_brain.return_value = MagicMock()
-
-            server = RappLocalServer(port=7996)
-            server.start()
-            time.sleep(0.2)
+    def running_server(self, live_server):
+        """The shared server."""
+        return live_server[0]
 
-            yield server
-
-            server.stop()
-
-    def test_invalid_json_body(self, running_server):
+    def test_invalid_json_body(self, running_server, http):
         """Test handling of invalid JSON in request body."""
-        response = requests.post(
+        response = http.post(
             f"http://127.0.0.1:{running_server.port}/api/rapp",
             data="not valid json",
             headers={"Content-Type": "application/json"}
@@ -295,7 +349,20 @@ class TestInvalidJSON:
         assert "error" in data
         assert "Invalid JSON" in data["error"]
 
+    @pytest.mark.parametrize("body", ["[]", '"x"', "1"])
+    def test_non_object_body(self, running_server, http, body):
+        """Test a JSON body that is not an object gets a 400, not a dropped connection."""
+        for path in ("/api/rapp", "/api/rapp/batch", "/api/context/create"):
+            response = http.post(
+                f"http://127.0.0.1:{running_server.port}{path}",
+                data=body,
+                headers={"Content-Type": "application/json"}
+            )
+            assert response.status_code == 400
+            assert "JSON object" in response.json()["error"]
 
+
+@pytest.mark.integration
 class TestServerLifecycle:
     """Tests for server start/stop lifecycle."""
 
@@ -306,24 +373,37 @@ class TestServerLifecycle:
         with patch('local_server.get_brain_stem') as mock_brain:
             mock_brain.return_value = MagicMock()
 
-            server = RappLocalServer(port=7995)
+            server = RappLocalServer(port=0)
             server.start()
-            time.sleep(0.2)
 
             # Verify server is running
+            conn = HTTPConnection("127.0.0.1", server.port, timeout=1)
             try:
-                response = requests.get(f"http://127.0.0.1:{server.port}/health", timeout=1)
-                assert response.status_code == 200
-            except requests.exceptions.ConnectionError:
+                conn.request("GET", "/health")
+                assert conn.getresponse().status == 200
+            except ConnectionError:
                 pytest.fail("Server did not start")
+            finally:
+                conn.close()
 
             # Stop server
             server.stop()
-            time.sleep(0.2)
 
             # Verify server is stopped
-            with pytest.raises(requests.exceptions.ConnectionError):
-                requests.get(f"http://127.0.0.1:{server.port}/health", timeout=1)
+            conn = HTTPConnection("127.0.0.1", server.port, timeout=1)
+            with pytest.raises(ConnectionError):
+                conn.request("GET", "/health")
+
+    def test_stop_closes_brain_stem(self):
+        """Test stopping the server flushes and closes the brain stem's memory files."""
+        from local_server import RappLocalServer
+
+        with patch('local_server.close_brain_stem') as mock_close:
+            server = RappLocalServer(port=0)
+            server.start()
+            server.stop()
+
+        mock_close.assert_called_once_with()
 
 
 if __name__ == "__main__":
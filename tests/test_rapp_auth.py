@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Tests for RAPP Authentication
+
+Run: pytest tests/test_rapp_auth.py -v
+"""
+
+import os
+import time
+import asyncio
+import pytest
+
+import rapp_auth
+from rapp_auth import RappAuth, RappAuthConfig, RappUser, RappPlan, DeviceCodeResponse, AuthError
+
+
+TOKEN_DATA = {
+    "access_token": "access",
+    "refresh_token": "refresh",
+    "token_type": "Bearer",
+    "expires_in": 3600,
+}
+
+USER = RappUser(user_id="u1", email="user@example.com", name="User", plan=RappPlan.PRO)
+
+# The real sleep, for fakes that only need to yield to the event loop
+_yield = asyncio.sleep
+
+
+class _FakeResponse:
+    """An aiohttp response stand-in usable as an async context manager."""
+
+    def __init__(self, status, data):
+        self.status = status
+        self._data = data
+
+    async def json(self):
+        return self._data
+
+    async def text(self):
+        return str(self._data)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class _FakeSession:
+    """An aiohttp session stand-in that answers posts from a list of responses."""
+
+    closed = False
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.posts = []
+
+    def post(self, url, data=None):
+        self.posts.append((url, data))
+        return self.responses.pop(0)
+
+    def head(self, url):
+        return _FakeResponse(200, {})
+
+    async def close(self):
+        self.closed = True
+
+
+def _device_code(expires_in=600, interval=5):
+    return DeviceCodeResponse(
+        device_code="device", user_code="ABCD-EFGH",
+        verification_uri="https://rapp.ai/device",
+        verification_uri_complete="https://rapp.ai/device?user_code=ABCD-EFGH",
+        expires_in=expires_in, interval=interval
+    )
+
+
+@pytest.fixture
+def auth(tmp_path, monkeypatch):
+    """A RappAuth whose credentials live in tmp_path and that never opens a socket."""
+    monkeypatch.setattr(RappAuthConfig, "TOKEN_DIR", tmp_path / "auth")
+    monkeypatch.setattr(RappAuthConfig, "TOKEN_FILE", tmp_path / "auth" / "credentials.json")
+    auth = RappAuth()
+    auth._api_client = False  # No httpx client
+
+    async def fetch_user_info(access_token):
+        await _yield(0)  # Yield like a real request
+        return USER
+
+    monkeypatch.setattr(auth, "_fetch_user_info", fetch_user_info)
+    return auth
+
+
+class _Clock:
+    """Stands in for the time module in rapp_auth; monotonic() only moves on sleep."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Virtual time for poll_for_token: sleeps are recorded and return at once."""
+    clock = _Clock()
+
+    async def sleep(delay):
+        clock.sleeps.append(delay)
+        clock.now += delay
+        await _yield(0)
+
+    monkeypatch.setattr(rapp_auth, "time", clock)
+    monkeypatch.setattr(rapp_auth.asyncio, "sleep", sleep)
+    monkeypatch.setattr(rapp_auth.random, "uniform", lambda a, b: b)  # Full jitter
+    return clock
+
+
+class TestCredentialStorage:
+    """Tests for saving and loading credentials.json."""
+
+    def _token(self, **overrides):
+        return rapp_auth.TokenResponse(**{"scope": "", **TOKEN_DATA, **overrides})
+
+    def test_saved_private_and_atomically(self, auth):
+        """Test credentials are written 0600 with no temp file left behind."""
+        token_file = RappAuthConfig.TOKEN_FILE
+        # A stale temp file from a crash must not lend its mode to the new one
+        stale = token_file.with_suffix(".tmp")
+        stale.write_bytes(b"{}")
+        os.chmod(stale, 0o644)
+
+        auth._save_credentials(self._token(), USER)
+
+        assert token_file.stat().st_mode & 0o777 == 0o600
+        assert not stale.exists()
+        token, user = auth._load_credentials()
+        assert token.access_token == "access"
+        assert user == USER
+
+    def test_failed_write_keeps_previous_file(self, auth, monkeypatch):
+        """Test a write that fails part-way leaves the old credentials intact."""
+        auth._save_credentials(self._token(), USER)
+        before = RappAuthConfig.TOKEN_FILE.read_bytes()
+
+        def boom(data):
+            raise OSError("disk full")
+
+        monkeypatch.setattr(rapp_auth, "_dumps", boom)
+        with pytest.raises(OSError):
+            auth._save_credentials(self._token(access_token="new"), USER)
+
+        assert RappAuthConfig.TOKEN_FILE.read_bytes() == before
+        assert not RappAuthConfig.TOKEN_FILE.with_suffix(".tmp").exists()
+
+    def test_parse_cached_until_file_changes(self, auth):
+        """Test the parsed credentials are reused while st_mtime_ns is unchanged."""
+        token_file = RappAuthConfig.TOKEN_FILE
+        auth._save_credentials(self._token(), USER)
+        first = auth._load_credentials()
+        assert auth._load_credentials() is first
+
+        # Another process refreshes the token
+        other = RappAuth()
+        other._save_credentials(self._token(access_token="refreshed"), USER)
+        mtime = token_file.stat().st_mtime_ns + 1_000_000
+        os.utime(token_file, ns=(mtime, mtime))
+
+        assert auth._load_credentials()[0].access_token == "refreshed"
+
+    def test_logout_drops_cached_credentials(self, auth):
+        """Test logout removes the file and the cached parse."""
+        auth._save_credentials(self._token(), USER)
+        assert auth.is_authenticated()
+
+        auth.logout()
+
+        assert not RappAuthConfig.TOKEN_FILE.exists()
+        assert auth._load_credentials() is None
+        assert not auth.is_authenticated()
+
+
+class TestIsAuthenticated:
+    """Tests for the in-memory token fast path."""
+
+    def _signed_in(self, auth, valid_for):
+        auth._save_credentials(rapp_auth.TokenResponse(scope="", **TOKEN_DATA), USER)
+        auth._token, auth._current_user = auth._load_credentials()
+        auth._token_valid_until = time.time() + valid_for
+        return auth
+
+    def test_valid_token_skips_disk(self, auth, monkeypatch):
+        """Test a token inside its lifetime is trusted without reading the file."""
+        self._signed_in(auth, valid_for=60)
+
+        def no_disk():
+            raise AssertionError("read credentials from disk")
+
+        monkeypatch.setattr(auth, "_load_credentials", no_disk)
+        assert auth.is_authenticated()
+
+    def test_expired_token_rechecks_disk(self, auth, monkeypatch):
+        """Test a token past its lifetime sends is_authenticated back to the file."""
+        self._signed_in(auth, valid_for=-1)
+        loads = []
+        monkeypatch.setattr(auth, "_load_credentials", lambda: loads.append(1) or None)
+
+        auth.is_authenticated()
+        assert loads == [1]
+
+    def test_valid_until_set_margin_before_expiry(self, auth):
+        """Test saving a token trusts it until TOKEN_EXPIRY_MARGIN before it expires."""
+        before = time.time()
+        auth._save_credentials(rapp_auth.TokenResponse(scope="", **TOKEN_DATA), USER)
+        expected = before + TOKEN_DATA["expires_in"] - rapp_auth.TOKEN_EXPIRY_MARGIN
+        assert expected <= auth._token_valid_until <= expected + 5
+
+
+class TestDeviceFlowPolling:
+    """Tests for poll_for_token."""
+
+    @pytest.fixture
+    def no_warm_up(self, auth, monkeypatch):
+        """Skip the API warm-up request."""
+        async def warm():
+            pass
+
+        monkeypatch.setattr(auth, "_warm_api_connection", warm)
+
+    def test_interval_clamped_to_five_seconds(self, auth, clock, no_warm_up):
+        """Test the server cannot make us poll faster than every 5s."""
+        auth._session = _FakeSession([
+            _FakeResponse(400, {"error": "authorization_pending"}),
+            _FakeResponse(200, TOKEN_DATA),
+        ])
+
+        token = asyncio.run(auth.poll_for_token(_device_code(interval=1)))
+
+        assert token.access_token == "access"
+        assert clock.sleeps == [6.0]  # 5s plus 20% jitter
+        assert auth.is_authenticated()
+
+    def test_slow_down_backs_off(self, auth, clock, no_warm_up):
+        """Test slow_down adds 5s to the interval."""
+        auth._session = _FakeSession([
+            _FakeResponse(400, {"error": "authorization_pending"}),
+            _FakeResponse(400, {"error": "slow_down"}),
+            _FakeResponse(200, TOKEN_DATA),
+        ])
+
+        asyncio.run(auth.poll_for_token(_device_code()))
+        assert clock.sleeps == [6.0, 12.0]
+
+    def test_deadline_caps_the_wait(self, auth, clock, no_warm_up):
+        """Test polling never sleeps past expires_in and then times out."""
+        auth._session = _FakeSession([
+            _FakeResponse(400, {"error": "authorization_pending"}) for _ in range(3)
+        ])
+
+        with pytest.raises(AuthError, match="timed out"):
+            asyncio.run(auth.poll_for_token(_device_code(expires_in=10)))
+
+        assert clock.sleeps == [6.0, 4.0]
+        assert len(auth._session.posts) == 2
+
+    @pytest.fixture
+    def warm_tasks(self, auth, monkeypatch):
+        """Replace the API warm-up with one that never finishes; returns its tasks."""
+        tasks = []
+
+        async def warm():
+            tasks.append(asyncio.current_task())
+            await asyncio.Event().wait()
+
+        monkeypatch.setattr(auth, "_warm_api_connection", warm)
+        return tasks
+
+    @pytest.mark.parametrize("response,raises", [
+        (_FakeResponse(200, TOKEN_DATA), None),
+        (_FakeResponse(400, {"error": "access_denied"}), AuthError),
+    ])
+    def test_warm_up_cancelled_when_poll_ends(self, auth, warm_tasks, response, raises):
+        """Test a pending warm-up is cancelled before poll_for_token returns or raises."""
+        auth._session = _FakeSession([response])
+
+        async def poll():
+            try:
+                await auth.poll_for_token(_device_code())
+            except AuthError:
+                if raises is None:
+                    raise
+            else:
+                assert raises is None
+            await asyncio.sleep(0)  # A leaked warm-up would start running here
+            return [task.done() for task in warm_tasks], asyncio.all_tasks()
+
+        done, tasks = asyncio.run(poll())
+        assert all(done)
+        assert len(tasks) == 1  # Only poll() itself
+
+
+class TestAuthHeaders:
+    """Tests for get_auth_headers."""
+
+    @pytest.fixture
+    def signed_in(self, auth):
+        """The auth fixture with a live in-memory token."""
+        auth._token = rapp_auth.TokenResponse(scope="", **TOKEN_DATA)
+        auth._current_user = USER
+        auth._token_valid_until = float("inf")
+        return auth
+
+    def test_header_mapping_reused_per_token(self):
+        """Test the header mapping is built once per token."""
+        assert rapp_auth._build_headers("t") is rapp_auth._build_headers("t")
+        assert rapp_auth._build_headers("t") is not rapp_auth._build_headers("u")
+
+    def test_headers_are_a_private_copy(self, signed_in):
+        """Test callers can extend the headers without affecting later calls."""
+        headers = signed_in.get_auth_headers()
+        headers["X-Extra"] = "1"
+        headers.update({"Authorization": "changed"})
+
+        assert signed_in.get_auth_headers() == {
+            "Authorization": "Bearer access",
+            "X-RAPP-Client": "desktop",
+            "X-RAPP-Version": "1.0.0",
+        }
+
+    def test_logout_forgets_cached_headers(self, signed_in):
+        """Test logout drops headers cached for the old token."""
+        signed_in.get_auth_headers()
+        assert rapp_auth._build_headers.cache_info().currsize
+
+        signed_in.logout()
+        assert rapp_auth._build_headers.cache_info().currsize == 0
+        with pytest.raises(AuthError):
+            signed_in.get_auth_headers()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
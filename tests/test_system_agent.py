@@ -9,14 +9,32 @@ import os
 import sys
 import json
 import pytest
-import tempfile
 from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
 import subprocess
 
-# Add rapp_os to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os" / "agents"))
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os"))
+from system_agent import SystemAgent, FileAgent, BasicAgent
+
+# Stand-ins for subprocess.CompletedProcess; cheaper than a MagicMock per test
+_OK = SimpleNamespace(returncode=0, stdout="", stderr="")
+
+
+def _ok(**kwargs):
+    """A successful CompletedProcess stand-in with the given fields overridden."""
+    return SimpleNamespace(**{**vars(_OK), **kwargs})
+
+
+def _record_run(monkeypatch, result=_OK):
+    """Replace subprocess.run with a stub returning `result`; returns its (argv, kwargs) calls."""
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append((cmd, kwargs))
+        return result
+
+    monkeypatch.setattr("subprocess.run", run)
+    return calls
 
 
 class TestSystemAgent:
@@ -24,17 +42,17 @@ class TestSystemAgent:
 
     def test_agent_initialization(self):
         """Test SystemAgent initializes correctly."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         assert agent.name == "System"
         assert "description" in agent.metadata
         assert "parameters" in agent.metadata
 
+    def test_metadata_shared_across_instances(self):
+        """Test instances share the class-level metadata dict."""
+        assert SystemAgent().metadata is SystemAgent().metadata
+
     def test_function_definition(self):
         """Test get_function_definition returns valid schema."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         func_def = agent.get_function_definition()
 
@@ -45,81 +63,265 @@ class TestSystemAgent:
 
     def test_unknown_action(self):
         """Test handling of unknown action."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         result = agent.perform(action="unknown_action")
         assert "Unknown action" in result
 
-    @patch('subprocess.run')
-    def test_open_app_macos(self, mock_run):
-        """Test opening an application on macOS."""
-        from system_agent import SystemAgent
-
-        mock_run.return_value = MagicMock(returncode=0)
-
-        with patch('sys.platform', 'darwin'):
-            agent = SystemAgent()
-            result = agent.perform(action="open_app", app_name="Safari")
+    @pytest.mark.parametrize("action,kwargs,result,argv,expect", [
+        ("open_app", {"app_name": "Safari"}, _OK, ["/usr/bin/open", "-a", "Safari"], "Opened Safari"),
+        ("clipboard_write", {"text": "Copy this"}, _OK, ["/usr/bin/pbcopy"], "Copied to clipboard"),
+        ("run_shortcut", {"shortcut_name": "My Shortcut"}, _ok(stdout="Success"),
+         ["/usr/bin/shortcuts", "run", "My Shortcut"], "Ran shortcut"),
+    ])
+    def test_macos_actions(self, monkeypatch, action, kwargs, result, argv, expect):
+        """Test macOS actions run the expected command once, with fds left open."""
+        calls = _record_run(monkeypatch, result)
+        monkeypatch.setattr("system_agent._IS_MACOS", True)
+        monkeypatch.setattr("system_agent._pasteboard", lambda: None)
+
+        output = SystemAgent().perform(action=action, **kwargs)
+
+        assert [cmd for cmd, _ in calls] == [argv]
+        assert calls[0][1]["close_fds"] is False
+        assert expect in output
+
+    def test_perform_results_cached(self):
+        """Test read-only actions are served from the result cache."""
+        agent = SystemAgent()
+        with patch.object(agent, '_list_chats', return_value="Chats") as mock_chats:
+            agent.perform(action="list_chats")
+            agent.perform(action="list_chats")
+        mock_chats.assert_called_once()
 
-            mock_run.assert_called_with(["open", "-a", "Safari"], check=True)
-            assert "Opened Safari" in result
+    def test_clipboard_write_invalidates_read(self):
+        """Test clipboard_write drops the cached clipboard_read result."""
+        agent = SystemAgent()
+        with patch.object(agent, '_clipboard_read', side_effect=["old", "new"]), \
+                patch.object(agent, '_clipboard_write', return_value="ok"):
+            assert agent.perform(action="clipboard_read") == "old"
+            assert agent.perform(action="clipboard_read") == "old"
+            agent.perform(action="clipboard_write", text="new")
+            assert agent.perform(action="clipboard_read") == "new"
 
     def test_open_app_missing_name(self):
         """Test open_app requires app_name."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         result = agent.perform(action="open_app")
         assert "Error" in result
         assert "app_name required" in result
 
-    @patch('subprocess.run')
-    def test_send_notification_macos(self, mock_run):
+    def test_send_notification_macos(self, monkeypatch, tmp_path):
         """Test sending notification on macOS."""
-        from system_agent import SystemAgent
+        calls = _record_run(monkeypatch)
+        monkeypatch.setattr("system_agent._IS_MACOS", True)
+        monkeypatch.setattr("system_agent.CACHE_DIR", tmp_path)
 
-        with patch('sys.platform', 'darwin'):
-            agent = SystemAgent()
+        agent = SystemAgent()
+        with patch.object(agent._daemon, 'run', side_effect=OSError):
             result = agent.perform(
                 action="notify",
                 title="Test Title",
                 message="Test message"
             )
 
-            mock_run.assert_called_once()
+        # Compiled once, then run with the text passed as argv
+        assert calls[0][0][:2] == ["/usr/bin/osacompile", "-o"]
+        assert calls[-1] == (
+            ["/usr/bin/osascript", str(tmp_path / "notify.scpt"), "Test Title", "Test message"],
+            dict(stdin=subprocess.DEVNULL, capture_output=True, text=True, close_fds=False)
+        )
+        assert "Notification sent" in result
+
+    def test_send_notification_uses_daemon(self, tmp_path):
+        """Test notifications are piped through the shared osascript coprocess."""
+        script = tmp_path / "notify.scpt"
+
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', return_value=script), \
+                    patch.object(agent._daemon, 'run', return_value="") as mock_daemon, \
+                    patch('subprocess.run') as mock_run:
+                result = agent.perform(action="notify", title='Say "hi"', message="There")
+
+            mock_daemon.assert_called_once_with(
+                f'run script (POSIX file "{script}") with parameters {{"Say \\"hi\\"", "There"}}'
+            )
+            mock_run.assert_not_called()
             assert "Notification sent" in result
 
-    @patch('subprocess.run')
-    def test_clipboard_read_macos(self, mock_run):
-        """Test reading clipboard on macOS."""
-        from system_agent import SystemAgent
+    def test_compiled_script_reused(self, tmp_path):
+        """Test templates are compiled once and then reused."""
+        with patch('system_agent.CACHE_DIR', tmp_path), \
+                patch('subprocess.run', return_value=_OK) as mock_run:
+            agent = SystemAgent()
+            first = agent._compiled_script("notify")
+            second = agent._compiled_script("notify")
+
+        assert first == second == tmp_path / "notify.scpt"
+        assert (tmp_path / "notify.applescript").exists()
+        mock_run.assert_called_once()
+
+    def test_send_imessage_failure(self):
+        """Test AppleScript errors are reported for iMessage sends."""
+        from system_agent import AppleScriptError
+
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', return_value=Path("send_imessage.scpt")), \
+                    patch.object(agent._daemon, 'run', side_effect=AppleScriptError("boom (-1728)")):
+                result = agent.perform(action="send_imessage", recipient="+15551234567", message="Hi")
+
+            assert "Failed to send iMessage" in result
+
+    def test_batch_sends_in_one_round_trip(self, tmp_path):
+        """Test queued notifications and iMessages flush as one coprocess write."""
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', side_effect=lambda name: tmp_path / f"{name}.scpt"), \
+                    patch.object(agent._daemon, 'run', return_value="") as mock_daemon:
+                with agent.batch():
+                    assert "queued" in agent.perform(action="notify", title="A", message="1")
+                    with agent.batch():
+                        agent.perform(action="send_imessage", recipient="+15551234567", message="2")
+                    mock_daemon.assert_not_called()
+
+            mock_daemon.assert_called_once()
+            lines = mock_daemon.call_args[0][0].splitlines()
+            assert len(lines) == 2
+            assert "notify.scpt" in lines[0]
+            assert "send_imessage.scpt" in lines[1]
+
+    def test_batch_discarded_on_error(self, tmp_path):
+        """Test a failing batch block sends nothing."""
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent._daemon, 'run') as mock_daemon:
+                with pytest.raises(RuntimeError):
+                    with agent.batch():
+                        agent.perform(action="notify", title="A", message="1")
+                        raise RuntimeError("abort")
 
-        mock_run.return_value = MagicMock(stdout="Clipboard content")
+            mock_daemon.assert_not_called()
 
-        with patch('sys.platform', 'darwin'):
+    def test_batch_flush_error_raised_on_exit(self, tmp_path):
+        """Test a delivery failure at flush time is raised from the with statement."""
+        from system_agent import AppleScriptError
+
+        with patch('system_agent._IS_MACOS', True):
             agent = SystemAgent()
-            result = agent.perform(action="clipboard_read")
+            with patch.object(agent, '_compiled_script', side_effect=lambda name: tmp_path / f"{name}.scpt"), \
+                    patch.object(agent._daemon, 'run', side_effect=AppleScriptError("boom (-1728)")):
+                with pytest.raises(AppleScriptError):
+                    with agent.batch():
+                        assert "queued" in agent.perform(action="notify", title="A", message="1")
+
+    def test_batch_fallback_attempts_every_item(self, tmp_path):
+        """Test the one-shot fallback runs every queued script and reports all failures."""
+        from system_agent import AppleScriptError
 
-            mock_run.assert_called_with(["pbpaste"], capture_output=True, text=True)
-            assert "Clipboard content" in result
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', side_effect=lambda name: tmp_path / f"{name}.scpt"), \
+                    patch.object(agent._daemon, 'run', side_effect=OSError), \
+                    patch.object(agent, '_run_script_argv',
+                                 side_effect=[AppleScriptError("first"), "", AppleScriptError("third")]) as mock_argv:
+                with pytest.raises(AppleScriptError, match="2 of 3") as excinfo:
+                    with agent.batch():
+                        for i in range(3):
+                            agent.perform(action="notify", title="A", message=str(i))
+
+            assert [c[0][1] for c in mock_argv.call_args_list] == [("A", "0"), ("A", "1"), ("A", "2")]
+            assert "first" in str(excinfo.value) and "third" in str(excinfo.value)
+
+    def test_nested_batch_discarded_on_error(self, tmp_path):
+        """Test a raising nested block drops only the scripts it queued."""
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', side_effect=lambda name: tmp_path / f"{name}.scpt"), \
+                    patch.object(agent._daemon, 'run', return_value="") as mock_daemon:
+                with agent.batch():
+                    agent.perform(action="notify", title="A", message="kept")
+                    try:
+                        with agent.batch():
+                            agent.perform(action="send_imessage", recipient="+15551234567", message="dropped")
+                            raise RuntimeError("abort")
+                    except RuntimeError:
+                        pass
+
+            lines = mock_daemon.call_args[0][0].splitlines()
+            assert len(lines) == 1
+            assert '"kept"' in lines[0]
+
+    @pytest.mark.parametrize("output", [
+        # osascript -i: prompt, then the result echoed as a source literal
+        '? => "\u2402chat1\u241fchat2\u241eFam\\"ly\\" error (12)\u241fmissing value\u2403"',
+        # one-shot osascript: the plain value
+        '\u2402chat1\u241fchat2\u241eFam"ly" error (12)\u241fmissing value\u2403',
+    ])
+    def test_list_chats_parses_batched_result(self, output):
+        """Test list_chats cuts the framed, delimited result out of osascript output."""
+        with patch('system_agent._IS_MACOS', True):
+            agent = SystemAgent()
+            with patch.object(agent, '_compiled_script', return_value=Path("list_chats.scpt")), \
+                    patch.object(agent._daemon, 'run', return_value=output) as mock_daemon:
+                result = agent.perform(action="list_chats")
 
-    @patch('subprocess.run')
-    def test_clipboard_write_macos(self, mock_run):
-        """Test writing to clipboard on macOS."""
-        from system_agent import SystemAgent
+            mock_daemon.assert_called_once()
+            assert result == 'Chats:\nFam"ly" error (12) (chat1)\nchat2 (chat2)'
 
-        with patch('sys.platform', 'darwin'):
+    def test_list_chats_unframed_output(self):
+        """Test output without the result frame is reported, not misparsed."""
+        with patch('system_agent._IS_MACOS', True):
             agent = SystemAgent()
-            result = agent.perform(action="clipboard_write", text="Copy this")
+            with patch.object(agent, '_compiled_script', return_value=Path("list_chats.scpt")), \
+                    patch.object(agent._daemon, 'run', return_value="? "):
+                result = agent.perform(action="list_chats")
+
+            assert result.startswith("Failed to list chats")
 
-            mock_run.assert_called_once()
-            assert "Copied to clipboard" in result
+    def test_clipboard_read_macos(self, monkeypatch):
+        """Test reading clipboard on macOS."""
+        mock_popen = MagicMock()
+        mock_popen.return_value.stdout.read.return_value = "Clipboard content"
+        monkeypatch.setattr("subprocess.Popen", mock_popen)
+        monkeypatch.setattr("system_agent._IS_MACOS", True)
+        monkeypatch.setattr("system_agent._pasteboard", lambda: None)
+
+        result = SystemAgent().perform(action="clipboard_read")
+
+        assert mock_popen.call_args[0][0] == ["/usr/bin/pbpaste"]
+        # Only the displayed prefix is read from the pipe
+        mock_popen.return_value.stdout.read.assert_called_once_with(1000)
+        assert "Clipboard content" in result
+
+    def test_clipboard_uses_pasteboard(self):
+        """Test clipboard goes through NSPasteboard when PyObjC is available."""
+        from system_agent import _pasteboard
+
+        pb = MagicMock()
+        pb.stringForType_.return_value = "x" * 2000
+        appkit = MagicMock(NSPasteboardTypeString="public.utf8-plain-text")
+        appkit.NSPasteboard.generalPasteboard.return_value = pb
+
+        _pasteboard.cache_clear()
+        try:
+            with patch.dict(sys.modules, {"AppKit": appkit}), \
+                    patch('system_agent._IS_MACOS', True), \
+                    patch('subprocess.run') as mock_run:
+                agent = SystemAgent()
+                write_result = agent.perform(action="clipboard_write", text="Copy this")
+                read_result = agent.perform(action="clipboard_read")
+        finally:
+            _pasteboard.cache_clear()
+
+        mock_run.assert_not_called()
+        pb.clearContents.assert_called_once()
+        pb.setString_forType_.assert_called_once_with("Copy this", "public.utf8-plain-text")
+        assert "Copied to clipboard" in write_result
+        assert read_result == "Clipboard contents:\n" + "x" * 1000
 
     def test_clipboard_write_missing_text(self):
         """Test clipboard_write requires text."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         result = agent.perform(action="clipboard_write")
         assert "Error" in result
@@ -127,8 +329,6 @@ class TestSystemAgent:
 
     def test_send_imessage_missing_params(self):
         """Test send_imessage requires recipient and message."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
 
         result = agent.perform(action="send_imessage")
@@ -137,24 +337,8 @@ class TestSystemAgent:
         result = agent.perform(action="send_imessage", recipient="+15551234567")
         assert "Error" in result
 
-    @patch('subprocess.run')
-    def test_run_shortcut_macos(self, mock_run):
-        """Test running a Shortcuts app shortcut."""
-        from system_agent import SystemAgent
-
-        mock_run.return_value = MagicMock(returncode=0, stdout="Success")
-
-        with patch('sys.platform', 'darwin'):
-            agent = SystemAgent()
-            result = agent.perform(action="run_shortcut", shortcut_name="My Shortcut")
-
-            mock_run.assert_called_once()
-            assert "Ran shortcut" in result
-
     def test_run_shortcut_missing_name(self):
         """Test run_shortcut requires shortcut_name."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         result = agent.perform(action="run_shortcut")
         assert "Error" in result
@@ -162,8 +346,6 @@ class TestSystemAgent:
 
     def test_get_system_info(self):
         """Test getting system information."""
-        from system_agent import SystemAgent
-
         agent = SystemAgent()
         result = agent.perform(action="get_info")
 
@@ -174,22 +356,118 @@ class TestSystemAgent:
         assert "user" in info
         assert "home" in info
 
+    def test_get_system_info_cached(self):
+        """Test system info is memoized within the same second."""
+        from system_agent import _system_info_json
+
+        _system_info_json.cache_clear()
+        agent = SystemAgent()
+        with patch('time.monotonic', return_value=100.0):
+            first = agent._get_system_info()
+            second = agent._get_system_info()
+
+        assert first is second
+        assert _system_info_json.cache_info().hits == 1
+
+    def test_macos_version_without_subprocess(self):
+        """Test the macOS version is read in-process."""
+        from system_agent import _macos_version
+
+        _macos_version.cache_clear()
+        try:
+            with patch('platform.mac_ver', return_value=("14.5", ("", "", ""), "arm64")), \
+                    patch('subprocess.run') as mock_run:
+                assert _macos_version() == "14.5"
+            mock_run.assert_not_called()
+        finally:
+            _macos_version.cache_clear()
+
+
+class TestAppleScriptDaemon:
+    """Tests for the persistent osascript coprocess."""
+
+    def _fake_popen(self, output):
+        proc = MagicMock()
+        proc.poll.return_value = None
+        proc.stdout = iter(output)
+        return proc
+
+    def test_run_reads_until_sentinel(self):
+        """Test output is collected up to the sentinel line."""
+        from system_agent import _AppleScriptDaemon, _SENTINEL
+
+        proc = self._fake_popen(["hello\n", f'"{_SENTINEL}"\n'])
+        with patch('subprocess.Popen', return_value=proc) as mock_popen:
+            daemon = _AppleScriptDaemon()
+            assert daemon.run('return "hello"') == "hello"
+
+        mock_popen.assert_called_once()
+        assert mock_popen.call_args[0][0] == ["/usr/bin/osascript", "-i"]
+        proc.stdin.write.assert_called_once_with(f'return "hello"\nreturn "{_SENTINEL}"\n')
+
+    def test_run_raises_on_script_error(self):
+        """Test AppleScript error output raises AppleScriptError."""
+        from system_agent import _AppleScriptDaemon, _SENTINEL, AppleScriptError
+
+        proc = self._fake_popen(["error: Can't get participant. (-1728)\n", f'"{_SENTINEL}"\n'])
+        with patch('subprocess.Popen', return_value=proc):
+            daemon = _AppleScriptDaemon()
+            with pytest.raises(AppleScriptError):
+                daemon.run('send "x" to participant "y"')
+
+    def test_echoed_result_is_not_an_error(self):
+        """Test a result line that merely ends like an error is returned."""
+        from system_agent import _AppleScriptDaemon, _SENTINEL
+
+        proc = self._fake_popen(['=> "Book club error (12)"\n', f'"{_SENTINEL}"\n'])
+        with patch('subprocess.Popen', return_value=proc):
+            daemon = _AppleScriptDaemon()
+            assert daemon.run('return "Book club error (12)"') == '=> "Book club error (12)"'
+
+
+class TestAppleScriptLiteral:
+    """Tests for AppleScript string quoting."""
+
+    def test_escapes_quotes_and_backslashes(self):
+        """Test quotes and backslashes cannot terminate the literal."""
+        from system_agent import _as_literal
+
+        assert _as_literal('say "hi" \\ bye') == '"say \\"hi\\" \\\\ bye"'
+
+    def test_run_script_prefix_cached(self):
+        """Test the run script clause is built once per compiled template."""
+        from system_agent import _run_script_prefix
+
+        path = Path("/tmp/notify.scpt")
+        assert _run_script_prefix(path) == 'run script (POSIX file "/tmp/notify.scpt")'
+        assert _run_script_prefix(path) is _run_script_prefix(path)
+
+    def test_escapes_line_breaks(self):
+        """Test line breaks are escaped so statements stay on one line."""
+        from system_agent import _as_literal
+
+        literal = _as_literal("line1\nline2\rline3")
+        assert "\n" not in literal and "\r" not in literal
+        assert literal == '"line1\\nline2\\rline3"'
+
 
 class TestFileAgent:
     """Tests for FileAgent class."""
 
+    @pytest.fixture(autouse=True)
+    def isolated_cache(self, tmp_path_factory):
+        """Keep the listing index out of the real ~/.rapp."""
+        with patch('system_agent.CACHE_DIR', tmp_path_factory.mktemp("cache")):
+            yield
+
     def test_agent_initialization(self):
         """Test FileAgent initializes correctly."""
-        from system_agent import FileAgent
-
         agent = FileAgent()
         assert agent.name == "Files"
         assert "description" in agent.metadata
 
     def test_function_definition(self):
         """Test get_function_definition returns valid schema."""
-        from system_agent import FileAgent
-
         agent = FileAgent()
         func_def = agent.get_function_definition()
 
@@ -198,8 +476,6 @@ class TestFileAgent:
 
     def test_path_required(self):
         """Test that path is required for all actions."""
-        from system_agent import FileAgent
-
         agent = FileAgent()
         result = agent.perform(action="read")
         assert "Error" in result
@@ -207,17 +483,25 @@ class TestFileAgent:
 
     def test_security_outside_home(self):
         """Test that access outside home directory is denied."""
-        from system_agent import FileAgent
-
         agent = FileAgent()
         result = agent.perform(action="read", path="/etc/passwd")
         assert "Error" in result
         assert "Access denied" in result
 
+    def test_security_sibling_prefix(self, tmp_path):
+        """Test a sibling directory sharing the home prefix is denied."""
+        home = tmp_path / "home"
+        home.mkdir()
+        sibling = tmp_path / "home_other"
+        sibling.mkdir()
+
+        with patch.object(Path, 'home', return_value=home):
+            agent = FileAgent()
+            result = agent.perform(action="list", path=str(sibling))
+            assert "Access denied" in result
+
     def test_read_file(self, tmp_path):
         """Test reading a file."""
-        from system_agent import FileAgent
-
         # Create test file in home directory subdirectory
         test_file = tmp_path / "test.txt"
         test_file.write_text("Test content")
@@ -227,10 +511,18 @@ class TestFileAgent:
             result = agent.perform(action="read", path=str(test_file))
             assert "Test content" in result
 
+    def test_read_file_truncated(self, tmp_path):
+        """Test large files are truncated to the read limit."""
+        test_file = tmp_path / "big.txt"
+        test_file.write_text("a" * 6000)
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent):
+            agent = FileAgent()
+            result = agent.perform(action="read", path=str(test_file))
+            assert result == "Contents of big.txt:\n" + "a" * 5000
+
     def test_read_nonexistent_file(self, tmp_path):
         """Test reading a file that doesn't exist."""
-        from system_agent import FileAgent
-
         with patch.object(Path, 'home', return_value=tmp_path):
             agent = FileAgent()
             result = agent.perform(action="read", path=str(tmp_path / "nonexistent.txt"))
@@ -238,8 +530,6 @@ class TestFileAgent:
 
     def test_write_file(self, tmp_path):
         """Test writing a file."""
-        from system_agent import FileAgent
-
         test_file = tmp_path / "new_file.txt"
 
         with patch.object(Path, 'home', return_value=tmp_path.parent):
@@ -253,10 +543,22 @@ class TestFileAgent:
             assert "Written to" in result
             assert test_file.read_text() == "New content"
 
+    def test_write_large_file(self, tmp_path):
+        """Test large writes go through the chunked writev path intact."""
+        test_file = tmp_path / "large.txt"
+        content = "".join(f"line {i} \u00e9\n" for i in range(60000))
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent), \
+                patch('system_agent.os.writev', wraps=os.writev) as mock_writev:
+            agent = FileAgent()
+            result = agent.perform(action="write", path=str(test_file), content=content)
+
+        assert "Written to" in result
+        assert test_file.read_text() == content
+        assert mock_writev.called
+
     def test_write_file_missing_content(self, tmp_path):
         """Test write requires content."""
-        from system_agent import FileAgent
-
         with patch.object(Path, 'home', return_value=tmp_path):
             agent = FileAgent()
             result = agent.perform(action="write", path=str(tmp_path / "file.txt"))
@@ -265,8 +567,6 @@ class TestFileAgent:
 
     def test_list_directory(self, tmp_path):
         """Test listing a directory."""
-        from system_agent import FileAgent
-
         # Create some files
         (tmp_path / "file1.txt").touch()
         (tmp_path / "file2.txt").touch()
@@ -281,10 +581,70 @@ class TestFileAgent:
             assert "file1.txt" in result
             assert "subdir" in result
 
+    def test_list_directory_limit(self, tmp_path):
+        """Test listing returns the first 50 entries in name order."""
+        for i in range(60):
+            (tmp_path / f"file{i:02d}.txt").touch()
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent):
+            agent = FileAgent()
+            result = agent.perform(action="list", path=str(tmp_path))
+
+            lines = result.splitlines()[1:]
+            assert len(lines) == 50
+            assert lines[0] == "[FILE] file00.txt"
+            assert lines[-1] == "[FILE] file49.txt"
+
+    def test_list_directory_served_from_index(self, tmp_path):
+        """Test unchanged directories are listed from the index without rescanning."""
+        (tmp_path / "a.txt").touch()
+        (tmp_path / "sub").mkdir()
+        old = 1_000_000_000
+        os.utime(tmp_path, ns=(old, old))
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent):
+            agent = FileAgent()
+            first = agent.perform(action="list", path=str(tmp_path))
+            with patch('system_agent.os.scandir', side_effect=AssertionError("rescanned")):
+                second = agent.perform(action="list", path=str(tmp_path))
+
+        assert first == second
+        assert "[DIR] sub" in second
+
+    def test_write_invalidates_index(self, tmp_path):
+        """Test files written by the agent show up in the next listing."""
+        (tmp_path / "a.txt").touch()
+        old = 1_000_000_000
+        os.utime(tmp_path, ns=(old, old))
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent):
+            agent = FileAgent()
+            agent.perform(action="list", path=str(tmp_path))
+            agent.perform(action="write", path=str(tmp_path / "b.txt"), content="new")
+            os.utime(tmp_path, ns=(old, old))  # Hide the mtime change
+            result = agent.perform(action="list", path=str(tmp_path))
+
+        assert "b.txt" in result
+
+    def test_outside_changes_visible(self, tmp_path):
+        """Test files changed or deleted behind the agent's back are re-read at once."""
+        test_file = tmp_path / "file.txt"
+        test_file.write_text("before")
+
+        with patch.object(Path, 'home', return_value=tmp_path.parent):
+            agent = FileAgent()
+            assert "before" in agent.perform(action="read", path=str(test_file))
+            assert "True" in agent.perform(action="exists", path=str(test_file))
+
+            test_file.write_text("after, from an editor")
+            assert "after" in agent.perform(action="read", path=str(test_file))
+
+            test_file.unlink()
+            assert "not found" in agent.perform(action="read", path=str(test_file))
+            assert "False" in agent.perform(action="exists", path=str(test_file))
+
     def test_exists_true(self, tmp_path):
         """Test exists returns true for existing file."""
-        from system_agent import FileAgent
-
         test_file = tmp_path / "exists.txt"
         test_file.touch()
 
@@ -295,8 +655,6 @@ class TestFileAgent:
 
     def test_exists_false(self, tmp_path):
         """Test exists returns false for non-existing file."""
-        from system_agent import FileAgent
-
         with patch.object(Path, 'home', return_value=tmp_path.parent):
             agent = FileAgent()
             result = agent.perform(
@@ -307,8 +665,6 @@ class TestFileAgent:
 
     def test_delete_file(self, tmp_path):
         """Test deleting a file."""
-        from system_agent import FileAgent
-
         test_file = tmp_path / "to_delete.txt"
         test_file.write_text("Delete me")
 
@@ -321,8 +677,6 @@ class TestFileAgent:
 
     def test_delete_directory_fails(self, tmp_path):
         """Test that deleting directories is not allowed."""
-        from system_agent import FileAgent
-
         test_dir = tmp_path / "dir_to_delete"
         test_dir.mkdir()
 
@@ -335,8 +689,6 @@ class TestFileAgent:
 
     def test_unknown_action(self, tmp_path):
         """Test handling of unknown action."""
-        from system_agent import FileAgent
-
         with patch.object(Path, 'home', return_value=tmp_path):
             agent = FileAgent()
             result = agent.perform(action="unknown", path=str(tmp_path))
@@ -348,8 +700,6 @@ class TestBasicAgent:
 
     def test_basic_agent_function_definition(self):
         """Test BasicAgent generates function definition."""
-        from system_agent import BasicAgent
-
         agent = BasicAgent("TestAgent", {
             "name": "TestAgent",
             "description": "Test description",
@@ -360,6 +710,11 @@ class TestBasicAgent:
         assert func_def["name"] == "TestAgent"
         assert func_def["description"] == "Test description"
 
+    def test_function_definition_cached(self):
+        """Test the function definition is built once and reused."""
+        agent = SystemAgent()
+        assert agent.get_function_definition() is agent.get_function_definition()
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
@@ -5,332 +5,377 @@ Tests for RAPP WhatsApp Bridge
 Run: pytest tests/test_whatsapp_bridge.py -v
 """
 
-import os
-import sys
 import json
 import pytest
-import tempfile
-from pathlib import Path
-from unittest.mock import Mock, patch, MagicMock
-from http.server import HTTPServer
-import threading
-import requests
-import time
+from io import BytesIO
+from unittest.mock import patch
 
-# Add rapp_os to path
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os" / "bridges"))
-sys.path.insert(0, str(Path(__file__).parent.parent / "rapp_os"))
+from whatsapp_bridge import WhatsAppBridge
+
+
+class _FakeConnection:
+    """A socket stand-in that feeds a raw request to a handler and records its reply."""
+
+    def __init__(self, raw: bytes):
+        self.rfile = BytesIO(raw)
+        self.sent = BytesIO()
+
+    def makefile(self, mode, *args, **kwargs):
+        return self.rfile
+
+    def sendall(self, data):
+        self.sent.write(data)
+
+    def settimeout(self, timeout):
+        pass
+
+
+def _handle(handler_cls, raw: bytes) -> bytes:
+    """Run a request handler over `raw` in-process and return the raw response."""
+    conn = _FakeConnection(raw)
+    handler_cls(conn, ("127.0.0.1", 0), None)
+    return conn.sent.getvalue()
+
+
+@pytest.fixture
+def bridge_factory(tmp_path, monkeypatch):
+    """Build bridges whose config file is tmp_path / "config.json"."""
+    import whatsapp_bridge
+
+    monkeypatch.setattr(whatsapp_bridge, "BRIDGE_CONFIG", tmp_path / "config.json")
+    return WhatsAppBridge
+
+
+@pytest.fixture(scope="class")
+def default_bridge(tmp_path_factory):
+    """One default-configured bridge, shared by a class's read-only tests."""
+    import whatsapp_bridge
+
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(whatsapp_bridge, "BRIDGE_CONFIG", tmp_path_factory.mktemp("cfg") / "config.json")
+        yield WhatsAppBridge()
+
+
+@pytest.fixture
+def capturing_bridge(bridge_factory, monkeypatch):
+    """Build bridges that record processor calls and never send replies."""
+    calls = []
+
+    def processor(**kwargs):
+        calls.append(kwargs)
+        return {"response": "OK"}
+
+    def make(**kwargs):
+        bridge = bridge_factory(**kwargs)
+        bridge.set_processor(processor)
+        monkeypatch.setattr(bridge, "send_message", lambda *args, **kw: True)
+        return bridge, calls
+
+    return make
 
 
 class TestWhatsAppBridgeInit:
     """Tests for WhatsAppBridge initialization."""
 
-    def test_default_initialization(self, tmp_path):
+    def test_default_initialization(self, default_bridge):
         """Test bridge initializes with defaults."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            assert bridge.webhook_port == 7072
-            assert bridge.prefix == ""
-            assert bridge.allowed_numbers == []
-            assert bridge.running is False
+        assert default_bridge.webhook_port == 7072
+        assert default_bridge.prefix == ""
+        assert default_bridge.allowed_numbers == []
+        assert default_bridge.running is False
 
-    def test_custom_initialization(self, tmp_path):
+    def test_custom_initialization(self, bridge_factory):
         """Test bridge with custom parameters."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(
-                phone_number_id="123456",
-                access_token="test_token",
-                verify_token="my_verify",
-                webhook_port=8080,
-                prefix="/rapp",
-                allowed_numbers=["+15551234567"]
-            )
-            assert bridge.phone_number_id == "123456"
-            assert bridge.verify_token == "my_verify"
-            assert bridge.webhook_port == 8080
-            assert bridge.prefix == "/rapp"
-            assert len(bridge.allowed_numbers) == 1
+        bridge = bridge_factory(
+            phone_number_id="123456",
+            access_token="test_token",
+            verify_token="my_verify",
+            webhook_port=8080,
+            prefix="/rapp",
+            allowed_numbers=["+15551234567"]
+        )
+        assert bridge.phone_number_id == "123456"
+        assert bridge.verify_token == "my_verify"
+        assert bridge.webhook_port == 8080
+        assert bridge.prefix == "/rapp"
+        assert len(bridge.allowed_numbers) == 1
 
 
 class TestAllowedNumbers:
     """Tests for phone number whitelist functionality."""
 
-    def test_add_allowed_number(self, tmp_path):
+    def test_add_allowed_number(self, bridge_factory):
         """Test adding a phone number to whitelist."""
-        from whatsapp_bridge import WhatsAppBridge
+        bridge = bridge_factory()
+        bridge.add_allowed_number("555-123-4567")
+        assert "+15551234567" in bridge.allowed_numbers
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            bridge.add_allowed_number("555-123-4567")
-            assert "+15551234567" in bridge.allowed_numbers
-
-    def test_add_number_with_plus(self, tmp_path):
+    def test_add_number_with_plus(self, bridge_factory):
         """Test adding number that already has + prefix."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            bridge.add_allowed_number("+15551234567")
-            assert "+15551234567" in bridge.allowed_numbers
+        bridge = bridge_factory()
+        bridge.add_allowed_number("+15551234567")
+        assert "+15551234567" in bridge.allowed_numbers
 
-    def test_is_allowed_empty_whitelist(self, tmp_path):
+    def test_is_allowed_empty_whitelist(self, bridge_factory):
         """Test that empty whitelist allows all."""
-        from whatsapp_bridge import WhatsAppBridge
+        bridge = bridge_factory()
+        assert bridge._is_allowed("+15559999999") is True
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            assert bridge._is_allowed("+15559999999") is True
-
-    def test_is_allowed_with_whitelist(self, tmp_path):
+    def test_is_allowed_with_whitelist(self, bridge_factory):
         """Test whitelist filtering."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(allowed_numbers=["+15551234567"])
-            assert bridge._is_allowed("+15551234567") is True
-            assert bridge._is_allowed("+15559999999") is False
+        bridge = bridge_factory(allowed_numbers=["+15551234567"])
+        assert bridge._is_allowed("+15551234567") is True
+        assert bridge._is_allowed("+15559999999") is False
 
-    def test_is_allowed_partial_match(self, tmp_path):
+    def test_is_allowed_partial_match(self, bridge_factory):
         """Test partial number matching (last 10 digits)."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(allowed_numbers=["+15551234567"])
-            # Different country code but same last 10 digits
-            assert bridge._is_allowed("5551234567") is True
+        bridge = bridge_factory(allowed_numbers=["+15551234567"])
+        # Different country code but same last 10 digits
+        assert bridge._is_allowed("5551234567") is True
+
+    def test_is_allowed_formatted_sender(self, bridge_factory):
+        """Test formatting characters are ignored when matching."""
+        bridge = bridge_factory(allowed_numbers=["+1 (555) 123-4567"])
+        assert bridge._is_allowed("+15551234567") is True
+        bridge.add_allowed_number("+44 20 7946 0958")
+        assert bridge._is_allowed("442079460958") is True
+
+    def test_is_allowed_short_number(self, bridge_factory):
+        """Test numbers under 10 digits match as a suffix of the sender."""
+        bridge = bridge_factory(allowed_numbers=["+15551234567", "72345"])
+        assert bridge._is_allowed("72345") is True
+        assert bridge._is_allowed("+4472345") is True
+        assert bridge._is_allowed("2345") is False
+        assert bridge._is_allowed("+15559999999") is False
 
 
 class TestConfigPersistence:
     """Tests for configuration save/load."""
 
-    def test_save_config(self, tmp_path):
+    def test_save_config(self, tmp_path, bridge_factory):
         """Test configuration is saved correctly."""
-        from whatsapp_bridge import WhatsAppBridge
-
         config_path = tmp_path / "config.json"
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', config_path):
-            bridge = WhatsAppBridge(
-                phone_number_id="123",
-                verify_token="verify123",
-                prefix="/cmd"
-            )
-            bridge._save_config()
-
-            assert config_path.exists()
-            saved = json.loads(config_path.read_text())
-            assert saved["phone_number_id"] == "123"
-            assert saved["verify_token"] == "verify123"
-            assert saved["prefix"] == "/cmd"
-
-    def test_load_config(self, tmp_path):
+        bridge = bridge_factory(
+            phone_number_id="123",
+            verify_token="verify123",
+            prefix="/cmd"
+        )
+        bridge._save_config()
+
+        assert config_path.exists()
+        with open(config_path, "rb") as f:
+            saved = json.load(f)
+        assert saved["phone_number_id"] == "123"
+        assert saved["verify_token"] == "verify123"
+        assert saved["prefix"] == "/cmd"
+
+    def test_load_config(self, tmp_path, bridge_factory):
         """Test configuration is loaded correctly."""
-        from whatsapp_bridge import WhatsAppBridge
-
         config_path = tmp_path / "config.json"
-        config_path.write_text(json.dumps({
+        config_path.write_bytes(json.dumps({
             "phone_number_id": "loaded_id",
             "verify_token": "loaded_verify",
             "webhook_port": 9000,
             "prefix": "/test",
             "allowed_numbers": ["+15551111111"]
-        }))
+        }).encode())
+
+        bridge = bridge_factory()
+        assert bridge.phone_number_id == "loaded_id"
+        assert bridge.verify_token == "loaded_verify"
+        assert bridge.webhook_port == 9000
+        assert bridge.prefix == "/test"
+        assert "+15551111111" in bridge.allowed_numbers
+
+    def test_save_config_keeps_secrets_on_disk(self, tmp_path, bridge_factory):
+        """Test rewriting the config keeps the setup-written secrets."""
+        config_path = tmp_path / "config.json"
+        config_path.write_bytes(json.dumps({
+            "access_token": "token", "app_secret": "secret"
+        }).encode())
+
+        bridge_factory(prefix="/cmd")._save_config()
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', config_path):
-            bridge = WhatsAppBridge()
-            assert bridge.phone_number_id == "loaded_id"
-            assert bridge.verify_token == "loaded_verify"
-            assert bridge.webhook_port == 9000
-            assert bridge.prefix == "/test"
-            assert "+15551111111" in bridge.allowed_numbers
+        saved = json.loads(config_path.read_bytes())
+        assert saved["prefix"] == "/cmd"
+        assert saved["access_token"] == "token"
+        assert bridge_factory().app_secret == "secret"
+
+    def test_save_config_skips_secrets_from_memory(self, tmp_path, bridge_factory):
+        """Test secrets passed in (or read from the environment) are not persisted."""
+        bridge_factory(app_secret="secret", access_token="token")._save_config()
+
+        saved = json.loads((tmp_path / "config.json").read_bytes())
+        assert "app_secret" not in saved
+        assert "access_token" not in saved
 
 
 class TestMessageSending:
     """Tests for sending WhatsApp messages."""
 
-    def test_send_message_no_credentials(self, tmp_path):
+    def test_send_message_no_credentials(self, bridge_factory):
         """Test send_message fails gracefully without credentials."""
-        from whatsapp_bridge import WhatsAppBridge
+        bridge = bridge_factory()
+        result = bridge.send_message("+15551234567", "Hello")
+        assert result is False
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            result = bridge.send_message("+15551234567", "Hello")
-            assert result is False
-
-    @patch('requests.post')
-    def test_send_message_success(self, mock_post, tmp_path):
+    @patch('requests.Session.post')
+    def test_send_message_success(self, mock_post, bridge_factory):
         """Test successful message sending."""
-        from whatsapp_bridge import WhatsAppBridge
-
         mock_post.return_value.status_code = 200
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(
-                phone_number_id="123456",
-                access_token="test_token"
-            )
-            result = bridge.send_message("+15551234567", "Hello")
-            assert result is True
-            mock_post.assert_called_once()
-
-    @patch('requests.post')
-    def test_send_message_truncation(self, mock_post, tmp_path):
-        """Test long messages are truncated."""
-        from whatsapp_bridge import WhatsAppBridge
+        bridge = bridge_factory(
+            phone_number_id="123456",
+            access_token="test_token"
+        )
+        result = bridge.send_message("+15551234567", "Hello")
+        assert result is True
+        mock_post.assert_called_once()
 
+    @patch('requests.Session.post')
+    def test_send_message_truncation(self, mock_post, bridge_factory):
+        """Test long messages are truncated."""
         mock_post.return_value.status_code = 200
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(
-                phone_number_id="123456",
-                access_token="test_token"
-            )
-            long_message = "x" * 5000
-            bridge.send_message("+15551234567", long_message)
+        bridge = bridge_factory(
+            phone_number_id="123456",
+            access_token="test_token"
+        )
+        long_message = "x" * 5000
+        bridge.send_message("+15551234567", long_message)
 
-            # Check the message was truncated
-            call_args = mock_post.call_args
-            sent_body = call_args[1]["json"]["text"]["body"]
-            assert len(sent_body) <= 4096
-            assert sent_body.endswith("...")
+        # Check the message was truncated
+        call_args = mock_post.call_args
+        sent_body = json.loads(call_args[1]["data"])["text"]["body"]
+        assert len(sent_body) <= 4096
+        assert sent_body.endswith("...")
 
 
 class TestMessageProcessing:
     """Tests for processing incoming messages."""
 
-    def test_process_message_blocked_number(self, tmp_path, caplog):
+    def test_process_message_blocked_number(self, capturing_bridge):
         """Test messages from non-whitelisted numbers are blocked."""
-        from whatsapp_bridge import WhatsAppBridge
+        bridge, calls = capturing_bridge(allowed_numbers=["+15551234567"])
+        bridge._process_incoming_message("+15559999999", "Hello")
+        assert calls == []
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(allowed_numbers=["+15551234567"])
-            bridge._process_incoming_message("+15559999999", "Hello")
-            # Should be blocked, no processing
-
-    def test_process_message_with_prefix(self, tmp_path):
+    def test_process_message_with_prefix(self, capturing_bridge):
         """Test message prefix filtering."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        callback_called = []
+        bridge, calls = capturing_bridge(prefix="/rapp")
 
-        def mock_callback(**kwargs):
-            callback_called.append(kwargs)
-            return {"response": "OK"}
+        # Message without prefix - should be ignored
+        bridge._process_incoming_message("+15551234567", "Hello")
+        assert len(calls) == 0
 
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(prefix="/rapp")
-            bridge.set_processor(mock_callback)
+        # Message with prefix - should be processed
+        bridge._process_incoming_message("+15551234567", "/rapp Hello")
+        assert len(calls) == 1
+        assert calls[0]["user_input"] == "Hello"
 
-            # Message without prefix - should be ignored
-            bridge._process_incoming_message("+15551234567", "Hello")
-            assert len(callback_called) == 0
-
-            # Message with prefix - should be processed
-            with patch.object(bridge, 'send_message', return_value=True):
-                bridge._process_incoming_message("+15551234567", "/rapp Hello")
-            assert len(callback_called) == 1
-            assert callback_called[0]["user_input"] == "Hello"
-
-    def test_process_message_extracts_command(self, tmp_path):
+    def test_process_message_extracts_command(self, capturing_bridge):
         """Test command extraction from message."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        received_input = []
-
-        def mock_callback(**kwargs):
-            received_input.append(kwargs.get("user_input"))
-            return {"response": "OK"}
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(prefix="/cmd")
-            bridge.set_processor(mock_callback)
-
-            with patch.object(bridge, 'send_message', return_value=True):
-                bridge._process_incoming_message("+15551234567", "/cmd what is the weather")
-
-            assert received_input[0] == "what is the weather"
+        bridge, calls = capturing_bridge(prefix="/cmd")
+        bridge._process_incoming_message("+15551234567", "/cmd what is the weather")
+        assert calls[0]["user_input"] == "what is the weather"
 
 
 class TestWebhookHandler:
     """Tests for webhook HTTP handler."""
 
-    def test_webhook_verification(self, tmp_path):
+    def test_webhook_verification(self, bridge_factory):
         """Test webhook verification endpoint."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge(verify_token="test_token", webhook_port=7999)
-
-            # Start server in thread
-            handler = bridge._create_webhook_handler()
-            server = HTTPServer(("127.0.0.1", 7999), handler)
-            thread = threading.Thread(target=server.handle_request)
-            thread.start()
-
-            time.sleep(0.1)
-
-            # Test verification
-            response = requests.get(
-                "http://127.0.0.1:7999/",
-                params={
-                    "hub.mode": "subscribe",
-                    "hub.verify_token": "test_token",
-                    "hub.challenge": "challenge123"
-                }
-            )
-
-            thread.join(timeout=2)
-            assert response.status_code == 200
-            assert response.text == "challenge123"
+        bridge = bridge_factory(verify_token="test_token")
+
+        response = _handle(bridge._create_webhook_handler(), (
+            b"GET /?hub.mode=subscribe&hub.verify_token=test_token&hub.challenge=challenge123 HTTP/1.1\r\n"
+            b"Host: localhost\r\n\r\n"
+        ))
+
+        assert response.startswith(b"HTTP/1.1 200 ")
+        assert response.endswith(b"\r\n\r\nchallenge123")
+
+    def test_webhook_message_dispatched_to_workers(self, bridge_factory):
+        """Test incoming text messages are handed to the worker threads."""
+        bridge = bridge_factory()
+
+        payload = json.dumps({"entry": [{"changes": [{"value": {"messages": [
+            {"type": "text", "from": "+15551234567", "text": {"body": "Hello"}}
+        ]}}]}]}).encode()
+
+        with patch.object(bridge, '_process_incoming_message') as mock_process:
+            bridge._start_workers()
+            response = _handle(bridge._create_webhook_handler(), (
+                b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload
+            ))
+            bridge._stop_workers(wait=True)
+
+        assert response.startswith(b"HTTP/1.1 200 ")
+        mock_process.assert_called_once_with("+15551234567", "Hello")
+
+    def test_verify_signature(self, bridge_factory):
+        """Test X-Hub-Signature-256 verification."""
+        import hmac
+        import hashlib
+
+        bridge = bridge_factory(app_secret="secret")
+
+        body = b'{"entry": []}'
+        good = "sha256=" + hmac.new(b"secret", body, hashlib.sha256).hexdigest()
+
+        assert bridge._verify_signature(body, good) is True
+        assert bridge._verify_signature(body + b" ", good) is False
+        assert bridge._verify_signature(body, "sha1=abc") is False
+        assert bridge._verify_signature(body, "") is False
+
+    @pytest.mark.parametrize("signature,status,queued", [
+        (None, 401, 0),
+        ("sha256=" + "0" * 64, 401, 0),
+        ("good", 200, 1),
+    ])
+    def test_webhook_rejects_bad_signature(self, bridge_factory, signature, status, queued):
+        """Test unsigned or mis-signed webhooks get 401 and nothing is queued."""
+        import hmac
+        import hashlib
+
+        bridge = bridge_factory(app_secret="secret")
+        payload = json.dumps({"entry": [{"changes": [{"value": {"messages": [
+            {"type": "text", "from": "+15551234567", "text": {"body": "Hello"}}
+        ]}}]}]}).encode()
+        if signature == "good":
+            signature = "sha256=" + hmac.new(b"secret", payload, hashlib.sha256).hexdigest()
+        header = b"" if signature is None else b"X-Hub-Signature-256: " + signature.encode() + b"\r\n"
+
+        response = _handle(bridge._create_webhook_handler(), (
+            b"POST / HTTP/1.1\r\nHost: localhost\r\n"
+            b"Content-Type: application/json\r\n" + header +
+            b"Content-Length: " + str(len(payload)).encode() + b"\r\n\r\n" + payload
+        ))
+
+        assert response.startswith(b"HTTP/1.1 %d " % status)
+        assert bridge._queue.qsize() == queued
 
 
 class TestUserGuidGeneration:
     """Tests for user GUID generation from phone numbers."""
 
-    def test_user_guid_format(self, tmp_path):
+    def test_user_guid_format(self, capturing_bridge):
         """Test user GUID is generated correctly from phone number."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        received_guids = []
-
-        def mock_callback(**kwargs):
-            received_guids.append(kwargs.get("user_guid"))
-            return {"response": "OK"}
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            bridge.set_processor(mock_callback)
-
-            with patch.object(bridge, 'send_message', return_value=True):
-                bridge._process_incoming_message("+15551234567", "Hello")
-
-            assert received_guids[0] == "whatsapp_15551234567"
+        bridge, calls = capturing_bridge()
+        bridge._process_incoming_message("+15551234567", "Hello")
+        assert calls[0]["user_guid"] == "whatsapp_15551234567"
 
 
 class TestContextGuid:
     """Tests for context GUID assignment."""
 
-    def test_whatsapp_context_guid(self, tmp_path):
+    def test_whatsapp_context_guid(self, capturing_bridge):
         """Test messages use 'whatsapp' context GUID."""
-        from whatsapp_bridge import WhatsAppBridge
-
-        received_context = []
-
-        def mock_callback(**kwargs):
-            received_context.append(kwargs.get("context_guid"))
-            return {"response": "OK"}
-
-        with patch('whatsapp_bridge.BRIDGE_CONFIG', tmp_path / "config.json"):
-            bridge = WhatsAppBridge()
-            bridge.set_processor(mock_callback)
-
-            with patch.object(bridge, 'send_message', return_value=True):
-                bridge._process_incoming_message("+15551234567", "Hello")
-
-            assert received_context[0] == "whatsapp"
+        bridge, calls = capturing_bridge()
+        bridge._process_incoming_message("+15551234567", "Hello")
+        assert calls[0]["context_guid"] == "whatsapp"
 
 
 if __name__ == "__main__":